@@ -0,0 +1,127 @@
+"""
+Registro de actividades de usuario, con escritura diferida opcional.
+
+Las búsquedas (por ID y por QR) registran una actividad en cada lectura.
+Con ACTIVIDADES_MODO = 'diferido' (el valor por omisión) las actividades
+se acumulan en memoria y un hilo en segundo plano las inserta con
+bulk_create cuando se alcanza ACTIVIDADES_BUFFER_TAMANO o cada
+ACTIVIDADES_BUFFER_INTERVALO segundos, de modo que la respuesta no espera
+la escritura en la base de datos. Solo entran al buffer cuando la
+transacción de la solicitud se confirma, y lo pendiente se inserta al
+terminar el proceso (atexit, que gunicorn y uvicorn ejecutan al apagarse
+de forma ordenada); solo se pierde si el proceso muere de golpe (SIGKILL).
+Con 'sincrono' se insertan en la misma solicitud.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from .models import ActividadUsuario
+
+logger = logging.getLogger(__name__)
+
+
+class RegistroActividades:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pendientes = []
+        self._hilo = None
+
+    def _despues_de_fork(self):
+        # El lock puede haber quedado tomado por un hilo del padre que no
+        # existe en el hijo: se crean de nuevo en lugar de heredarlos
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self._reiniciar()
+
+    @property
+    def diferido(self):
+        return getattr(settings, 'ACTIVIDADES_MODO', 'diferido') == 'diferido'
+
+    def registrar(self, **campos):
+        """Registra una actividad con los campos de ActividadUsuario indicados."""
+        self.registrar_lote([campos])
+
+    def registrar_lote(self, lista_campos):
+        """Registra varias actividades; en modo síncrono con un solo INSERT."""
+        actividades = [ActividadUsuario(**campos) for campos in lista_campos]
+        if not actividades:
+            return
+
+        if not self.diferido:
+            if len(actividades) == 1:
+                actividades[0].save()
+            else:
+                ActividadUsuario.objects.bulk_create(actividades)
+            return
+
+        # Las de una transacción que se deshace no se registran, y nunca se
+        # insertan antes que el paciente creado en la misma transacción
+        transaction.on_commit(lambda: self._encolar(actividades))
+
+    def _encolar(self, actividades):
+        with self._lock:
+            self._pendientes.extend(actividades)
+            pendientes = len(self._pendientes)
+            if self._hilo is None:
+                self._hilo = threading.Thread(
+                    target=self._trabajar, name='registro-actividades', daemon=True
+                )
+                self._hilo.start()
+
+        if pendientes >= getattr(settings, 'ACTIVIDADES_BUFFER_TAMANO', 50):
+            self._evento.set()
+
+    def vaciar(self):
+        """Inserta todas las actividades pendientes y devuelve cuántas se escribieron."""
+        with self._lock:
+            actividades, self._pendientes = self._pendientes, []
+        if not actividades:
+            return 0
+
+        try:
+            ActividadUsuario.objects.bulk_create(actividades)
+            return len(actividades)
+        except DatabaseError:
+            logger.exception('Falló la inserción en bloque de %d actividades', len(actividades))
+
+        # Se reintenta una por una para no perder el lote por un solo registro
+        # (por ejemplo, un paciente eliminado antes de vaciar el buffer)
+        escritas = 0
+        for actividad in actividades:
+            try:
+                actividad.save()
+                escritas += 1
+            except DatabaseError:
+                logger.exception('Se descartó la actividad de %s sobre el paciente %s',
+                                 actividad.usuario_id, actividad.paciente_id)
+        return escritas
+
+    def _trabajar(self):
+        while True:
+            self._evento.wait(getattr(settings, 'ACTIVIDADES_BUFFER_INTERVALO', 2.0))
+            self._evento.clear()
+            try:
+                self.vaciar()
+            except Exception:
+                logger.exception('Error al vaciar el buffer de actividades')
+            finally:
+                connection.close()
+
+
+registro_actividades = RegistroActividades()
+
+# Vaciar lo pendiente cuando el proceso termina
+atexit.register(registro_actividades.vaciar)
+
+if hasattr(os, 'register_at_fork'):
+    # El hilo no sobrevive al fork y lo pendiente pertenece al proceso padre
+    os.register_at_fork(after_in_child=registro_actividades._despues_de_fork)
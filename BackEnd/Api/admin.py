@@ -4,7 +4,12 @@ from django.contrib import admin
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import Perfil, Paciente, ActividadUsuario
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import Perfil, Paciente, ActividadUsuario, SegmentoActividades, EstadisticaDiaria, InformePerfil
 
 # Registramos el modelo Perfil
 @admin.register(Perfil)
@@ -68,4 +73,71 @@ class ActividadUsuarioAdmin(admin.ModelAdmin):
         # Hacer todos los campos de solo lectura si el objeto ya existe
         if obj:
             return self.readonly_fields + ('usuario', 'tipo_actividad', 'paciente', 'metodo_busqueda')
-        return self.readonly_fields
\ No newline at end of file
+        return self.readonly_fields
+
+# Registrar el catálogo de actividades archivadas (solo lectura)
+@admin.register(SegmentoActividades)
+class SegmentoActividadesAdmin(admin.ModelAdmin):
+    list_display = ('mes', 'archivo', 'filas', 'fecha_min', 'fecha_max')
+    readonly_fields = ('mes', 'archivo', 'filas', 'fecha_min', 'fecha_max')
+    
+    def has_add_permission(self, request):
+        return False
+
+# Registrar las estadísticas diarias de nacimientos (solo lectura; se recalculan
+# con el comando reconstruir_estadisticas)
+@admin.register(EstadisticaDiaria)
+class EstadisticaDiariaAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'nacimientos', 'masculinos', 'femeninos', 'dados_alta')
+    readonly_fields = ('fecha', 'nacimientos', 'masculinos', 'femeninos', 'dados_alta', 'suma_peso', 'suma_talla')
+    date_hierarchy = 'fecha'
+    
+    def has_add_permission(self, request):
+        return False
+
+# Registrar los informes de perfilado (solo lectura, con descarga del informe
+# en texto y de las estadísticas de cProfile)
+@admin.register(InformePerfil)
+class InformePerfilAdmin(admin.ModelAdmin):
+    list_display = ('fecha_hora', 'metodo', 'ruta', 'codigo_estado', 'duracion_ms', 'consultas', 'tiempo_bd_ms', 'usuario', 'descargas')
+    list_filter = ('metodo', 'codigo_estado')
+    search_fields = ('ruta', 'usuario__username')
+    exclude = ('estadisticas',)
+    readonly_fields = ('fecha_hora', 'usuario', 'metodo', 'ruta', 'codigo_estado', 'duracion_ms', 'consultas', 'tiempo_bd_ms', 'descargas', 'informe')
+    
+    # Extensión y tipo de contenido de cada descarga
+    FORMATOS = {
+        'txt': 'text/plain; charset=utf-8',
+        'prof': 'application/octet-stream',
+    }
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        return [
+            path('<int:pk>/descargar/<str:formato>/', self.admin_site.admin_view(self.descargar),
+                 name='Api_informeperfil_descargar'),
+        ] + super().get_urls()
+    
+    def descargar(self, request, pk, formato):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        if formato not in self.FORMATOS:
+            raise Http404
+        informe = get_object_or_404(InformePerfil, pk=pk)
+        contenido = informe.informe if formato == 'txt' else bytes(informe.estadisticas)
+        respuesta = HttpResponse(contenido, content_type=self.FORMATOS[formato])
+        respuesta['Content-Disposition'] = f'attachment; filename="perfil-{informe.pk}.{formato}"'
+        return respuesta
+    
+    def descargas(self, obj):
+        return format_html(
+            '<a href="{}">Informe</a> · <a href="{}">cProfile</a>',
+            reverse('admin:Api_informeperfil_descargar', args=[obj.pk, 'txt']),
+            reverse('admin:Api_informeperfil_descargar', args=[obj.pk, 'prof']),
+        )
+    descargas.short_description = 'Descargar'
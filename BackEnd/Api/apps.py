@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Api'
+
+    def ready(self):
+        # Conectar los receptores de señales definidos fuera de models.py
+        from . import autenticacion, busqueda, cache_qr, estadisticas, etags, metricas  # noqa: F401
@@ -0,0 +1,276 @@
+"""
+Archivo histórico de actividades de usuario.
+
+Las actividades más antiguas que ACTIVIDADES_RETENCION_DIAS se mueven de la
+tabla ActividadUsuario a segmentos mensuales JSONL comprimidos con gzip en
+ACTIVIDADES_ARCHIVO_DIR, de modo que la tabla activa se mantiene pequeña.
+Cada fila archivada guarda la representación de ActividadUsuarioSerializer,
+por lo que se puede devolver tal cual aunque el paciente cambie después.
+El modelo SegmentoActividades lleva el catálogo de meses archivados.
+
+Al leer, cada proceso guarda ya descomprimidos y ordenados los últimos
+ACTIVIDADES_ARCHIVO_CACHE_SEGMENTOS segmentos usados, mientras su archivo
+no cambie, y ArchivoPaginable solo lee los segmentos de la página pedida
+(para contar los demás alcanza con el catálogo si no hay más filtros).
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import ActividadUsuario, SegmentoActividades
+from .serializers import ActividadUsuarioSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def directorio_archivo():
+    return Path(getattr(settings, 'ACTIVIDADES_ARCHIVO_DIR', Path(settings.BASE_DIR) / 'archivo_actividades'))
+
+
+def fecha_corte(dias=None):
+    """Fecha y hora antes de la cual las actividades se archivan."""
+    if dias is None:
+        dias = getattr(settings, 'ACTIVIDADES_RETENCION_DIAS', 365)
+    return timezone.now() - timedelta(days=dias)
+
+
+def archivar(antes_de, tamano_lote=1000, pausa=0.0, al_avanzar=None):
+    """
+    Archiva por lotes las actividades anteriores a `antes_de` y devuelve
+    cuántas se movieron.
+
+    Cada lote se escribe primero en su segmento (con fsync) y después se
+    borra de la tabla en una transacción corta, así nunca se mantiene un
+    bloqueo de escritura largo. Si el proceso se interrumpe entre ambos
+    pasos el lote queda duplicado en el archivo; la lectura lo descarta.
+    """
+    directorio = directorio_archivo()
+    directorio.mkdir(parents=True, exist_ok=True)
+    total = 0
+
+    while True:
+        lote = list(
+            ActividadUsuario.objects
+            .filter(fecha_hora__lt=antes_de)
+            .select_related('usuario__perfil', 'paciente')
+            .order_by('fecha_hora', 'id')[:tamano_lote]
+        )
+        if not lote:
+            break
+
+        filas_por_mes = {}
+        for actividad, fila in zip(lote, ActividadUsuarioSerializer(lote, many=True).data):
+            mes = timezone.localtime(actividad.fecha_hora).date().replace(day=1)
+            filas_por_mes.setdefault(mes, []).append((actividad.fecha_hora, fila))
+
+        for mes, filas in filas_por_mes.items():
+            _escribir_segmento(directorio / _nombre_segmento(mes), [fila for _, fila in filas])
+
+        with transaction.atomic():
+            for mes, filas in filas_por_mes.items():
+                _actualizar_catalogo(mes, filas)
+            ActividadUsuario.objects.filter(id__in=[actividad.id for actividad in lote]).delete()
+
+        total += len(lote)
+        if al_avanzar:
+            al_avanzar(total)
+        if pausa:
+            time.sleep(pausa)
+
+    return total
+
+
+def _segmentos_en_rango(desde=None, hasta=None):
+    segmentos = SegmentoActividades.objects.all()
+    if desde:
+        segmentos = segmentos.filter(fecha_max__gte=desde)
+    if hasta:
+        segmentos = segmentos.filter(fecha_min__lt=hasta)
+    return segmentos
+
+
+# Segmentos leídos por este proceso: ruta -> ((tamaño, mtime), filas)
+_segmentos_leidos = OrderedDict()
+_lock_segmentos = threading.Lock()
+
+
+def filas_segmento(segmento):
+    """
+    Filas del segmento sin duplicados, de la más reciente a la más antigua,
+    como pares (fecha_hora, fila). Se leen del disco solo si el archivo
+    cambió desde la última lectura; las filas se comparten entre
+    solicitudes y no deben modificarse.
+    """
+    ruta = directorio_archivo() / segmento.archivo
+    try:
+        estado = ruta.stat()
+        firma = (estado.st_size, estado.st_mtime_ns)
+    except FileNotFoundError:
+        firma = None
+    with _lock_segmentos:
+        guardado = _segmentos_leidos.get(ruta)
+        if guardado is not None and guardado[0] == firma:
+            _segmentos_leidos.move_to_end(ruta)
+            return guardado[1]
+
+    filas = {}
+    for fila in _leer_segmento(ruta):
+        filas[fila['id']] = (parse_datetime(fila['fecha_hora']), fila)
+    ordenadas = sorted(filas.values(), key=lambda par: (par[0], par[1]['id']), reverse=True)
+
+    with _lock_segmentos:
+        _segmentos_leidos[ruta] = (firma, ordenadas)
+        _segmentos_leidos.move_to_end(ruta)
+        while len(_segmentos_leidos) > getattr(settings, 'ACTIVIDADES_ARCHIVO_CACHE_SEGMENTOS', 12):
+            _segmentos_leidos.popitem(last=False)
+    return ordenadas
+
+
+class ArchivoPaginable:
+    """
+    Actividades archivadas con fecha_hora en [desde, hasta) que cumplen
+    `filtro` (una función que recibe la fila), de la más reciente a la más
+    antigua, como secuencia que se puede contar, cortar y recorrer. Un
+    segmento se lee para contar solo si el filtro o un borde del rango lo
+    exigen, y para cortar solo si cae en la rebanada pedida.
+    """
+    def __init__(self, desde=None, hasta=None, filtro=None):
+        self.desde, self.hasta, self.filtro = desde, hasta, filtro
+        self.segmentos = list(_segmentos_en_rango(desde, hasta).order_by('-mes'))
+        self._filas = {}
+
+    def _completo(self, segmento):
+        return ((not self.desde or segmento.fecha_min >= self.desde)
+                and (not self.hasta or segmento.fecha_max < self.hasta))
+
+    def _leer(self, segmento):
+        filas = [fila for _, fila in filas_segmento(segmento)] if self._completo(segmento) else [
+            fila for fecha_hora, fila in filas_segmento(segmento)
+            if not (self.desde and fecha_hora < self.desde) and not (self.hasta and fecha_hora >= self.hasta)
+        ]
+        if self.filtro is not None:
+            filas = [fila for fila in filas if self.filtro(fila)]
+        return filas
+
+    def _filas_de(self, segmento):
+        if segmento.pk not in self._filas:
+            self._filas[segmento.pk] = self._leer(segmento)
+        return self._filas[segmento.pk]
+
+    def _cantidad(self, segmento):
+        if self.filtro is None and self._completo(segmento) and segmento.pk not in self._filas:
+            # El catálogo cuenta cada actividad una vez, aunque el archivo tenga duplicados
+            return segmento.filas
+        return len(self._filas_de(segmento))
+
+    def __len__(self):
+        return sum(self._cantidad(segmento) for segmento in self.segmentos)
+
+    def __getitem__(self, rebanada):
+        inicio, fin = rebanada.start or 0, rebanada.stop
+        filas = []
+        posicion = 0
+        for segmento in self.segmentos:
+            if fin is not None and posicion >= fin:
+                break
+            cantidad = self._cantidad(segmento)
+            if posicion + cantidad > inicio:
+                filas.extend(self._filas_de(segmento)[max(inicio - posicion, 0):None if fin is None else fin - posicion])
+            posicion += cantidad
+        return filas
+
+    def __iter__(self):
+        # Para exportar: un segmento a la vez, sin guardar los ya enviados
+        for segmento in self.segmentos:
+            yield from self._filas.get(segmento.pk) or self._leer(segmento)
+
+
+class HistorialCombinado:
+    """
+    Secuencia paginable con las actividades de la tabla activa seguidas de
+    las archivadas. Al cortarla devuelve filas ya serializadas; solo se
+    consultan y serializan las actividades activas de la página pedida.
+    """
+    def __init__(self, queryset, archivadas, serializar):
+        self.queryset = queryset
+        self.archivadas = archivadas
+        self.serializar = serializar
+        self._activas = None
+    
+    @property
+    def activas(self):
+        if self._activas is None:
+            self._activas = self.queryset.count()
+        return self._activas
+    
+    def count(self):
+        return self.activas + len(self.archivadas)
+    
+    def __len__(self):
+        return self.count()
+    
+    def __getitem__(self, rebanada):
+        inicio, fin = rebanada.start or 0, rebanada.stop
+        filas = []
+        if inicio < self.activas:
+            filas.extend(self.serializar(list(self.queryset[inicio:min(fin, self.activas)])))
+        if fin > self.activas:
+            filas.extend(self.archivadas[max(inicio - self.activas, 0):fin - self.activas])
+        return filas
+
+
+def _nombre_segmento(mes):
+    return f'actividades-{mes:%Y-%m}.jsonl.gz'
+
+
+def _escribir_segmento(ruta, filas):
+    # Cada lote se agrega como un miembro gzip independiente; gzip lee
+    # los miembros concatenados como un solo flujo
+    contenido = ''.join(json.dumps(fila, cls=JSONEncoder, ensure_ascii=False) + '\n' for fila in filas)
+    with open(ruta, 'ab') as archivo:
+        archivo.write(gzip.compress(contenido.encode('utf-8')))
+        archivo.flush()
+        os.fsync(archivo.fileno())
+
+
+def _leer_segmento(ruta):
+    try:
+        with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+            for linea in archivo:
+                yield json.loads(linea)
+    except FileNotFoundError:
+        logger.error('No se encontró el segmento de archivo %s', ruta)
+    except (EOFError, gzip.BadGzipFile, zlib.error, json.JSONDecodeError):
+        # Un lote escrito a medias al interrumpirse el archivado
+        logger.exception('Segmento de archivo dañado o incompleto: %s', ruta)
+
+
+def _actualizar_catalogo(mes, filas):
+    fechas = [fecha_hora for fecha_hora, _ in filas]
+    segmento, creado = SegmentoActividades.objects.select_for_update().get_or_create(
+        mes=mes,
+        defaults={
+            'archivo': _nombre_segmento(mes),
+            'filas': len(filas),
+            'fecha_min': min(fechas),
+            'fecha_max': max(fechas),
+        }
+    )
+    if not creado:
+        segmento.filas += len(filas)
+        segmento.fecha_min = min(segmento.fecha_min, *fechas)
+        segmento.fecha_max = max(segmento.fecha_max, *fechas)
+        segmento.save(update_fields=['filas', 'fecha_min', 'fecha_max'])
@@ -0,0 +1,283 @@
+"""
+Autenticación por token y JWT con caché del usuario autenticado.
+
+TokenAuthentication y JWTAuthentication leen el usuario de la base de
+datos en cada solicitud, y los serializadores vuelven a consultar su
+perfil. Estas clases guardan los campos del usuario ya resuelto, con el
+perfil incluido, por clave de token o por ID de usuario durante
+AUTENTICACION_CACHE_TTL segundos en el alias AUTENTICACION_CACHE_ALIAS.
+La contraseña no se guarda: el usuario de la caché la tiene diferida (se
+lee de la base de datos si alguien la usa) y, para rechazar los tokens JWT
+emitidos antes de cambiarla, se guarda el mismo resumen de ella que
+simplejwt incluye en el token.
+La generación del usuario se lee antes de consultar la base de datos y la
+entrada solo se guarda si no cambió, para no guardar un usuario leído
+justo antes de desactivarlo o de cambiar su contraseña.
+Las entradas se invalidan al guardar o eliminar el usuario o su perfil, al
+eliminar el token (cierre de sesión) y al invalidar un token JWT en la
+lista negra; con el backend SQLite compartido la invalidación llega a
+todos los workers.
+
+autenticar_async autentica desde código async (el perfilado bajo ASGI) en
+un hilo: incluso con el usuario en caché, leerla es E/S de SQLite.
+"""
+import threading
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .enrutamiento import leer_de_principal
+from .models import Perfil
+
+
+def _clave_generacion(usuario_id):
+    return f'generacion:{usuario_id}'
+
+
+def _valores(instancia, excluir=()):
+    return {
+        campo.attname: getattr(instancia, campo.attname)
+        for campo in instancia._meta.concrete_fields if campo.attname not in excluir
+    }
+
+
+def _instancia(modelo, db, valores):
+    # Los campos que no están en `valores` quedan diferidos
+    return modelo.from_db(db, list(valores), list(valores.values()))
+
+
+def empaquetar_usuario(usuario):
+    """Campos del usuario y de su perfil para la caché, sin la contraseña."""
+    try:
+        perfil = _valores(usuario.perfil)
+    except ObjectDoesNotExist:
+        perfil = None
+    return {
+        'db': usuario._state.db,
+        'usuario': _valores(usuario, excluir=('password',)),
+        'perfil': perfil,
+        'revocacion': get_md5_hash_password(usuario.password) if api_settings.CHECK_REVOKE_TOKEN else None,
+    }
+
+
+def desempaquetar_usuario(datos):
+    """Usuario con su perfil a partir de empaquetar_usuario, con la contraseña diferida."""
+    usuario = _instancia(User, datos['db'], datos['usuario'])
+    if datos['perfil'] is not None:
+        # Asigna también el perfil al usuario
+        _instancia(Perfil, datos['db'], datos['perfil']).usuario = usuario
+    return usuario
+
+
+class CacheUsuarios:
+    """
+    Cada entrada guarda la generación de su usuario al momento de leerlo.
+    Invalidar un usuario incrementa su generación con un incr atómico, así
+    que todas sus entradas dejan de valer sin tener que enumerarlas. Las
+    entradas guardan valores (ver empaquetar_usuario), de modo que cada
+    solicitud arma su propia copia del usuario.
+    """
+    def __init__(self):
+        # Los contadores son de cada proceso
+        self._lock = threading.Lock()
+        self._reiniciar_contadores()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'AUTENTICACION_CACHE_ALIAS', 'default')]
+
+    def _reiniciar_contadores(self):
+        with self._lock:
+            self.aciertos = 0
+            self.fallos = 0
+
+    def _contar(self, acierto):
+        with self._lock:
+            if acierto:
+                self.aciertos += 1
+            else:
+                self.fallos += 1
+
+    def limpiar(self):
+        self.cache.clear()
+        self._reiniciar_contadores()
+
+    def buscar(self, clave, usuario_id=None):
+        """
+        Devuelve (objeto, generación). El objeto es None si falta la entrada
+        o quedó invalidada; la generación es la vigente antes de leer la base
+        de datos y se pasa a guardar. Es None si no se sabe de qué usuario es
+        la clave (un token que todavía no pasó por la caché).
+        """
+        if usuario_id is None:
+            entrada = self.cache.get(clave)
+            if entrada is None:
+                self._contar(False)
+                return None, None
+            usuario_id = entrada[1]
+            generacion = self.cache.get(_clave_generacion(usuario_id))
+        else:
+            # Con el usuario conocido, la entrada y su generación en una sola lectura
+            valores = self.cache.get_many([clave, _clave_generacion(usuario_id)])
+            entrada, generacion = valores.get(clave), valores.get(_clave_generacion(usuario_id))
+        acierto = entrada is not None and generacion is not None and entrada[0] == generacion
+        self._contar(acierto)
+        if acierto:
+            return entrada[2], generacion
+        if generacion is None:
+            clave_generacion = _clave_generacion(usuario_id)
+            self.cache.add(clave_generacion, 0, None)
+            generacion = self.cache.get(clave_generacion)
+        return None, generacion
+
+    def guardar(self, clave, usuario_id, objeto, generacion):
+        """
+        Guarda el objeto leído de la base de datos con la generación que
+        devolvió buscar antes de esa lectura. Si el usuario se invalidó entre
+        medio no se guarda: el objeto puede ser anterior al cambio.
+        """
+        tiempo = getattr(settings, 'AUTENTICACION_CACHE_TTL', 30)
+        if generacion is None:
+            # Solo se recuerda de quién es la clave, para que la próxima
+            # búsqueda lea la generación antes que la base de datos
+            self.cache.set(clave, (None, usuario_id, None), tiempo)
+        elif self.cache.get(_clave_generacion(usuario_id)) == generacion:
+            self.cache.set(clave, (generacion, usuario_id, objeto), tiempo)
+
+    def invalidar(self, claves=(), usuarios=()):
+        if claves:
+            self.cache.delete_many(claves)
+        for usuario_id in usuarios:
+            try:
+                self.cache.incr(_clave_generacion(usuario_id))
+            except ValueError:
+                # Sin generación ninguna entrada del usuario es válida
+                pass
+
+
+cache_usuarios = CacheUsuarios()
+
+
+class TokenAuthenticationCache(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        datos, generacion = cache_usuarios.buscar(f'token:{key}')
+        model = self.get_model()
+        if datos is None:
+            try:
+                # Un token recién creado puede no haber llegado a la réplica
+                with leer_de_principal():
+                    token = model.objects.select_related('user__perfil').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            datos = {**empaquetar_usuario(token.user), 'token': _valores(token)}
+            cache_usuarios.guardar(f'token:{key}', token.user_id, datos, generacion)
+        else:
+            token = _instancia(model, datos['db'], datos['token'])
+            token.user = desempaquetar_usuario(datos)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
+
+
+class JWTAuthenticationCache(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        datos, generacion = cache_usuarios.buscar(f'usuario:{user_id}', usuario_id=user_id)
+        if datos is None:
+            try:
+                with leer_de_principal():
+                    user = self.user_model.objects.select_related('perfil').get(
+                        **{api_settings.USER_ID_FIELD: user_id}
+                    )
+            except self.user_model.DoesNotExist as e:
+                raise exceptions.AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            datos = empaquetar_usuario(user)
+            cache_usuarios.guardar(f'usuario:{user_id}', user.pk, datos, generacion)
+        else:
+            user = desempaquetar_usuario(datos)
+
+        # Las verificaciones se repiten con el usuario de la caché
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise exceptions.AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != datos['revocacion']:
+                raise exceptions.AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+
+async def autenticar_async(request):
+    """
+    Equivalente async de la autenticación de una Request de DRF: cada clase
+    se prueba en un hilo, sin bloquear el bucle de eventos con la caché o
+    la base de datos.
+    """
+    for autenticador in request.authenticators:
+        try:
+            resultado = await sync_to_async(autenticador.authenticate)(request)
+        except exceptions.APIException:
+            request._not_authenticated()
+            raise
+        if resultado is not None:
+            request._authenticator = autenticador
+            request.user, request.auth = resultado
+            return
+    request._not_authenticated()
+
+
+def _invalidar_usuario(usuario_id):
+    cache_usuarios.invalidar(usuarios=[usuario_id])
+    # Hasta el commit otra solicitud puede leer los datos anteriores con la
+    # generación nueva: se invalida otra vez al confirmar la transacción
+    transaction.on_commit(lambda: cache_usuarios.invalidar(usuarios=[usuario_id]))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_usuario(sender, instance, **kwargs):
+    _invalidar_usuario(instance.pk)
+
+
+@receiver(post_save, sender=Perfil)
+@receiver(post_delete, sender=Perfil)
+def invalidar_perfil(sender, instance, **kwargs):
+    _invalidar_usuario(instance.usuario_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidar_token(sender, instance, **kwargs):
+    cache_usuarios.invalidar(claves=[f'token:{instance.key}'])
+
+
+if apps.is_installed('rest_framework_simplejwt.token_blacklist'):
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    @receiver(post_save, sender=BlacklistedToken)
+    def invalidar_token_jwt(sender, instance, created, **kwargs):
+        # El usuario vuelve a leerse y verificarse en su próxima solicitud
+        if created:
+            cache_usuarios.invalidar(usuarios=[instance.token.user_id])
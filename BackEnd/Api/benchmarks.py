@@ -0,0 +1,157 @@
+"""
+Utilidades compartidas por los comandos de benchmark y pruebas de carga.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, time as hora, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from .actividades import registro_actividades
+from .metricas import registro_metricas
+from .models import ActividadUsuario, Paciente, asignador_id_paciente, crear_pacientes_en_bloque, formatear_id_paciente
+
+
+@contextmanager
+def base_datos_temporal(alias='default'):
+    """
+    Crea una base de datos desechable con todas las migraciones aplicadas y
+    la elimina al terminar, para que los benchmarks nunca toquen datos reales.
+
+    Con SQLite la base se crea en un archivo temporal (no en memoria) para
+    que varios hilos puedan compartirla. Las cachés compartidas también se
+    llevan a un archivo temporal (caches_temporales).
+    """
+    with caches_temporales():
+        setup_test_environment()
+        conexion = connections[alias]
+        archivo_temporal = None
+        if conexion.vendor == 'sqlite':
+            descriptor, archivo_temporal = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(descriptor)
+            conexion.settings_dict['TEST']['NAME'] = archivo_temporal
+        nombre_original = conexion.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        # Las réplicas (TEST MIRROR) leen de la misma base temporal
+        espejos = {
+            otro: connections[otro].settings_dict['NAME']
+            for otro in connections
+            if connections[otro].settings_dict.get('TEST', {}).get('MIRROR') == alias
+        }
+        for otro in espejos:
+            connections[otro].close()
+            connections[otro].creation.set_as_test_mirror(conexion.settings_dict)
+        try:
+            yield conexion
+        finally:
+            registro_actividades.vaciar()
+            for otro, nombre in espejos.items():
+                connections[otro].close()
+                connections[otro].settings_dict['NAME'] = nombre
+            conexion.creation.destroy_test_db(nombre_original, verbosity=0)
+            if archivo_temporal and os.path.exists(archivo_temporal):
+                os.remove(archivo_temporal)
+            teardown_test_environment()
+
+
+@contextmanager
+def caches_temporales():
+    """
+    Lleva las cachés compartidas (CacheSQLite) a un archivo temporal, para
+    no vaciar ni llenar las reales.
+    """
+    with tempfile.TemporaryDirectory() as directorio_cache:
+        with override_settings(CACHES={
+            alias: {**configuracion, 'LOCATION': os.path.join(directorio_cache, 'cache.sqlite3')}
+            if configuracion['BACKEND'] == 'Api.cache_sqlite.CacheSQLite' else configuracion
+            for alias, configuracion in settings.CACHES.items()
+        }):
+            # Las métricas de este proceso apuntan a la caché temporal
+            registro_metricas.limpiar()
+            try:
+                yield
+            finally:
+                registro_metricas.limpiar()
+
+
+def datos_paciente(indice, **extra):
+    """Datos válidos para registrar un paciente de prueba."""
+    datos = {
+        'nombre_madre': f'Madre De Prueba {indice}',
+        'documento_madre': f'{1000000000 + indice}',
+        'sexo_bebe': 'M' if indice % 2 else 'F',
+        'talla': '50.00',
+        'peso': '3.20',
+        'fecha_nacimiento': '2025-01-01',
+        'hora_nacimiento': '08:00:00',
+        'codigo_qr': f'QR-PRUEBA-{indice}',
+    }
+    datos.update(extra)
+    return datos
+
+
+def sembrar_datos(pacientes=200, actividades=2000, usuarios=5, semilla=0):
+    """
+    Llena la base de datos con pacientes y actividades de prueba usando
+    inserciones en bloque. Devuelve la lista de usuarios creados.
+    """
+    aleatorio = random.Random(semilla)
+    creados = []
+    for n in range(usuarios):
+        usuario = User.objects.create_user(f'usuario{n}', password='benchmark')
+        usuario.perfil.nombre = f'Nombre{n}'
+        usuario.perfil.apellido = f'Apellido{n}'
+        usuario.perfil.cargo = 'Enfermero(a)' if n % 2 else 'Doctor(a)'
+        usuario.perfil.save()
+        creados.append(usuario)
+
+    numeros = asignador_id_paciente.reservar(pacientes)
+    hoy = date.today()
+    lista_pacientes = [
+        Paciente(
+            id_paciente=formatear_id_paciente(numero),
+            nombre_madre=f'Madre Número {numero} Apellido{numero % 97}',
+            documento_madre=str(1000000000 + numero),
+            sexo_bebe=aleatorio.choice('MF'),
+            talla=Decimal(aleatorio.randint(4500, 5500)) / 100,
+            peso=Decimal(aleatorio.randint(250, 420)) / 100,
+            fecha_nacimiento=hoy - timedelta(days=aleatorio.randint(0, 365)),
+            hora_nacimiento=hora(aleatorio.randint(0, 23), aleatorio.randint(0, 59)),
+            dado_alta=aleatorio.choice(['True', 'False']),
+            codigo_qr=f'QR-{numero}',
+        )
+        for numero in numeros
+    ]
+    for paciente in lista_pacientes:
+        paciente.normalizar_campos()
+    crear_pacientes_en_bloque(lista_pacientes, batch_size=500)
+
+    ActividadUsuario.objects.bulk_create([
+        ActividadUsuario(
+            usuario=aleatorio.choice(creados),
+            paciente=aleatorio.choice(lista_pacientes),
+            tipo_actividad=aleatorio.choice(['busqueda', 'busqueda', 'creacion', 'edicion']),
+            metodo_busqueda=aleatorio.choice(['qr', 'id']),
+        )
+        for _ in range(actividades)
+    ], batch_size=500)
+    return creados
+
+
+def medir(funcion, repeticiones):
+    """Ejecuta `funcion` varias veces y devuelve la mediana en milisegundos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
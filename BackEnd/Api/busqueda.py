@@ -0,0 +1,164 @@
+"""
+Índice de búsqueda de pacientes y usuarios.
+
+Los textos se normalizan (minúsculas y sin tildes, "Gómez" -> "gomez") y se
+dividen en términos que se guardan en TerminoBusqueda. Una búsqueda
+encuentra los objetos que tienen, para cada palabra buscada, algún término
+que empieza por ella. De los términos con dígitos (IDs y documentos) se
+guardan además los sufijos que empiezan en un dígito y tienen al menos
+LARGO_MINIMO_SUFIJO caracteres, así una parte del número ("0012" en
+FOSB0012, o los últimos dígitos de un documento) se encuentra como con la
+búsqueda por subcadena que había antes del índice. Se resuelve con rangos sobre un índice en lugar de
+LIKE '%...%', así no recorre las tablas de pacientes y usuarios.
+El índice se mantiene con señales al guardar o eliminar Paciente y User,
+y con pacientes_creados en las altas en bloque.
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Paciente, TerminoBusqueda, normalizar, pacientes_creados
+
+# Campos que alimentan el índice de cada tipo de objeto
+CAMPOS_PACIENTE = ('id_paciente', 'nombre_madre', 'documento_madre')
+CAMPOS_USUARIO = ('username', 'first_name', 'last_name')
+
+# Mayor que cualquier carácter de un término, para expresar "empieza por"
+# como un rango [prefijo, prefijo + FIN_PREFIJO)
+FIN_PREFIJO = '￿'
+
+# Los fragmentos más cortos de un número coinciden con demasiados pacientes
+LARGO_MINIMO_SUFIJO = 3
+
+
+def terminos(*textos):
+    """Términos normalizados (sin repetir) de los textos dados."""
+    encontrados = []
+    for texto in textos:
+        for termino in re.findall(r'\w+', normalizar(texto)):
+            termino = termino[:TerminoBusqueda._meta.get_field('termino').max_length]
+            if termino not in encontrados:
+                encontrados.append(termino)
+    return encontrados
+
+
+def terminos_indice(*textos):
+    """Términos de los textos tal como se guardan en el índice, con los sufijos numéricos."""
+    encontrados = terminos(*textos)
+    for termino in list(encontrados):
+        for inicio in range(1, len(termino) - LARGO_MINIMO_SUFIJO + 1):
+            if termino[inicio].isdigit() and termino[inicio:] not in encontrados:
+                encontrados.append(termino[inicio:])
+    return encontrados
+
+
+def terminos_paciente(paciente):
+    return terminos_indice(*(getattr(paciente, campo) for campo in CAMPOS_PACIENTE))
+
+
+def terminos_usuario(usuario):
+    return terminos_indice(*(getattr(usuario, campo) for campo in CAMPOS_USUARIO))
+
+
+def indexar(tipo, objetos, obtener_terminos, nuevos=False):
+    """
+    Reemplaza los términos de los objetos indicados. Con nuevos=True los
+    objetos acaban de crearse y no hay términos anteriores que borrar.
+    """
+    objetos = [objeto for objeto in objetos if objeto.pk]
+    if not objetos:
+        return
+    terminos_nuevos = [
+        TerminoBusqueda(tipo=tipo, objeto_id=objeto.pk, termino=termino)
+        for objeto in objetos
+        for termino in obtener_terminos(objeto)
+    ]
+    if nuevos:
+        TerminoBusqueda.objects.bulk_create(terminos_nuevos, batch_size=1000)
+        return
+    with transaction.atomic():
+        TerminoBusqueda.objects.filter(tipo=tipo, objeto_id__in=[o.pk for o in objetos]).delete()
+        TerminoBusqueda.objects.bulk_create(terminos_nuevos, batch_size=1000)
+
+
+def indexar_pacientes(pacientes, nuevos=False):
+    indexar(TerminoBusqueda.TIPO_PACIENTE, pacientes, terminos_paciente, nuevos)
+
+
+def indexar_usuarios(usuarios, nuevos=False):
+    indexar(TerminoBusqueda.TIPO_USUARIO, usuarios, terminos_usuario, nuevos)
+
+
+def reconstruir_indice(tamano_lote=1000):
+    """Vuelve a generar todo el índice. Devuelve (pacientes, usuarios) indexados."""
+    TerminoBusqueda.objects.all().delete()
+    pacientes = 0
+    lote = []
+    for paciente in Paciente.objects.only(*CAMPOS_PACIENTE).order_by('pk').iterator(chunk_size=tamano_lote):
+        lote.append(paciente)
+        if len(lote) >= tamano_lote:
+            indexar_pacientes(lote, nuevos=True)
+            pacientes += len(lote)
+            lote = []
+    indexar_pacientes(lote, nuevos=True)
+    pacientes += len(lote)
+
+    lote = list(User.objects.only(*CAMPOS_USUARIO).order_by('pk'))
+    for inicio in range(0, len(lote), tamano_lote):
+        indexar_usuarios(lote[inicio:inicio + tamano_lote], nuevos=True)
+    usuarios = len(lote)
+    return pacientes, usuarios
+
+
+def ids_coincidentes(tipo, consulta):
+    """
+    Subconsulta con los IDs de los objetos de `tipo` que tienen, por cada
+    palabra de la consulta, algún término que empieza por ella. Devuelve
+    None si la consulta no contiene palabras.
+    """
+    palabras = terminos(consulta)
+    if not palabras:
+        return None
+    ids = None
+    for palabra in palabras:
+        coincidencias = TerminoBusqueda.objects.filter(
+            tipo=tipo, termino__gte=palabra, termino__lt=palabra + FIN_PREFIJO
+        ).values('objeto_id')
+        ids = coincidencias if ids is None else coincidencias.filter(objeto_id__in=ids)
+    return ids
+
+
+def _cambio_alguno(update_fields, campos):
+    return update_fields is None or bool(set(update_fields) & set(campos))
+
+
+@receiver(post_save, sender=Paciente)
+def indexar_paciente_al_guardar(sender, instance, created, **kwargs):
+    # Una edición que no toca los campos indexados no necesita reindexar
+    if created or instance.campos_modificados() & set(CAMPOS_PACIENTE):
+        indexar_pacientes([instance], nuevos=created)
+
+
+@receiver(pacientes_creados, sender=Paciente)
+def indexar_pacientes_creados(sender, pacientes, **kwargs):
+    indexar_pacientes(pacientes, nuevos=True)
+
+
+@receiver(post_delete, sender=Paciente)
+def desindexar_paciente(sender, instance, **kwargs):
+    TerminoBusqueda.objects.filter(tipo=TerminoBusqueda.TIPO_PACIENTE, objeto_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=User)
+def indexar_usuario_al_guardar(sender, instance, created, update_fields=None, **kwargs):
+    # El inicio de sesión guarda solo last_login y no necesita reindexar
+    if created or _cambio_alguno(update_fields, CAMPOS_USUARIO):
+        indexar_usuarios([instance], nuevos=created)
+
+
+@receiver(post_delete, sender=User)
+def desindexar_usuario(sender, instance, **kwargs):
+    TerminoBusqueda.objects.filter(tipo=TerminoBusqueda.TIPO_USUARIO, objeto_id=instance.pk).delete()
@@ -0,0 +1,149 @@
+"""
+Caché para la búsqueda de pacientes por código QR.
+
+Guarda codigo_qr -> pk, y una caché negativa para los códigos que se sabe
+que no existen, de modo que un escaneo repetido lee al paciente por su
+clave primaria y el de un código desconocido no consulta la base de datos.
+Los datos del paciente no se guardan: se leen y serializan en cada
+escaneo, así una entrada escrita por una solicitud que perdió la carrera
+con una modificación no puede mostrar datos anteriores. Las entradas viven en el alias de caché
+QR_CACHE_ALIAS; con el backend SQLite compartido (Api.cache_sqlite) todos
+los workers ven las mismas entradas y las invalidaciones que hace
+cualquiera de ellos al guardar, eliminar o crear en bloque pacientes. El TTL limita cuánto
+puede tardar en verse un cambio hecho sin pasar por los modelos.
+"""
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Paciente, pacientes_creados
+
+# Valor guardado para los códigos que no existen (ningún pk es 0)
+AUSENTE = 0
+
+
+def _clave_codigo(codigo_qr):
+    # El código escaneado puede tener espacios o ser muy largo para una clave
+    return 'codigo:' + hashlib.sha1(codigo_qr.encode()).hexdigest()
+
+
+def _clave_paciente(pk):
+    return f'paciente:{pk}'
+
+
+class IndiceQR:
+    def __init__(self):
+        # Los contadores son de cada proceso
+        self._lock = threading.Lock()
+        self._reiniciar_contadores()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'QR_CACHE_ALIAS', 'default')]
+
+    def _reiniciar_contadores(self):
+        with self._lock:
+            self.aciertos = 0
+            self.aciertos_negativos = 0
+            self.fallos = 0
+            self.invalidaciones = 0
+
+    def limpiar(self):
+        self.cache.clear()
+        self._reiniciar_contadores()
+
+    def buscar(self, codigo_qr):
+        """
+        Devuelve el pk del paciente si el código está en caché, AUSENTE si se
+        sabe que no existe, o None si hay que consultar la base de datos.
+        """
+        return self.buscar_varios([codigo_qr]).get(codigo_qr)
+
+    def buscar_varios(self, codigos_qr):
+        """Como buscar, con una sola lectura; omite los códigos sin entrada."""
+        claves = {_clave_codigo(codigo_qr): codigo_qr for codigo_qr in codigos_qr}
+        entradas = {claves[clave]: entrada for clave, entrada in self.cache.get_many(claves).items()}
+        with self._lock:
+            for entrada in entradas.values():
+                if entrada == AUSENTE:
+                    self.aciertos_negativos += 1
+                else:
+                    self.aciertos += 1
+            self.fallos += len(claves) - len(entradas)
+        return entradas
+
+    def guardar(self, codigo_qr, pk):
+        self.guardar_varios({codigo_qr: pk})
+
+    def guardar_varios(self, entradas):
+        """Guarda {codigo_qr: pk} con una sola escritura."""
+        valores = {}
+        for codigo_qr, pk in entradas.items():
+            valores[_clave_codigo(codigo_qr)] = pk
+            # Para invalidar por paciente aunque su código haya cambiado
+            valores[_clave_paciente(pk)] = codigo_qr
+        if valores:
+            self.cache.set_many(valores, getattr(settings, 'QR_CACHE_TTL', 30))
+
+    def guardar_ausente(self, codigo_qr):
+        self.guardar_ausentes([codigo_qr])
+
+    def guardar_ausentes(self, codigos_qr):
+        if codigos_qr:
+            self.cache.set_many(
+                {_clave_codigo(codigo_qr): AUSENTE for codigo_qr in codigos_qr},
+                getattr(settings, 'QR_CACHE_TTL_NEGATIVO', 15)
+            )
+
+    def invalidar(self, codigos_qr=(), pks=()):
+        """Elimina las entradas de los códigos y pacientes indicados."""
+        claves = [_clave_codigo(codigo_qr) for codigo_qr in codigos_qr if codigo_qr]
+        if pks:
+            # El código QR de un paciente puede haber cambiado desde que se guardó
+            codigos_guardados = self.cache.get_many([_clave_paciente(pk) for pk in pks])
+            claves += list(codigos_guardados)
+            claves += [_clave_codigo(codigo_qr) for codigo_qr in codigos_guardados.values()]
+        if claves:
+            self.cache.delete_many(claves)
+        with self._lock:
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.aciertos_negativos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'aciertos_negativos': self.aciertos_negativos,
+                'fallos': self.fallos,
+                'tasa_aciertos': (self.aciertos + self.aciertos_negativos) / consultas if consultas else 0.0,
+                'invalidaciones': self.invalidaciones,
+                'cache': getattr(settings, 'QR_CACHE_ALIAS', 'default'),
+            }
+
+
+indice_qr = IndiceQR()
+
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+def invalidar_qr_paciente(sender, instance, **kwargs):
+    _invalidar([instance.codigo_qr], [instance.pk])
+
+
+@receiver(pacientes_creados, sender=Paciente)
+def invalidar_qr_pacientes_creados(sender, pacientes, **kwargs):
+    # Un código consultado antes de existir puede estar en caché como
+    # ausente; los pacientes nuevos todavía no tienen entrada por pk
+    _invalidar([paciente.codigo_qr for paciente in pacientes], ())
+
+
+def _invalidar(codigos_qr, pks):
+    indice_qr.invalidar(codigos_qr=codigos_qr, pks=pks)
+    # Hasta el commit un escaneo concurrente no ve el cambio y puede volver a
+    # guardar el código como ausente: se invalida otra vez al confirmar
+    transaction.on_commit(lambda: indice_qr.invalidar(codigos_qr=codigos_qr, pks=pks))
@@ -0,0 +1,217 @@
+"""
+Backend de caché de Django sobre un archivo SQLite en modo WAL.
+
+A diferencia de LocMemCache, que es propia de cada proceso, todos los
+workers de gunicorn de un mismo servidor comparten el archivo, así que los
+límites de solicitudes, la caché de QR y la de usuarios autenticados son
+las mismas en todos. No necesita ningún servicio externo (Redis o
+Memcached). En WAL las lecturas no bloquean a las escrituras, y `incr` es
+un único UPDATE ... RETURNING, atómico entre procesos.
+
+Los enteros se guardan como INTEGER para poder incrementarlos en SQL; el
+resto de valores se guardan serializados con pickle. Varios alias pueden
+compartir el archivo con tablas distintas (OPTIONS['TABLA']), de modo que
+clear() solo vacía la tabla de su alias.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'Api.cache_sqlite.CacheSQLite',
+            'LOCATION': BASE_DIR / 'cache_compartida.sqlite3',
+            'OPTIONS': {'TABLA': 'general', 'MAX_ENTRIES': 100000},
+        },
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Escrituras de cada proceso entre dos limpiezas de entradas vencidas
+ESCRITURAS_POR_LIMPIEZA = 1000
+
+
+class CacheSQLite(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        opciones = params.get('OPTIONS', {})
+        self._archivo = str(location)
+        self._tabla = opciones.get('TABLA', 'cache')
+        if not self._tabla.isidentifier():
+            raise ValueError(f'Nombre de tabla de caché no válido: {self._tabla!r}')
+        self._espera_ms = int(opciones.get('BUSY_TIMEOUT_MS', 5000))
+        self._local = threading.local()
+        self._escrituras = 0
+
+    def _conexion(self):
+        """Conexión propia de cada hilo; se vuelve a abrir en un proceso hijo."""
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is not None and self._local.pid == os.getpid():
+            return conexion
+        Path(self._archivo).parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: cada sentencia se confirma sola
+        conexion = sqlite3.connect(self._archivo, timeout=self._espera_ms / 1000,
+                                   isolation_level=None, check_same_thread=False)
+        conexion.execute(f'PRAGMA busy_timeout = {self._espera_ms}')
+        conexion.execute('PRAGMA journal_mode = WAL')
+        # En WAL, NORMAL no sincroniza el disco en cada escritura; ante un
+        # corte de energía se pueden perder las últimas, lo que en una caché
+        # es aceptable
+        conexion.execute('PRAGMA synchronous = NORMAL')
+        conexion.execute(
+            f'CREATE TABLE IF NOT EXISTS {self._tabla} ('
+            'clave TEXT PRIMARY KEY, valor BLOB, expira REAL) WITHOUT ROWID'
+        )
+        conexion.execute(f'CREATE INDEX IF NOT EXISTS {self._tabla}_expira ON {self._tabla} (expira)')
+        self._local.conexion = conexion
+        self._local.pid = os.getpid()
+        return conexion
+
+    @staticmethod
+    def _codificar(valor):
+        # bool es subclase de int, pero debe volver como bool
+        if type(valor) is int and -2 ** 63 <= valor < 2 ** 63:
+            return valor
+        return pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decodificar(valor):
+        return valor if isinstance(valor, int) else pickle.loads(valor)
+
+    def get(self, key, default=None, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        fila = self._conexion().execute(
+            f'SELECT valor FROM {self._tabla} WHERE clave = ? AND (expira IS NULL OR expira > ?)',
+            (clave, time.time())
+        ).fetchone()
+        return default if fila is None else self._decodificar(fila[0])
+
+    def get_many(self, keys, version=None):
+        claves = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not claves:
+            return {}
+        marcadores = ', '.join('?' * len(claves))
+        filas = self._conexion().execute(
+            f'SELECT clave, valor FROM {self._tabla} '
+            f'WHERE clave IN ({marcadores}) AND (expira IS NULL OR expira > ?)',
+            (*claves, time.time())
+        ).fetchall()
+        return {claves[clave]: self._decodificar(valor) for clave, valor in filas}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        self._conexion().execute(
+            f'INSERT OR REPLACE INTO {self._tabla} (clave, valor, expira) VALUES (?, ?, ?)',
+            (clave, self._codificar(value), self.get_backend_timeout(timeout))
+        )
+        self._contar_escritura()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expira = self.get_backend_timeout(timeout)
+        filas = [
+            (self.make_and_validate_key(key, version=version), self._codificar(value), expira)
+            for key, value in data.items()
+        ]
+        conexion = self._conexion()
+        with _transaccion(conexion):
+            conexion.executemany(
+                f'INSERT OR REPLACE INTO {self._tabla} (clave, valor, expira) VALUES (?, ?, ?)', filas
+            )
+        self._contar_escritura()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        ahora = time.time()
+        # Inserta, o reemplaza solo si la entrada existente ya venció
+        cursor = self._conexion().execute(
+            f'INSERT INTO {self._tabla} (clave, valor, expira) VALUES (?, ?, ?) '
+            'ON CONFLICT (clave) DO UPDATE SET valor = excluded.valor, expira = excluded.expira '
+            f'WHERE {self._tabla}.expira IS NOT NULL AND {self._tabla}.expira <= ?',
+            (clave, self._codificar(value), self.get_backend_timeout(timeout), ahora)
+        )
+        self._contar_escritura()
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        cursor = self._conexion().execute(
+            f'UPDATE {self._tabla} SET expira = ? WHERE clave = ? AND (expira IS NULL OR expira > ?)',
+            (self.get_backend_timeout(timeout), clave, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        """Incremento atómico entre procesos; ValueError si la clave no existe."""
+        clave = self.make_and_validate_key(key, version=version)
+        fila = self._conexion().execute(
+            f'UPDATE {self._tabla} SET valor = valor + ? '
+            "WHERE clave = ? AND typeof(valor) = 'integer' AND (expira IS NULL OR expira > ?) "
+            'RETURNING valor',
+            (delta, clave, time.time())
+        ).fetchall()
+        if not fila:
+            raise ValueError(f"Key '{key}' not found")
+        return fila[0][0]
+
+    def has_key(self, key, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        return self._conexion().execute(
+            f'SELECT 1 FROM {self._tabla} WHERE clave = ? AND (expira IS NULL OR expira > ?)',
+            (clave, time.time())
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        clave = self.make_and_validate_key(key, version=version)
+        cursor = self._conexion().execute(f'DELETE FROM {self._tabla} WHERE clave = ?', (clave,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        claves = [self.make_and_validate_key(key, version=version) for key in keys]
+        if claves:
+            self._conexion().execute(
+                f'DELETE FROM {self._tabla} WHERE clave IN ({", ".join("?" * len(claves))})', claves
+            )
+
+    def clear(self):
+        self._conexion().execute(f'DELETE FROM {self._tabla}')
+
+    def _contar_escritura(self):
+        self._escrituras += 1
+        if self._escrituras % ESCRITURAS_POR_LIMPIEZA == 0:
+            self._limpiar()
+
+    def _limpiar(self):
+        """
+        Borra las entradas vencidas y, si se supera MAX_ENTRIES, la fracción
+        1/CULL_FREQUENCY de las que vencen antes. No es LRU: registrar cada
+        lectura convertiría cada get en una escritura; con los TTL cortos de
+        estas cachés las que vencen antes son en general las menos recientes.
+        """
+        conexion = self._conexion()
+        conexion.execute(f'DELETE FROM {self._tabla} WHERE expira <= ?', (time.time(),))
+        (cantidad,) = conexion.execute(f'SELECT COUNT(*) FROM {self._tabla}').fetchone()
+        if cantidad > self._max_entries:
+            if self._cull_frequency == 0:
+                self.clear()
+                return
+            conexion.execute(
+                f'DELETE FROM {self._tabla} WHERE clave IN ('
+                f'SELECT clave FROM {self._tabla} ORDER BY expira IS NULL, expira LIMIT ?)',
+                (cantidad // self._cull_frequency,)
+            )
+
+
+@contextmanager
+def _transaccion(conexion):
+    conexion.execute('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        conexion.execute('ROLLBACK')
+        raise
+    conexion.execute('COMMIT')
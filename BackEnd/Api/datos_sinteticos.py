@@ -0,0 +1,196 @@
+"""
+Generación de datos sintéticos de neonatos para pruebas de rendimiento.
+
+Crea usuarios con su Perfil, pacientes con pesos y tallas plausibles y un
+historial de actividades, todo con inserciones en bloque. Los pacientes se
+crean con crear_pacientes_en_bloque sin sumarlos a las estadísticas, que se
+recalculan al final para los días afectados.
+"""
+import random
+from datetime import datetime, time as hora, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .busqueda import indexar_usuarios
+from .estadisticas import recalcular_dias
+from .models import (
+    ActividadUsuario, Paciente, Perfil, asignador_id_paciente, crear_pacientes_en_bloque, detalle_cambio,
+    formatear_id_paciente,
+)
+
+NOMBRES = (
+    'María', 'Ana', 'Luisa', 'Carolina', 'Paola', 'Andrea', 'Diana', 'Laura', 'Sandra', 'Natalia',
+    'Juliana', 'Valentina', 'Camila', 'Daniela', 'Gloria', 'Marta', 'Ángela', 'Lucía', 'Sofía', 'Yolanda',
+)
+APELLIDOS = (
+    'García', 'Rodríguez', 'Martínez', 'López', 'González', 'Hernández', 'Pérez', 'Sánchez', 'Ramírez',
+    'Torres', 'Gómez', 'Díaz', 'Vargas', 'Rojas', 'Moreno', 'Muñoz', 'Castro', 'Ortiz', 'Jiménez', 'Ponguta',
+)
+NOMBRES_PERSONAL = (
+    'Carlos', 'Jorge', 'Andrés', 'Felipe', 'Mauricio', 'Ricardo', 'Adriana', 'Patricia', 'Claudia', 'Mónica',
+)
+
+# Peso (kg) y talla (cm) al nacer: media y desviación, con los límites en
+# que se recortan para no generar valores imposibles
+PESO_MEDIA, PESO_DESVIACION, PESO_LIMITES = 3.3, 0.45, (1.5, 5.0)
+TALLA_MEDIA, TALLA_DESVIACION, TALLA_LIMITES = 50.0, 1.6, (42.0, 56.0)
+# Centímetros de talla por kilogramo de peso sobre la media
+TALLA_POR_KILO = 4.0
+
+# Proporciones del historial de actividades
+PESOS_ACTIVIDAD = {'busqueda': 75, 'edicion': 20, 'creacion': 5}
+PROPORCION_BUSQUEDA_QR = 0.8
+
+
+def _recortar(valor, limites):
+    return min(max(valor, limites[0]), limites[1])
+
+
+def _decimal(valor):
+    return Decimal(f'{valor:.2f}')
+
+
+def _nombre_completo(aleatorio):
+    return f'{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} {aleatorio.choice(APELLIDOS)}'
+
+
+def generar_usuarios(cantidad, prefijo='carga', password='carga', aleatorio=None):
+    """
+    Crea `cantidad` usuarios `{prefijo}{n}` con su Perfil, saltando los
+    nombres de usuario que ya existan. Todos comparten la misma contraseña,
+    que se cifra una sola vez.
+    """
+    aleatorio = aleatorio or random.Random()
+    existentes = set(User.objects.filter(username__startswith=prefijo).values_list('username', flat=True))
+    clave = make_password(password)
+    usuarios = []
+    numero = 0
+    while len(usuarios) < cantidad:
+        username = f'{prefijo}{numero}'
+        numero += 1
+        if username in existentes:
+            continue
+        usuarios.append(User(
+            username=username,
+            password=clave,
+            first_name=aleatorio.choice(NOMBRES_PERSONAL),
+            last_name=aleatorio.choice(APELLIDOS),
+        ))
+
+    with transaction.atomic():
+        User.objects.bulk_create(usuarios, batch_size=500)
+        # bulk_create no envía el post_save que crea el perfil
+        Perfil.objects.bulk_create([
+            Perfil(
+                usuario=usuario,
+                nombre=usuario.first_name,
+                apellido=usuario.last_name,
+                cargo=aleatorio.choice(['Doctor(a)', 'Enfermero(a)', 'Enfermero(a)']),
+            )
+            for usuario in usuarios
+        ], batch_size=500)
+        indexar_usuarios(usuarios, nuevos=True)
+    return usuarios
+
+
+def nuevo_paciente(numero, aleatorio, dias):
+    """Paciente sin guardar con el número de secuencia `numero`."""
+    sexo = aleatorio.choice('MF')
+    # Los niños pesan en promedio un poco más que las niñas
+    peso = _recortar(
+        aleatorio.gauss(PESO_MEDIA + (0.1 if sexo == 'M' else -0.1), PESO_DESVIACION), PESO_LIMITES
+    )
+    talla = _recortar(
+        aleatorio.gauss(TALLA_MEDIA + (peso - PESO_MEDIA) * TALLA_POR_KILO, TALLA_DESVIACION), TALLA_LIMITES
+    )
+    dias_nacido = aleatorio.randint(0, dias)
+    # Casi todos los nacidos hace más de tres días ya salieron
+    dado_alta = aleatorio.random() < (0.95 if dias_nacido > 3 else 0.2)
+    id_paciente = formatear_id_paciente(numero)
+    paciente = Paciente(
+        id_paciente=id_paciente,
+        nombre_madre=_nombre_completo(aleatorio),
+        documento_madre=str(aleatorio.randint(10_000_000, 1_199_999_999)),
+        sexo_bebe=sexo,
+        talla=_decimal(talla),
+        peso=_decimal(peso),
+        fecha_nacimiento=timezone.localdate() - timedelta(days=dias_nacido),
+        hora_nacimiento=hora(aleatorio.randint(0, 23), aleatorio.randint(0, 59), aleatorio.randint(0, 59)),
+        dado_alta='True' if dado_alta else 'False',
+        # El ID de paciente es único, así que el código también
+        codigo_qr=f'QR-{id_paciente}',
+    )
+    paciente.normalizar_campos()
+    return paciente
+
+
+def generar_pacientes(cantidad, dias=365, lote=1000, aleatorio=None, al_avanzar=None):
+    """
+    Crea `cantidad` pacientes en transacciones de `lote` filas. Devuelve
+    tuplas (pk, fecha_nacimiento) de los pacientes creados, suficiente para
+    generar su historial sin mantener los objetos en memoria.
+    """
+    aleatorio = aleatorio or random.Random()
+    creados = []
+    while len(creados) < cantidad:
+        with transaction.atomic():
+            numeros = asignador_id_paciente.reservar(min(lote, cantidad - len(creados)))
+            pacientes = [nuevo_paciente(numero, aleatorio, dias) for numero in numeros]
+            # Con un año de nacimientos cada lote toca cientos de días: es más
+            # rápido recalcular esos días una vez al final que sumar lote por lote
+            crear_pacientes_en_bloque(pacientes, batch_size=500, estadisticas=False)
+        creados.extend((paciente.pk, paciente.fecha_nacimiento) for paciente in pacientes)
+        if al_avanzar:
+            al_avanzar(len(creados))
+    if creados:
+        recalcular_dias({fecha_nacimiento for _, fecha_nacimiento in creados})
+    return creados
+
+
+def _detalles_edicion(aleatorio):
+    campo = aleatorio.choice(['peso', 'talla', 'dado_alta'])
+    modelo = Paciente._meta.get_field(campo)
+    if campo == 'dado_alta':
+        return {campo: detalle_cambio(modelo, 'False', 'True')}
+    media = PESO_MEDIA if campo == 'peso' else TALLA_MEDIA
+    antiguo = _decimal(aleatorio.gauss(media, media * 0.05))
+    nuevo = antiguo + _decimal(aleatorio.choice([-1, 1]) * aleatorio.uniform(0.01, media * 0.03))
+    return {campo: detalle_cambio(modelo, antiguo, nuevo)}
+
+
+def generar_actividades(cantidad, usuarios, pacientes, dias=365, lote=5000, aleatorio=None, al_avanzar=None):
+    """
+    Crea `cantidad` actividades repartidas entre los IDs de `usuarios` y las
+    tuplas (pk, fecha_nacimiento) de `pacientes`, entre el nacimiento de cada
+    paciente y ahora (sin salir de los últimos `dias` días).
+    """
+    aleatorio = aleatorio or random.Random()
+    tipos, pesos = zip(*PESOS_ACTIVIDAD.items())
+    ahora = timezone.now()
+    limite = ahora - timedelta(days=dias)
+    creadas = 0
+    while creadas < cantidad:
+        actividades = []
+        for _ in range(min(lote, cantidad - creadas)):
+            paciente_id, fecha_nacimiento = aleatorio.choice(pacientes)
+            inicio = max(limite, timezone.make_aware(datetime.combine(fecha_nacimiento, hora())))
+            tipo = aleatorio.choices(tipos, pesos)[0]
+            actividades.append(ActividadUsuario(
+                usuario_id=aleatorio.choice(usuarios),
+                paciente_id=paciente_id,
+                tipo_actividad=tipo,
+                fecha_hora=inicio + (ahora - inicio) * aleatorio.random(),
+                metodo_busqueda=(
+                    ('qr' if aleatorio.random() < PROPORCION_BUSQUEDA_QR else 'id') if tipo == 'busqueda' else None
+                ),
+                detalles_cambio=_detalles_edicion(aleatorio) if tipo == 'edicion' else None,
+            ))
+        ActividadUsuario.objects.bulk_create(actividades, batch_size=1000)
+        creadas += len(actividades)
+        if al_avanzar:
+            al_avanzar(creadas)
+    return creadas
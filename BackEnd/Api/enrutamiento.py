@@ -0,0 +1,133 @@
+"""
+Lecturas en una réplica de la base de datos.
+
+Las solicitudes GET, HEAD y OPTIONS leen de la réplica (alias
+BD_REPLICA_ALIAS) para que los listados, el historial de actividades y las
+exportaciones no compitan con las escrituras clínicas. Todo lo demás usa la
+base de datos principal:
+
+- las escrituras, aunque ocurran durante un GET (el registro de actividad);
+- las lecturas dentro de una transacción, que deben ver lo que escriben;
+- las solicitudes de un cliente que escribió hace menos de
+  BD_PRIMARIA_TRAS_ESCRITURA segundos, para que vea sus propios cambios
+  aunque la réplica vaya retrasada. El cliente se identifica por su
+  cabecera Authorization o su cookie de sesión, y la marca se guarda en la
+  caché compartida para que valga en todos los workers.
+
+Si BD_REPLICA_ALIAS no está en DATABASES todo va a la principal y el
+middleware no hace nada.
+"""
+import contextvars
+import hashlib
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+METODOS_LECTURA = ('GET', 'HEAD', 'OPTIONS')
+
+_leer_de_replica = contextvars.ContextVar('leer_de_replica', default=False)
+
+
+def alias_replica():
+    """Alias de la réplica, o None si no hay ninguna configurada."""
+    alias = getattr(settings, 'BD_REPLICA_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def leer_de_principal():
+    """Lee de la base de datos principal dentro del bloque."""
+    token = _leer_de_replica.set(False)
+    try:
+        yield
+    finally:
+        _leer_de_replica.reset(token)
+
+
+class EnrutadorLecturas:
+    def db_for_read(self, model, **hints):
+        if not _leer_de_replica.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias_replica()
+
+    def db_for_write(self, model, **hints):
+        # Sin esto, guardar un objeto leído de la réplica escribiría en ella
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica es una copia de la principal
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # La réplica recibe las tablas de la principal, no sus migraciones
+        if db == alias_replica():
+            return False
+        return None
+
+
+def _clave(credencial):
+    return 'bd-principal:' + hashlib.sha1(credencial.encode()).hexdigest()
+
+
+def _claves_cliente(request, response=None):
+    credenciales = [
+        request.headers.get('Authorization'),
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME),
+    ]
+    if response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+        # Sesión recién iniciada: su siguiente solicitud ya llega con ella
+        credenciales.append(response.cookies[settings.SESSION_COOKIE_NAME].value)
+    return [_clave(credencial) for credencial in credenciales if credencial]
+
+
+class LecturasReplicaMiddleware:
+    # También async: bajo ASGI no añade un paso por un hilo en cada solicitud;
+    # la caché compartida es un archivo local y se consulta directamente
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if alias_replica() is None:
+            return self.get_response(request)
+
+        token = self._antes(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _leer_de_replica.reset(token)
+        return self._despues(request, response)
+
+    async def __acall__(self, request):
+        if alias_replica() is None:
+            return await self.get_response(request)
+
+        token = self._antes(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _leer_de_replica.reset(token)
+        return self._despues(request, response)
+
+    def _antes(self, request):
+        if request.method not in METODOS_LECTURA:
+            return _leer_de_replica.set(False)
+        claves = _claves_cliente(request)
+        escribio = claves and cache.get_many(claves)
+        return _leer_de_replica.set(not escribio)
+
+    def _despues(self, request, response):
+        if request.method not in METODOS_LECTURA and response.status_code < 400:
+            claves = _claves_cliente(request, response)
+            if claves:
+                cache.set_many(dict.fromkeys(claves, True), getattr(settings, 'BD_PRIMARIA_TRAS_ESCRITURA', 5))
+        return response
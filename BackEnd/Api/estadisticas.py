@@ -0,0 +1,313 @@
+"""
+Estadísticas de nacimientos mantenidas de forma incremental.
+
+Cada paciente aporta a la fila de EstadisticaDiaria de su fecha de
+nacimiento (nacimientos, sexo, alta y sumas de peso y talla) y a un
+intervalo de peso y otro de talla en DistribucionDiaria. Al crear, editar,
+dar de alta o eliminar un paciente se resta su aporte anterior y se suma
+el nuevo, así que las consultas leen como mucho una fila por día y un
+intervalo por medida, sin importar cuántos pacientes haya.
+Las altas en bloque se suman al recibir pacientes_creados y las
+modificaciones con QuerySet.update deben llamar a registrar_modificaciones; el comando
+reconstruir_estadisticas vuelve a calcular todo desde Paciente.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DistribucionDiaria, EstadisticaDiaria, Paciente, pacientes_creados
+
+# Campos del paciente que afectan a las estadísticas
+CAMPOS_ESTADISTICA = ('fecha_nacimiento', 'sexo_bebe', 'dado_alta', 'peso', 'talla')
+
+# Intervalos de los histogramas: (mínimo, ancho, cantidad de intervalos).
+# Los valores fuera del rango se cuentan en el primer o último intervalo.
+MEDIDAS = {
+    'peso': (Decimal('0'), Decimal('0.05'), 120),  # 0 a 6 kg
+    'talla': (Decimal('0'), Decimal('0.5'), 200),  # 0 a 100 cm
+}
+
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+CAMPOS_DIA = ('nacimientos', 'masculinos', 'femeninos', 'dados_alta', 'suma_peso', 'suma_talla')
+
+
+def intervalo(medida, valor):
+    minimo, ancho, cantidad = MEDIDAS[medida]
+    return min(max(int((Decimal(valor) - minimo) // ancho), 0), cantidad - 1)
+
+
+class CambiosEstadisticas:
+    """
+    Acumula en memoria los aportes de varios pacientes y los escribe con
+    una actualización por tabla.
+    """
+    def __init__(self):
+        self.dias = defaultdict(lambda: dict.fromkeys(CAMPOS_DIA, 0))
+        self.distribuciones = defaultdict(int)
+
+    def sumar(self, valores, signo=1):
+        """Suma (signo=1) o resta (signo=-1) el aporte de un paciente."""
+        fecha = valores['fecha_nacimiento']
+        dia = self.dias[fecha]
+        dia['nacimientos'] += signo
+        dia['masculinos'] += signo if valores['sexo_bebe'] == 'M' else 0
+        dia['femeninos'] += signo if valores['sexo_bebe'] == 'F' else 0
+        dia['dados_alta'] += signo if str(valores['dado_alta']) == 'True' else 0
+        dia['suma_peso'] += signo * Decimal(valores['peso'])
+        dia['suma_talla'] += signo * Decimal(valores['talla'])
+        for medida in MEDIDAS:
+            self.distribuciones[(fecha, medida, intervalo(medida, valores[medida]))] += signo
+
+    def aplicar(self):
+        """Suma los cambios a las filas existentes y crea las que falten."""
+        dias = {}
+        for fecha, campos in self.dias.items():
+            campos = {campo: valor for campo, valor in campos.items() if valor}
+            if campos:
+                dias[(fecha,)] = campos
+        _incrementar(EstadisticaDiaria, ('fecha',), dias)
+        _incrementar(DistribucionDiaria, ('fecha', 'medida', 'intervalo'), {
+            clave: {'cantidad': cantidad}
+            for clave, cantidad in self.distribuciones.items() if cantidad
+        })
+
+    def crear(self):
+        """Inserta los acumulados en tablas vacías."""
+        EstadisticaDiaria.objects.bulk_create(
+            [EstadisticaDiaria(fecha=fecha, **campos) for fecha, campos in self.dias.items()],
+            batch_size=500
+        )
+        DistribucionDiaria.objects.bulk_create([
+            DistribucionDiaria(fecha=fecha, medida=medida, intervalo=numero, cantidad=cantidad)
+            for (fecha, medida, numero), cantidad in self.distribuciones.items() if cantidad
+        ], batch_size=500)
+
+
+# Claves por UPDATE: SQLite limita la profundidad de las expresiones
+CLAVES_POR_ACTUALIZACION = 50
+
+
+def _incrementar(modelo, campos_clave, incrementos):
+    """
+    Suma a cada fila identificada por su clave los valores indicados
+    ({clave: {campo: incremento}}) con un UPDATE por cada
+    CLAVES_POR_ACTUALIZACION claves, y crea las filas que todavía no existen.
+    """
+    if len(incrementos) > CLAVES_POR_ACTUALIZACION:
+        claves = list(incrementos)
+        for inicio in range(0, len(claves), CLAVES_POR_ACTUALIZACION):
+            _incrementar(modelo, campos_clave, {
+                clave: incrementos[clave] for clave in claves[inicio:inicio + CLAVES_POR_ACTUALIZACION]
+            })
+        return
+    if not incrementos:
+        return
+
+    def condicion(clave):
+        return Q(**dict(zip(campos_clave, clave)))
+
+    if len(incrementos) == 1:
+        # Caso habitual (un solo día): sin CASE, que es costoso de construir
+        (valores,) = incrementos.values()
+        actualizacion = {campo: F(campo) + valor for campo, valor in valores.items()}
+    else:
+        campos = {campo for valores in incrementos.values() for campo in valores}
+        actualizacion = {
+            campo: F(campo) + Case(
+                *[When(condicion(clave), then=Value(valores[campo]))
+                  for clave, valores in incrementos.items() if campo in valores],
+                default=Value(0),
+                output_field=modelo._meta.get_field(campo)
+            )
+            for campo in campos
+        }
+    filtro = reduce(or_, (condicion(clave) for clave in incrementos))
+    if modelo.objects.filter(filtro).update(**actualizacion) == len(incrementos):
+        return
+
+    existentes = set(modelo.objects.filter(filtro).values_list(*campos_clave))
+    faltantes = {clave: valores for clave, valores in incrementos.items() if clave not in existentes}
+    try:
+        with transaction.atomic():
+            modelo.objects.bulk_create([
+                modelo(**dict(zip(campos_clave, clave)), **valores) for clave, valores in faltantes.items()
+            ])
+    except IntegrityError:
+        # Otra solicitud creó alguna de las filas al mismo tiempo: sumar sobre ella
+        _incrementar(modelo, campos_clave, faltantes)
+
+
+def _valores(paciente):
+    return {campo: getattr(paciente, campo) for campo in CAMPOS_ESTADISTICA}
+
+
+def registrar_pacientes(pacientes):
+    """Suma pacientes insertados con bulk_create, que no envía post_save."""
+    cambios = CambiosEstadisticas()
+    for paciente in pacientes:
+        cambios.sumar(_valores(paciente))
+    cambios.aplicar()
+
+
+def registrar_modificaciones(pares):
+    """
+    Aplica modificaciones hechas con QuerySet.update, que no envía
+    post_save. `pares` son tuplas (valores anteriores, valores nuevos) con
+    los CAMPOS_ESTADISTICA de cada paciente.
+    """
+    cambios = CambiosEstadisticas()
+    for anteriores, nuevos in pares:
+        cambios.sumar(anteriores, -1)
+        cambios.sumar(nuevos)
+    cambios.aplicar()
+
+
+def recalcular_dias(fechas):
+    """Vuelve a calcular desde Paciente las estadísticas de las fechas dadas."""
+    fechas = set(fechas)
+    with transaction.atomic():
+        EstadisticaDiaria.objects.filter(fecha__in=fechas).delete()
+        DistribucionDiaria.objects.filter(fecha__in=fechas).delete()
+        cambios = CambiosEstadisticas()
+        for valores in Paciente.objects.filter(fecha_nacimiento__in=fechas).values(*CAMPOS_ESTADISTICA):
+            cambios.sumar(valores)
+        cambios.crear()
+
+
+def reconstruir(tamano_lote=5000):
+    """Recalcula todas las estadísticas. Devuelve (pacientes, días)."""
+    cambios = CambiosEstadisticas()
+    pacientes = 0
+    for valores in Paciente.objects.values(*CAMPOS_ESTADISTICA).iterator(chunk_size=tamano_lote):
+        cambios.sumar(valores)
+        pacientes += 1
+    with transaction.atomic():
+        EstadisticaDiaria.objects.all().delete()
+        DistribucionDiaria.objects.all().delete()
+        cambios.crear()
+    return pacientes, len(cambios.dias)
+
+
+@receiver(post_save, sender=Paciente)
+def actualizar_al_guardar(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    cambios = CambiosEstadisticas()
+    if not created:
+        if not instance.campos_modificados() & set(CAMPOS_ESTADISTICA):
+            return
+        originales = getattr(instance, '_valores_originales', None) or {}
+        if not all(campo in originales for campo in CAMPOS_ESTADISTICA):
+            # No se conoce el estado anterior: recalcular el día desde la tabla
+            recalcular_dias([instance.fecha_nacimiento])
+            return
+        cambios.sumar(originales, -1)
+    cambios.sumar(_valores(instance))
+    cambios.aplicar()
+
+
+@receiver(pacientes_creados, sender=Paciente)
+def sumar_pacientes_creados(sender, pacientes, estadisticas=True, **kwargs):
+    # Sin estadisticas el llamador recalcula los días al terminar
+    if estadisticas:
+        registrar_pacientes(pacientes)
+
+
+@receiver(post_delete, sender=Paciente)
+def actualizar_al_eliminar(sender, instance, **kwargs):
+    originales = getattr(instance, '_valores_originales', None) or {}
+    valores = originales if all(campo in originales for campo in CAMPOS_ESTADISTICA) else _valores(instance)
+    cambios = CambiosEstadisticas()
+    cambios.sumar(valores, -1)
+    cambios.aplicar()
+
+
+def resumen(desde, hasta):
+    """
+    Estadísticas de los nacidos entre `desde` y `hasta` (inclusive). Lee una
+    fila por día y un intervalo por medida; los percentiles se calculan
+    con NumPy sobre el histograma acumulado del periodo.
+    """
+    dias = list(
+        EstadisticaDiaria.objects
+        .filter(fecha__gte=desde, fecha__lte=hasta)
+        .order_by('fecha')
+        .values('fecha', *CAMPOS_DIA)
+    )
+    totales = {campo: sum(dia[campo] for dia in dias) for campo in CAMPOS_DIA}
+    nacimientos = totales['nacimientos']
+
+    filas = defaultdict(list)
+    for fila in (DistribucionDiaria.objects
+                 .filter(fecha__gte=desde, fecha__lte=hasta)
+                 .values('medida', 'intervalo')
+                 .annotate(total=Sum('cantidad'))):
+        filas[fila['medida']].append((fila['intervalo'], fila['total']))
+
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'totales': {
+            'nacimientos': nacimientos,
+            'masculinos': totales['masculinos'],
+            'femeninos': totales['femeninos'],
+            # Niños por cada 100 niñas
+            'razon_sexos': round(totales['masculinos'] * 100 / totales['femeninos'], 1) if totales['femeninos'] else None,
+            'dados_alta': totales['dados_alta'],
+            'peso_promedio': round(float(totales['suma_peso']) / nacimientos, 3) if nacimientos else None,
+            'talla_promedio': round(float(totales['suma_talla']) / nacimientos, 2) if nacimientos else None,
+        },
+        'por_dia': [
+            {campo: dia[campo] for campo in ('fecha', 'nacimientos', 'masculinos', 'femeninos', 'dados_alta')}
+            for dia in dias
+        ],
+        'peso': distribucion('peso', filas['peso']),
+        'talla': distribucion('talla', filas['talla']),
+    }
+
+
+def distribucion(medida, filas):
+    """
+    Percentiles e histograma de una medida a partir de pares
+    (intervalo, cantidad). Dentro de cada intervalo se interpola
+    linealmente, así que el error es menor que el ancho del intervalo.
+    """
+    # Importar NumPy solo al calcular, no al arrancar cada worker
+    import numpy as np
+
+    minimo, ancho, cantidad = MEDIDAS[medida]
+    minimo, ancho = float(minimo), float(ancho)
+    conteos = np.zeros(cantidad, dtype=np.int64)
+    if filas:
+        intervalos, cantidades = np.array(filas, dtype=np.int64).T
+        np.add.at(conteos, intervalos, cantidades)
+    conteos = np.clip(conteos, 0, None)
+    total = int(conteos.sum())
+    if not total:
+        return {'cantidad': 0, 'percentiles': None, 'histograma': []}
+
+    acumulado = np.cumsum(conteos)
+    objetivos = np.array(PERCENTILES) / 100 * total
+    posiciones = np.searchsorted(acumulado, objetivos, side='left')
+    anteriores = np.concatenate(([0], acumulado[:-1]))[posiciones]
+    valores = minimo + (posiciones + (objetivos - anteriores) / conteos[posiciones]) * ancho
+
+    return {
+        'cantidad': total,
+        'percentiles': {f'p{p}': round(float(valor), 2) for p, valor in zip(PERCENTILES, valores)},
+        'histograma': [
+            {
+                'desde': round(minimo + numero * ancho, 2),
+                'hasta': round(minimo + (numero + 1) * ancho, 2),
+                'cantidad': int(conteos[numero]),
+            }
+            for numero in np.flatnonzero(conteos)
+        ],
+    }
@@ -0,0 +1,94 @@
+"""
+Versiones y ETag de los pacientes para las solicitudes condicionales.
+
+Cada paciente lleva un campo `version` que Paciente.save incrementa con
+un UPDATE condicionado a la versión leída (si otra escritura se adelantó,
+lanza VersionObsoleta y las vistas responden 412 o reintentan), y la
+colección completa tiene su propia versión en la tabla Secuencia, que
+avanza con cualquier alta, modificación o eliminación. Con ellas el
+detalle y el listado generan un ETag fuerte sin leer ni serializar los
+datos: si coincide con If-None-Match se responde 304 y, en las
+modificaciones, un If-Match que no coincide se rechaza con 412.
+Las altas en bloque la avanzan al recibir pacientes_creados; las
+modificaciones con QuerySet.update deben llamar a avanzar_coleccion e
+incrementar `version` por su cuenta.
+"""
+import hashlib
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Paciente, Secuencia, pacientes_creados
+
+SECUENCIA_COLECCION = 'version_pacientes'
+
+
+def version_coleccion():
+    return Secuencia.objects.valor(SECUENCIA_COLECCION)
+
+
+def avanzar_coleccion():
+    Secuencia.objects.avanzar(SECUENCIA_COLECCION)
+
+
+def _etag(request, *partes):
+    # El formato negociado (JSON o API navegable) forma parte de la
+    # representación, así que también del ETag
+    texto = ':'.join(str(parte) for parte in (*partes, request.accepted_renderer.format))
+    return quote_etag(hashlib.sha1(texto.encode()).hexdigest()[:32])
+
+
+def etag_paciente(request, paciente):
+    return _etag(request, 'paciente', paciente.pk, paciente.version)
+
+
+def etag_listado(request, version):
+    # La ruta completa distingue la página y los parámetros del listado
+    return _etag(request, 'pacientes', version, request.get_full_path())
+
+
+def no_modificado(request, etag):
+    """True si If-None-Match incluye `etag` (comparación débil)."""
+    encabezado = request.headers.get('If-None-Match')
+    if not encabezado:
+        return False
+    etags = parse_etags(encabezado)
+    return '*' in etags or etag in (valor.removeprefix('W/') for valor in etags)
+
+
+def precondicion_fallida(request, etag):
+    """True si If-Match está presente y no incluye `etag` (comparación fuerte)."""
+    encabezado = request.headers.get('If-Match')
+    if not encabezado:
+        return False
+    etags = parse_etags(encabezado)
+    return '*' not in etags and etag not in etags
+
+
+def con_etag(respuesta, etag):
+    respuesta['ETag'] = etag
+    # El navegador puede guardar la respuesta, pero debe revalidarla siempre
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+
+def respuesta_no_modificada(etag):
+    return con_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+def respuesta_precondicion_fallida(etag):
+    return con_etag(Response(
+        {"error": "El paciente fue modificado por otra solicitud; vuelva a consultarlo antes de guardar"},
+        status=status.HTTP_412_PRECONDITION_FAILED
+    ), etag)
+
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+@receiver(pacientes_creados, sender=Paciente)
+def avanzar_al_cambiar(sender, **kwargs):
+    avanzar_coleccion()
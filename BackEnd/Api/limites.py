@@ -0,0 +1,47 @@
+"""
+Límites de solicitudes con contadores atómicos en la caché compartida.
+
+Los throttles de DRF guardan en la caché la lista de instantes de cada
+solicitud y la reescriben completa (leer, modificar, guardar), así que dos
+workers que atienden al mismo usuario a la vez pueden perder solicitudes.
+Estos cuentan por ventana fija con cache.add + cache.incr, que con el
+backend SQLite compartido es atómico entre procesos. Al empezar cada
+ventana el contador vuelve a cero, por lo que en el cambio de ventana se
+pueden aceptar hasta el doble de solicitudes seguidas.
+"""
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+
+class LimiteVentanaMixin:
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        ventana = int(self.now // self.duration)
+        self.fin_ventana = (ventana + 1) * self.duration
+        clave = f'{self.key}:{ventana}'
+        # El contador vence con su ventana (más un margen por relojes desfasados)
+        self.cache.add(clave, 0, self.duration + 60)
+        try:
+            cantidad = self.cache.incr(clave)
+        except ValueError:
+            # Se desalojó entre add e incr: esta solicitud es la primera
+            self.cache.set(clave, 1, self.duration + 60)
+            cantidad = 1
+        return cantidad <= self.num_requests
+
+    def wait(self):
+        return max(self.fin_ventana - self.now, 0)
+
+
+class UsuarioRateThrottle(LimiteVentanaMixin, UserRateThrottle):
+    pass
+
+
+class AnonimoRateThrottle(LimiteVentanaMixin, AnonRateThrottle):
+    pass
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from Api.archivo import archivar, directorio_archivo, fecha_corte
+from Api.models import ActividadUsuario
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve las actividades más antiguas que ACTIVIDADES_RETENCION_DIAS a '
+        'segmentos mensuales comprimidos, por lotes y con transacciones cortas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Días de historial que permanecen en la tabla activa')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Actividades movidas por transacción')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos de espera entre lotes para dejar pasar otras escrituras')
+        parser.add_argument('--simular', action='store_true',
+                            help='Solo informa cuántas actividades se archivarían')
+
+    def handle(self, *args, **options):
+        corte = fecha_corte(options['dias'])
+        pendientes = ActividadUsuario.objects.filter(fecha_hora__lt=corte).count()
+        self.stdout.write(f'{pendientes} actividades anteriores a {corte:%Y-%m-%d %H:%M}')
+
+        if options['simular'] or not pendientes:
+            return
+
+        def al_avanzar(total):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'  {total}/{pendientes} archivadas')
+
+        total = archivar(corte, options['lote'], options['pausa'], al_avanzar)
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} actividades archivadas en {directorio_archivo()}'
+        ))
@@ -0,0 +1,142 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from Api.benchmarks import base_datos_temporal, sembrar_datos
+from Api.models import Paciente
+
+# Se ejecuta en un proceso nuevo por medición, para partir siempre de un
+# intérprete sin nada importado. Usa la base de datos temporal del comando
+# y una caché vacía propia
+PROCESO = r'''
+import io, json, os, sys, tempfile, time
+inicio = time.perf_counter()
+argumentos = json.loads(sys.argv[1])
+
+from django.conf import settings
+settings.DATABASES['default']['NAME'] = argumentos['base_datos']
+settings.DATABASES.pop('replica', None)
+cache = tempfile.mkdtemp()
+for configuracion in settings.CACHES.values():
+    if configuracion['BACKEND'] == 'Api.cache_sqlite.CacheSQLite':
+        configuracion['LOCATION'] = os.path.join(cache, 'cache.sqlite3')
+settings.ALLOWED_HOSTS = ['testserver']
+
+import django
+django.setup(set_prefix=False)
+configurado = time.perf_counter()
+
+from django.core.handlers.wsgi import WSGIHandler
+aplicacion = WSGIHandler()
+cargado = time.perf_counter()
+
+def solicitud():
+    estado = []
+    entorno = {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': argumentos['ruta'], 'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'HTTP_HOST': 'testserver',
+        'HTTP_AUTHORIZATION': 'Token ' + argumentos['token'],
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    inicio = time.perf_counter()
+    respuesta = aplicacion(entorno, lambda s, h, e=None: estado.append(s))
+    try:
+        b''.join(respuesta)
+    finally:
+        respuesta.close()
+    return (time.perf_counter() - inicio) * 1000, int(estado[0].split()[0])
+
+primera, codigo = solicitud()
+segunda, _ = solicitud()
+print(json.dumps({
+    'setup': (configurado - inicio) * 1000,
+    'aplicacion': (cargado - configurado) * 1000,
+    'primera': primera,
+    'segunda': segunda,
+    'modulos': len(sys.modules),
+    'codigo': codigo,
+}))
+
+from Api.actividades import registro_actividades
+registro_actividades.vaciar()
+'''
+
+COLUMNAS = ('proceso', 'setup', 'aplicacion', 'primera', 'segunda')
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el arranque de un worker con cada perfil de configuración: '
+        'tiempo de django.setup() (importación de settings y apps), carga de '
+        'los middleware, primera y segunda solicitud, y módulos importados. '
+        'Cada medición usa un proceso nuevo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--perfiles', default='dev,prod',
+                            help='Módulos de BackEnd/settings/ a comparar, separados por comas')
+        parser.add_argument('--repeticiones', type=int, default=5,
+                            help='Procesos por perfil; se muestra la mediana')
+
+    def handle(self, *args, **options):
+        perfiles = [perfil.strip() for perfil in options['perfiles'].split(',') if perfil.strip()]
+        resultados = {}
+        with base_datos_temporal() as conexion:
+            usuario = sembrar_datos(pacientes=50, actividades=0, usuarios=1)[0]
+            argumentos = json.dumps({
+                'base_datos': str(conexion.settings_dict['NAME']),
+                'token': Token.objects.create(user=usuario).key,
+                'ruta': f'/api/pacientes/{Paciente.objects.first().id_paciente}/',
+            })
+            # El proceso hijo abre la misma base de datos
+            conexion.close()
+            for perfil in perfiles:
+                mediciones = [self._medir(f'BackEnd.settings.{perfil}', argumentos)
+                              for _ in range(options['repeticiones'])]
+                resultados[perfil] = {
+                    columna: statistics.median(medicion[columna] for medicion in mediciones)
+                    for columna in (*COLUMNAS, 'modulos')
+                }
+
+        self.stdout.write(f'Medianas de {options["repeticiones"]} procesos por perfil, en ms\n')
+        self.stdout.write(f'{"perfil":<10}' + ''.join(f'{columna:>12}' for columna in COLUMNAS) + f'{"módulos":>10}')
+        for perfil, valores in resultados.items():
+            self.stdout.write(
+                f'{perfil:<10}' + ''.join(f'{valores[columna]:>12.1f}' for columna in COLUMNAS)
+                + f'{valores["modulos"]:>10.0f}'
+            )
+
+        if {'dev', 'prod'} <= set(resultados):
+            def hasta_primera(valores):
+                return valores['setup'] + valores['aplicacion'] + valores['primera']
+            dev, prod = hasta_primera(resultados['dev']), hasta_primera(resultados['prod'])
+            self.stdout.write(self.style.SUCCESS(
+                f'prod responde su primera solicitud en {prod:.0f} ms frente a {dev:.0f} ms de dev '
+                f'({(1 - prod / dev):.0%} menos), con {resultados["dev"]["modulos"] - resultados["prod"]["modulos"]:.0f} '
+                f'módulos menos'
+            ))
+
+    def _medir(self, modulo, argumentos):
+        # prod exige DJANGO_SECRET_KEY; el proceso no firma nada que perdure
+        entorno = {'DJANGO_SECRET_KEY': 'benchmark-arranque', **os.environ, 'DJANGO_SETTINGS_MODULE': modulo}
+        inicio = time.perf_counter()
+        proceso = subprocess.run(
+            [sys.executable, '-c', PROCESO, argumentos],
+            cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+        )
+        duracion = (time.perf_counter() - inicio) * 1000
+        if proceso.returncode:
+            raise CommandError(f'El proceso con {modulo} falló:\n{proceso.stderr}')
+        medicion = json.loads(proceso.stdout.strip().splitlines()[-1])
+        if medicion['codigo'] != 200:
+            raise CommandError(f'La solicitud con {modulo} respondió {medicion["codigo"]}:\n{proceso.stderr}')
+        return {**medicion, 'proceso': duracion}
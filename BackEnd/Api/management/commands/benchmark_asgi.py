@@ -0,0 +1,247 @@
+import asyncio
+import io
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import path
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Api import views
+from Api.actividades import registro_actividades
+from Api.benchmarks import base_datos_temporal, sembrar_datos
+from Api.models import Paciente
+
+
+class UrlsEscaneo:
+    """Rutas del escaneo y la consulta de views.py."""
+    urlpatterns = [
+        path('api/pacientes/qr/buscar/', views.buscar_por_qr),
+        path('api/pacientes/<str:id_paciente>/', views.PacienteDetailView.as_view()),
+    ]
+
+
+ESCENARIOS = ['wsgi', 'asgi']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el rendimiento de escaneos QR y consultas concurrentes bajo '
+        'WSGI (un hilo por solicitud) y bajo ASGI. Llama a los '
+        'manejadores WSGI y ASGI de Django en el mismo proceso, con toda la '
+        'pila de middleware, sobre una base de datos temporal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrencia', type=int, default=50,
+                            help='Clientes simultáneos (hilos en WSGI, tareas en ASGI)')
+        parser.add_argument('--solicitudes', type=int, default=3000,
+                            help='Solicitudes medidas en cada escenario')
+        parser.add_argument('--pacientes', type=int, default=200)
+        parser.add_argument('--consultas', type=float, default=0.25,
+                            help='Fracción de solicitudes que consultan el detalle en vez de escanear')
+
+    def handle(self, *args, **options):
+        concurrencia = options['concurrencia']
+        with base_datos_temporal():
+            sembrar_datos(pacientes=options['pacientes'], actividades=0, usuarios=0)
+            pacientes = list(Paciente.objects.values_list('id_paciente', 'codigo_qr'))
+            # Un usuario por cliente, como en planta, para no chocar con los límites por usuario
+            tokens = [
+                str(RefreshToken.for_user(User.objects.create_user(f'cliente{n}', password='benchmark')).access_token)
+                for n in range(concurrencia)
+            ]
+
+            resultados = []
+            for servidor in ESCENARIOS:
+                carga = _Carga(pacientes, tokens, options['solicitudes'], options['consultas'])
+                with override_settings(ROOT_URLCONF=UrlsEscaneo):
+                    # Calentamiento: cachés de usuarios y de QR, conexiones
+                    self._ejecutar(servidor, carga.calentamiento(), concurrencia)
+                    resultados.append((servidor.upper(), *self._ejecutar(servidor, carga, concurrencia)))
+                registro_actividades.vaciar()
+
+        self.stdout.write(
+            f'{options["solicitudes"]} solicitudes por escenario, {concurrencia} clientes, '
+            f'{options["consultas"]:.0%} consultas de detalle\n'
+        )
+        self.stdout.write(f'{"escenario":<26}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errores":>10}')
+        for nombre, por_segundo, tiempos, errores in resultados:
+            self.stdout.write(
+                f'{nombre:<26}{por_segundo:>10.0f}{_percentil(tiempos, 50):>10.1f}'
+                f'{_percentil(tiempos, 95):>10.1f}{_percentil(tiempos, 99):>10.1f}{len(errores):>10}'
+            )
+
+        fallidos = {nombre: errores for nombre, _, _, errores in resultados if errores}
+        if fallidos:
+            raise CommandError(
+                'Hubo respuestas con error: '
+                + '; '.join(f'{nombre}: {sorted(set(errores))[:5]}' for nombre, errores in fallidos.items())
+            )
+        por_segundo = {nombre: valor for nombre, valor, _, _ in resultados}
+        self.stdout.write(self.style.SUCCESS(
+            f'ASGI: {por_segundo["ASGI"] / por_segundo["WSGI"]:.2f} veces las solicitudes por segundo de WSGI'
+        ))
+
+    def _ejecutar(self, servidor, carga, concurrencia):
+        """Devuelve (solicitudes/s, tiempos en ms, códigos de error)."""
+        if servidor == 'wsgi':
+            return _ejecutar_wsgi(carga, concurrencia)
+        return asyncio.run(_ejecutar_asgi(carga, concurrencia))
+
+
+class _Carga:
+    """Reparte las solicitudes entre los clientes: escaneos QR y consultas de detalle."""
+    def __init__(self, pacientes, tokens, solicitudes, consultas, semilla=0):
+        self.pacientes, self.tokens = pacientes, tokens
+        self.solicitudes, self.consultas = solicitudes, consultas
+        self.semilla = semilla
+
+    def calentamiento(self):
+        return _Carga(self.pacientes, self.tokens, len(self.pacientes) + len(self.tokens), self.consultas, semilla=1)
+
+    def de_cliente(self, numero, clientes):
+        """Solicitudes (método, ruta, cuerpo, token) del cliente `numero`."""
+        aleatorio = random.Random(self.semilla * 100003 + numero)
+        token = self.tokens[numero % len(self.tokens)]
+        for _ in range(self.solicitudes // clientes + (numero < self.solicitudes % clientes)):
+            id_paciente, codigo_qr = aleatorio.choice(self.pacientes)
+            if aleatorio.random() < self.consultas:
+                yield 'GET', f'/api/pacientes/{id_paciente}/', b'', token
+            else:
+                yield 'POST', '/api/pacientes/qr/buscar/', json.dumps({'codigo_qr': codigo_qr}).encode(), token
+
+
+def _ejecutar_wsgi(carga, concurrencia):
+    aplicacion = get_wsgi_application()
+    tiempos, errores = [], []
+    lock = threading.Lock()
+    barrera = threading.Barrier(concurrencia + 1)
+
+    def cliente(numero):
+        propios, fallidos = [], []
+        barrera.wait()
+        try:
+            for metodo, ruta, cuerpo, token in carga.de_cliente(numero, concurrencia):
+                estado = []
+                inicio = time.perf_counter()
+                respuesta = aplicacion(_environ(metodo, ruta, cuerpo, token), lambda s, h, e=None: estado.append(s))
+                try:
+                    b''.join(respuesta)
+                finally:
+                    respuesta.close()
+                propios.append((time.perf_counter() - inicio) * 1000)
+                codigo = int(estado[0].split()[0])
+                if codigo != 200:
+                    fallidos.append(codigo)
+        finally:
+            connections.close_all()
+        with lock:
+            tiempos.extend(propios)
+            errores.extend(fallidos)
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as hilos:
+        futuros = [hilos.submit(cliente, numero) for numero in range(concurrencia)]
+        barrera.wait()
+        inicio = time.perf_counter()
+        for futuro in futuros:
+            futuro.result()
+        duracion = time.perf_counter() - inicio
+    return len(tiempos) / duracion, tiempos, errores
+
+
+def _environ(metodo, ruta, cuerpo, token):
+    return {
+        'REQUEST_METHOD': metodo,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': ruta,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+async def _ejecutar_asgi(carga, concurrencia):
+    aplicacion = get_asgi_application()
+    tiempos, errores = [], []
+
+    async def cliente(numero):
+        for metodo, ruta, cuerpo, token in carga.de_cliente(numero, concurrencia):
+            inicio = time.perf_counter()
+            codigo = await _solicitud_asgi(aplicacion, metodo, ruta, cuerpo, token)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            if codigo != 200:
+                errores.append(codigo)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente(numero) for numero in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    # Las conexiones abiertas en el hilo de sync_to_async
+    await asyncio.to_thread(connections.close_all)
+    return len(tiempos) / duracion, tiempos, errores
+
+
+async def _solicitud_asgi(aplicacion, metodo, ruta, cuerpo, token):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': metodo,
+        'scheme': 'http',
+        'path': ruta,
+        'raw_path': ruta.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [
+            (b'host', b'testserver'),
+            (b'authorization', f'Bearer {token}'.encode()),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(cuerpo)).encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    mensajes = [{'type': 'http.request', 'body': cuerpo, 'more_body': False}]
+    desconexion = asyncio.Event()
+    estado = []
+
+    async def receive():
+        if mensajes:
+            return mensajes.pop()
+        # El cliente no se desconecta: Django cancela esta espera al responder
+        await desconexion.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(mensaje):
+        if mensaje['type'] == 'http.response.start':
+            estado.append(mensaje['status'])
+
+    await aplicacion(scope, receive, send)
+    return estado[0]
+
+
+def _percentil(tiempos, percentil):
+    return statistics.quantiles(tiempos, n=100)[percentil - 1]
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from Api.benchmarks import base_datos_temporal, datos_paciente, medir, sembrar_datos
+from Api.models import ActividadUsuario, Paciente
+
+# Pacientes con el mismo apellido en cada tamaño: el resultado de la búsqueda
+# no cambia, así que cualquier aumento de latencia viene del tamaño de las tablas
+COINCIDENCIAS = 20
+BUSQUEDA = 'gomez'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la búsqueda de actividades (?search=) con tablas de distinto '
+        'tamaño y falla si la latencia crece con el tamaño. Compara con el '
+        'filtro icontains que se usaba antes del índice de búsqueda.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', default='1000,10000,50000',
+                            help='Cantidades de pacientes a probar, separadas por comas')
+        parser.add_argument('--actividades-por-paciente', type=int, default=5)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--tolerancia', type=float, default=1.0,
+                            help='Aumento relativo permitido entre el menor y el mayor tamaño (1.0 = 100%%)')
+
+    def handle(self, *args, **options):
+        tamanos = [int(tamano) for tamano in options['tamanos'].split(',')]
+        filas = []
+        for tamano in tamanos:
+            with override_settings(ACTIVIDADES_MODO='sincrono'), base_datos_temporal():
+                filas.append((tamano, *self._medir(tamano, options)))
+
+        self.stdout.write(f'{"pacientes":>10}{"resultados":>12}{"consultas":>11}{"índice ms":>12}{"icontains ms":>14}')
+        for tamano, resultados, consultas, indice, icontains in filas:
+            self.stdout.write(f'{tamano:>10}{resultados:>12}{consultas:>11}{indice:>12.2f}{icontains:>14.2f}')
+
+        menor, mayor = filas[0][3], filas[-1][3]
+        if mayor > menor * (1 + options['tolerancia']):
+            raise CommandError(
+                f'La búsqueda no se mantiene estable: {menor:.2f} ms con {tamanos[0]} pacientes, '
+                f'{mayor:.2f} ms con {tamanos[-1]}'
+            )
+        self.stdout.write(self.style.SUCCESS('La latencia de búsqueda se mantiene estable'))
+
+    def _medir(self, tamano, options):
+        usuarios = sembrar_datos(tamano, tamano * options['actividades_por_paciente'])
+        admin = usuarios[0]
+        admin.is_staff = True
+        admin.save()
+
+        # Las madres buscadas llevan tilde; la búsqueda se hace sin ella
+        for indice in range(COINCIDENCIAS):
+            paciente = Paciente.objects.create(**datos_paciente(indice, nombre_madre=f'María Gómez {indice}'))
+            ActividadUsuario.objects.create(usuario=admin, paciente=paciente, tipo_actividad='creacion')
+
+        cliente = APIClient()
+        token, _ = Token.objects.get_or_create(user=admin)
+        cliente.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        url = f'/api/actividades/?search={BUSQUEDA}'
+
+        def buscar():
+            return cliente.get(url)
+
+        respuesta = buscar()
+        if respuesta.status_code != 200:
+            raise CommandError(f'Respuesta {respuesta.status_code}: {getattr(respuesta, "data", "")}')
+        resultados = respuesta.data['count']
+        if resultados != COINCIDENCIAS:
+            raise CommandError(f'Se esperaban {COINCIDENCIAS} resultados para "{BUSQUEDA}", hubo {resultados}')
+        with CaptureQueriesContext(connection) as capturadas:
+            buscar()
+
+        # Filtro anterior al índice, evaluado igual que la primera página del listado
+        def buscar_icontains():
+            queryset = ActividadUsuario.objects.select_related('usuario__perfil', 'paciente').filter(
+                models.Q(paciente__id_paciente__icontains=BUSQUEDA) |
+                models.Q(paciente__nombre_madre__icontains=BUSQUEDA) |
+                models.Q(paciente__documento_madre__icontains=BUSQUEDA) |
+                models.Q(usuario__username__icontains=BUSQUEDA)
+            ).order_by('-fecha_hora')
+            return queryset.count(), list(queryset[:10])
+
+        return (
+            resultados,
+            len(capturadas),
+            medir(buscar, options['repeticiones']),
+            medir(buscar_icontains, options['repeticiones']),
+        )
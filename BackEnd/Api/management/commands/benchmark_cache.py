@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.cache_sqlite import CacheSQLite
+
+# Valor de ejemplo con la forma de una entrada de la caché de QR
+VALOR = (1, {'id_paciente': 'FOSB01', 'nombre_madre': 'María Gómez Ruiz', 'peso': '3.20', 'talla': '50.00'})
+
+
+def _incrementar(crear_cache, operaciones, inicio):
+    cache = crear_cache()
+    inicio.wait()
+    for _ in range(operaciones):
+        cache.incr('contador')
+
+
+class _CrearCache:
+    """Crea la caché dentro de cada proceso (las conexiones no se heredan)."""
+    def __init__(self, backend, ubicacion):
+        self.backend, self.ubicacion = backend, ubicacion
+
+    def __call__(self):
+        if self.backend == 'sqlite':
+            return CacheSQLite(self.ubicacion, {'OPTIONS': {'TABLA': 'benchmark', 'MAX_ENTRIES': 10 ** 6}})
+        return LocMemCache(self.ubicacion, {'OPTIONS': {'MAX_ENTRIES': 10 ** 6}})
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara las operaciones por segundo de la caché SQLite compartida '
+        '(Api.cache_sqlite) con LocMemCache, y verifica que incr sea atómico '
+        'con varios procesos escribiendo a la vez.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operaciones', type=int, default=20000)
+        parser.add_argument('--procesos', type=int, default=4)
+
+    def handle(self, *args, **options):
+        operaciones = options['operaciones']
+        with tempfile.TemporaryDirectory() as directorio:
+            fabricas = {
+                'locmem': _CrearCache('locmem', 'benchmark-cache'),
+                'sqlite': _CrearCache('sqlite', os.path.join(directorio, 'cache.sqlite3')),
+            }
+            resultados = {nombre: self._medir(fabrica(), operaciones) for nombre, fabrica in fabricas.items()}
+
+            self.stdout.write(f'{"operación":<16}{"locmem ops/s":>14}{"sqlite ops/s":>14}')
+            for operacion in resultados['locmem']:
+                self.stdout.write(
+                    f'{operacion:<16}{resultados["locmem"][operacion]:>14.0f}{resultados["sqlite"][operacion]:>14.0f}'
+                )
+
+            self.stdout.write(f'\nincr desde {options["procesos"]} procesos:')
+            self.stdout.write(f'{"backend":<10}{"ops/s":>12}{"contador":>12}{"esperado":>12}')
+            errores = []
+            for nombre, fabrica in fabricas.items():
+                ops, contador, esperado = self._incr_concurrente(fabrica, operaciones // 4, options['procesos'])
+                self.stdout.write(f'{nombre:<10}{ops:>12.0f}{contador:>12}{esperado:>12}')
+                if nombre == 'sqlite' and contador != esperado:
+                    errores.append(f'sqlite perdió incrementos: {contador} de {esperado}')
+
+        if errores:
+            raise CommandError('\n'.join(errores))
+        self.stdout.write(self.style.SUCCESS(
+            'La caché SQLite comparte el contador entre procesos sin perder incrementos '
+            '(LocMemCache solo ve los de su propio proceso)'
+        ))
+
+    def _medir(self, cache, operaciones):
+        claves = [f'clave:{numero}' for numero in range(1000)]
+        cache.set_many({clave: VALOR for clave in claves}, None)
+        cache.set('contador', 0, None)
+        pruebas = {
+            'get': lambda numero: cache.get(claves[numero % 1000]),
+            'get_many (10)': lambda numero: cache.get_many(claves[numero % 990:numero % 990 + 10]),
+            'set': lambda numero: cache.set(claves[numero % 1000], VALOR, 300),
+            'add (existente)': lambda numero: cache.add(claves[numero % 1000], VALOR, 300),
+            'incr': lambda numero: cache.incr('contador'),
+            'delete': lambda numero: cache.delete(f'inexistente:{numero}'),
+        }
+        resultados = {}
+        for nombre, operacion in pruebas.items():
+            inicio = time.perf_counter()
+            for numero in range(operaciones):
+                operacion(numero)
+            resultados[nombre] = operaciones / (time.perf_counter() - inicio)
+        return resultados
+
+    def _incr_concurrente(self, fabrica, operaciones, procesos):
+        """Devuelve (ops/s totales, contador final visto por este proceso, esperado)."""
+        cache = fabrica()
+        cache.set('contador', 0, None)
+        contexto = multiprocessing.get_context('fork')
+        inicio = contexto.Event()
+        hijos = [
+            contexto.Process(target=_incrementar, args=(fabrica, operaciones, inicio))
+            for _ in range(procesos)
+        ]
+        for hijo in hijos:
+            hijo.start()
+        comienzo = time.perf_counter()
+        inicio.set()
+        for hijo in hijos:
+            hijo.join()
+        duracion = time.perf_counter() - comienzo
+        if any(hijo.exitcode for hijo in hijos):
+            raise CommandError('Un proceso del benchmark terminó con error')
+        return operaciones * procesos / duracion, cache.get('contador'), operaciones * procesos
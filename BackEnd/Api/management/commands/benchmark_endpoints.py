@@ -0,0 +1,258 @@
+import itertools
+import json
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from Api.benchmarks import base_datos_temporal, datos_paciente, medir, sembrar_datos
+from Api.autenticacion import cache_usuarios
+from Api.cache_qr import indice_qr
+from Api.models import Paciente
+
+
+class CapturaConsultas(ExitStack):
+    """Captura las consultas de todas las conexiones (principal y réplica)."""
+    def __enter__(self):
+        super().__enter__()
+        self.contextos = [self.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        return self
+
+    @property
+    def captured_queries(self):
+        return [consulta for contexto in self.contextos for consulta in contexto.captured_queries]
+
+    def __len__(self):
+        return sum(len(contexto) for contexto in self.contextos)
+
+# Consultas SQL por solicitud en cada endpoint, con el usuario autenticado
+# ya en caché (usuario_actual_sin_cache mide la autenticación por token sin
+# ella). Este comando falla si se superan y Api/tests.py si cambian. Los
+# endpoints con varias variantes (por ejemplo, distintos tamaños de página)
+# deben usar las mismas consultas en todas.
+PRESUPUESTOS = {
+    'pacientes_listar': 3,
+    'pacientes_listar_304': 1,
+    'pacientes_crear': 13,
+    'pacientes_lote': 13,
+    'pacientes_buscar': 1,
+    'paciente_detalle': 2,
+    'paciente_detalle_304': 2,
+    'paciente_editar': 8,
+    'paciente_sin_cambios': 1,
+    'qr_buscar': 2,
+    'qr_buscar_lote': 4,
+    'qr_cache': 0,
+    'alta_actualizar': 1,
+    'alta_cambiar': 7,
+    'alta_lote': 7,
+    'actividades_listar': 2,
+    'actividades_listar_admin': 2,
+    'actividades_cursor': 1,
+    'estadisticas': 2,
+    'usuario_actual': 0,
+    'usuario_actual_sin_cache': 1,
+    'login_token': 3,
+}
+
+BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'endpoints.json'
+
+
+def casos_endpoints(admin, enfermero):
+    """
+    Variantes de solicitud de cada endpoint de PRESUPUESTOS, hechas por
+    `enfermero` o, las que requieren staff, por `admin`. Las comparten este
+    comando y las pruebas de Api/tests.py.
+    """
+    admin_cliente = cliente_con_token(admin)
+    cliente = cliente_con_token(enfermero)
+    paciente = Paciente.objects.order_by('pk').first()
+    codigos_qr = list(Paciente.objects.values_list('codigo_qr', flat=True)[:30]) + ['NO-EXISTE']
+    contador = itertools.count(10 ** 6)
+
+    def crear():
+        return cliente.post('/api/pacientes/', datos_paciente(next(contador)), format='json')
+
+    def crear_lote(cantidad):
+        lote = [datos_paciente(next(contador)) for _ in range(cantidad)]
+        return cliente.post('/api/pacientes/lote/', lote, format='json')
+
+    def editar():
+        talla = '50.00' if next(contador) % 2 else '51.00'
+        return cliente.patch(f'/api/pacientes/{paciente.id_paciente}/', {'talla': talla}, format='json')
+
+    def buscar_qr():
+        # Se mide el camino sin caché, que es el que consulta la base de datos
+        indice_qr.limpiar()
+        return cliente.post('/api/pacientes/qr/buscar/', {'codigo_qr': paciente.codigo_qr}, format='json')
+
+    def buscar_qr_lote(cantidad):
+        indice_qr.limpiar()
+        return cliente.post('/api/pacientes/qr/buscar-lote/',
+                            {'codigos_qr': codigos_qr[-cantidad:]}, format='json')
+
+    def alta_cambiar():
+        # Alterna el estado para que cada llamada escriba
+        estado = 'True' if next(contador) % 2 else 'False'
+        return cliente.put(f'/api/pacientes/{paciente.id_paciente}/alta/', {'dado_alta': estado}, format='json')
+
+    ids_alta = list(Paciente.objects.order_by('-pk').values_list('id_paciente', flat=True)[:20])
+
+    def alta_lote():
+        # Alterna el estado para que cada llamada actualice los 20 pacientes
+        estado = 'True' if next(contador) % 2 else 'False'
+        return cliente.post('/api/pacientes/alta/lote/',
+                            {'pacientes': ids_alta, 'dado_alta': estado}, format='json')
+
+    def no_modificado(url):
+        # Repite la consulta con el ETag recibido: se mide la respuesta 304
+        etag = cliente.get(url)['ETag']
+
+        def variante():
+            respuesta = cliente.get(url, HTTP_IF_NONE_MATCH=etag)
+            if respuesta.status_code != 304:
+                raise CommandError(f'{url}: se esperaba 304 y se obtuvo {respuesta.status_code}')
+            return respuesta
+        return variante
+
+    def usuario_sin_cache():
+        cache_usuarios.limpiar()
+        return cliente.get('/api/auth/users/me/')
+
+    def login():
+        return APIClient().post('/api/auth/token/login/',
+                                {'username': enfermero.username, 'password': 'benchmark'}, format='json')
+
+    return {
+        'pacientes_listar': [lambda: cliente.get('/api/pacientes/'),
+                             lambda: cliente.get('/api/pacientes/?page=5')],
+        'pacientes_listar_304': [no_modificado('/api/pacientes/?page=5')],
+        'pacientes_crear': [crear],
+        'pacientes_lote': [lambda: crear_lote(2), lambda: crear_lote(20)],
+        'pacientes_buscar': [lambda: cliente.get('/api/pacientes/buscar/?q=madre num'),
+                             lambda: cliente.get(f'/api/pacientes/buscar/?q={paciente.documento_madre}')],
+        'paciente_detalle': [lambda: cliente.get(f'/api/pacientes/{paciente.id_paciente}/')],
+        'paciente_detalle_304': [no_modificado(f'/api/pacientes/{paciente.id_paciente}/')],
+        'paciente_editar': [editar],
+        'paciente_sin_cambios': [lambda: cliente.patch(f'/api/pacientes/{paciente.id_paciente}/',
+                                                       {'documento_madre': paciente.documento_madre},
+                                                       format='json')],
+        'qr_buscar': [buscar_qr],
+        'qr_buscar_lote': [lambda: buscar_qr_lote(3), lambda: buscar_qr_lote(30)],
+        'qr_cache': [lambda: admin_cliente.get('/api/pacientes/qr/cache/')],
+        'alta_actualizar': [lambda: cliente.put(f'/api/pacientes/{paciente.id_paciente}/alta/',
+                                                {'dado_alta': 'True'}, format='json')],
+        'alta_cambiar': [alta_cambiar],
+        'alta_lote': [alta_lote],
+        'actividades_listar': [lambda: cliente.get('/api/actividades/?page_size=10'),
+                               lambda: cliente.get('/api/actividades/?page_size=100')],
+        'actividades_listar_admin': [lambda: admin_cliente.get('/api/actividades/?page_size=10'),
+                                     lambda: admin_cliente.get('/api/actividades/?page_size=100'),
+                                     lambda: admin_cliente.get('/api/actividades/?search=Madre&page_size=100')],
+        'actividades_cursor': [lambda: admin_cliente.get('/api/actividades/?paginacion=cursor&page_size=10'),
+                               lambda: admin_cliente.get('/api/actividades/?paginacion=cursor&page_size=100')],
+        'estadisticas': [lambda: cliente.get('/api/estadisticas/'),
+                         lambda: cliente.get('/api/estadisticas/?fecha_desde=2000-01-01')],
+        'usuario_actual': [lambda: cliente.get('/api/auth/users/me/')],
+        'usuario_actual_sin_cache': [usuario_sin_cache],
+        'login_token': [login],
+    }
+
+
+def cliente_con_token(usuario):
+    cliente = APIClient()
+    token, _ = Token.objects.get_or_create(user=usuario)
+    cliente.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return cliente
+
+
+class Command(BaseCommand):
+    help = (
+        'Siembra un conjunto de datos realista en una base de datos temporal, '
+        'recorre las rutas de Api/urls.py y falla si alguna supera su presupuesto '
+        'de consultas o se vuelve más lenta que la línea base guardada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=500)
+        parser.add_argument('--actividades', type=int, default=5000)
+        parser.add_argument('--repeticiones', type=int, default=20,
+                            help='Solicitudes por endpoint para calcular la mediana')
+        parser.add_argument('--baseline', default=str(BASELINE),
+                            help='Archivo JSON con los tiempos de referencia')
+        parser.add_argument('--guardar-baseline', action='store_true',
+                            help='Guarda los tiempos medidos como nueva línea base')
+        parser.add_argument('--tolerancia', type=float, default=0.5,
+                            help='Aumento relativo permitido sobre la línea base (0.5 = 50%%)')
+
+    def handle(self, *args, **options):
+        with override_settings(ACTIVIDADES_MODO='sincrono'), base_datos_temporal():
+            usuarios = sembrar_datos(options['pacientes'], options['actividades'])
+            usuarios[0].is_staff = True
+            usuarios[0].save()
+            resultados = self._medir(usuarios, options['repeticiones'], options['verbosity'])
+
+        ruta_baseline = Path(options['baseline'])
+        baseline = json.loads(ruta_baseline.read_text()) if ruta_baseline.exists() else {}
+        errores = []
+
+        self.stdout.write(f'{"endpoint":<26}{"consultas":>10}{"ms":>10}{"baseline":>10}')
+        for nombre, resultado in resultados.items():
+            consultas = max(resultado['consultas'])
+            referencia = baseline.get(nombre)
+            self.stdout.write(
+                f'{nombre:<26}{consultas:>10}{resultado["ms"]:>10.2f}'
+                f'{referencia if referencia is not None else "-":>10}'
+            )
+
+            if len(set(resultado['consultas'])) > 1:
+                errores.append(f'{nombre}: las consultas varían entre variantes {resultado["consultas"]}')
+            if consultas > PRESUPUESTOS[nombre]:
+                errores.append(f'{nombre}: {consultas} consultas, presupuesto {PRESUPUESTOS[nombre]}')
+            if (not options['guardar_baseline'] and referencia is not None
+                    and resultado['ms'] > referencia * (1 + options['tolerancia'])):
+                errores.append(f'{nombre}: {resultado["ms"]:.2f} ms, línea base {referencia} ms')
+
+        if options['guardar_baseline']:
+            tiempos = {nombre: round(resultado['ms'], 3) for nombre, resultado in resultados.items()}
+            ruta_baseline.parent.mkdir(parents=True, exist_ok=True)
+            ruta_baseline.write_text(json.dumps(tiempos, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f'Línea base guardada en {ruta_baseline}')
+
+        if errores:
+            raise CommandError('Regresiones de rendimiento:\n' + '\n'.join(errores))
+        self.stdout.write(self.style.SUCCESS('Todos los endpoints están dentro de su presupuesto'))
+
+    def _medir(self, usuarios, repeticiones, verbosidad):
+        """
+        Mide cada endpoint con sus variantes y devuelve, por endpoint, las
+        consultas de cada variante y la mediana en ms de la última.
+        """
+        casos = casos_endpoints(usuarios[0], usuarios[1])
+        resultados = {}
+        for nombre, variantes in casos.items():
+            consultas = []
+            for variante in variantes:
+                # Calentamiento: dos llamadas, para que las que alternan valores
+                # (editar) ya encuentren creadas sus filas de estadísticas
+                variante()
+                variante()
+                with CapturaConsultas() as capturadas:
+                    respuesta = variante()
+                if respuesta.status_code >= 400:
+                    raise CommandError(f'{nombre}: respuesta {respuesta.status_code} {getattr(respuesta, "data", "")}')
+                consultas.append(len(capturadas))
+                if verbosidad >= 2:
+                    self.stdout.write(f'-- {nombre}: {len(capturadas)} consultas')
+                    for consulta in capturadas.captured_queries:
+                        self.stdout.write(f'   {consulta["sql"][:160]}')
+            resultados[nombre] = {
+                'consultas': consultas,
+                'ms': medir(variantes[-1], repeticiones),
+            }
+        return resultados
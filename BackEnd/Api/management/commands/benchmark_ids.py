@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from Api.benchmarks import base_datos_temporal, datos_paciente
+from Api.models import Paciente
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de concurrencia de la asignación de IDs: lanza registros '
+        'simultáneos contra PacienteListCreateView en una base de datos '
+        'temporal y verifica que no haya colisiones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8,
+                            help='Número de hilos que registran pacientes a la vez')
+        parser.add_argument('--por-hilo', type=int, default=25,
+                            help='Pacientes registrados por cada hilo')
+        parser.add_argument('--bloque', type=int, default=None,
+                            help='Sobrescribe ID_PACIENTE_BLOQUE durante la prueba')
+
+    def handle(self, *args, **options):
+        ajustes = {}
+        if options['bloque']:
+            ajustes['ID_PACIENTE_BLOQUE'] = options['bloque']
+
+        with override_settings(**ajustes), base_datos_temporal():
+            usuario = User.objects.create_user('benchmark', password='benchmark')
+            resultados = self._ejecutar(usuario, options['hilos'], options['por_hilo'])
+
+            ids = [id_paciente for codigo, id_paciente in resultados['respuestas'] if codigo == 201]
+            fallos = [codigo for codigo, _ in resultados['respuestas'] if codigo != 201]
+            duplicados = [id_paciente for id_paciente, veces in Counter(ids).items() if veces > 1]
+            total_bd = Paciente.objects.count()
+
+        total = options['hilos'] * options['por_hilo']
+        self.stdout.write(
+            f'{total} registros en {resultados["duracion"]:.2f}s '
+            f'({total / resultados["duracion"]:.1f} registros/s), '
+            f'{len(fallos)} fallidos, {len(duplicados)} IDs duplicados, '
+            f'{total_bd} pacientes en la base de datos'
+        )
+        if fallos or duplicados or total_bd != total:
+            raise CommandError(
+                f'Se detectaron colisiones: códigos de error {Counter(fallos)}, '
+                f'IDs duplicados {duplicados[:10]}'
+            )
+        self.stdout.write(self.style.SUCCESS('Sin colisiones en la asignación de IDs'))
+
+    def _ejecutar(self, usuario, hilos, por_hilo):
+        respuestas = []
+        lock = threading.Lock()
+        barrera = threading.Barrier(hilos)
+
+        def trabajador(numero_hilo):
+            cliente = APIClient(raise_request_exception=False)
+            cliente.force_authenticate(user=usuario)
+            barrera.wait()
+            try:
+                for i in range(por_hilo):
+                    indice = numero_hilo * por_hilo + i
+                    respuesta = cliente.post('/api/pacientes/', datos_paciente(indice), format='json')
+                    with lock:
+                        datos = getattr(respuesta, 'data', None) or {}
+                        respuestas.append((respuesta.status_code, datos.get('id_paciente')))
+            finally:
+                connection.close()
+
+        trabajadores = [threading.Thread(target=trabajador, args=(n,)) for n in range(hilos)]
+        inicio = time.perf_counter()
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+        return {'respuestas': respuestas, 'duracion': time.perf_counter() - inicio}
@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from Api.benchmarks import base_datos_temporal, medir, sembrar_datos
+from Api.views import PacienteListCreateView
+
+MODOS = {'serializador': False, 'rapido': True}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara las filas por segundo del listado de pacientes con '
+        'PacienteListSerializer y con la lectura por tuplas '
+        '(PACIENTES_LISTADO_RAPIDO), y verifica que ambas respuestas sean '
+        'idénticas byte a byte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=5000)
+        parser.add_argument('--tamanos-pagina', default='3,100,1000',
+                            help='Tamaños de página a medir, separados por comas')
+        parser.add_argument('--repeticiones', type=int, default=20)
+
+    def handle(self, *args, **options):
+        tamanos = [int(tamano) for tamano in options['tamanos_pagina'].split(',')]
+        with base_datos_temporal():
+            sembrar_datos(options['pacientes'], 0, usuarios=1)
+            usuario = User.objects.get()
+            filas = [self._medir(usuario, tamano, options['repeticiones']) for tamano in tamanos]
+
+        self.stdout.write(f'{"página":>8}{"serializador filas/s":>22}{"rápido filas/s":>16}{"mejora":>9}')
+        for tamano, tiempos in zip(tamanos, filas):
+            lento, rapido = (tamano / (tiempos[modo] / 1000) for modo in MODOS)
+            self.stdout.write(f'{tamano:>8}{lento:>22.0f}{rapido:>16.0f}{rapido / lento:>8.1f}x')
+        self.stdout.write(self.style.SUCCESS('Las respuestas de ambos modos son idénticas'))
+
+    def _medir(self, usuario, tamano_pagina, repeticiones):
+        """
+        Devuelve la mediana en ms de cada modo para una página de
+        `tamano_pagina` filas (incluida la codificación a JSON).
+        """
+        paginacion = type('Paginacion', (PageNumberPagination,), {'page_size': tamano_pagina})
+        vista = PacienteListCreateView.as_view(pagination_class=paginacion)
+        fabrica = APIRequestFactory()
+
+        def listar():
+            solicitud = fabrica.get('/api/pacientes/', {'page': 2}, HTTP_ACCEPT='application/json')
+            force_authenticate(solicitud, user=usuario)
+            respuesta = vista(solicitud)
+            respuesta.render()
+            return respuesta
+
+        contenidos, tiempos = {}, {}
+        for modo, rapido in MODOS.items():
+            with override_settings(PACIENTES_LISTADO_RAPIDO=rapido):
+                contenidos[modo] = listar().content
+                tiempos[modo] = medir(listar, repeticiones)
+
+        if contenidos['serializador'] != contenidos['rapido']:
+            raise CommandError(
+                f'Las respuestas difieren con páginas de {tamano_pagina}:\n'
+                f'serializador: {contenidos["serializador"][:300]!r}\n'
+                f'rápido:       {contenidos["rapido"][:300]!r}'
+            )
+        return tiempos
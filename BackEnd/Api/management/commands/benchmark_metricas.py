@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from Api.benchmarks import base_datos_temporal, sembrar_datos
+from Api.models import Paciente
+
+MIDDLEWARE_METRICAS = 'Api.metricas.MetricasMiddleware'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide cuánto tiempo añade MetricasMiddleware (Server-Timing e '
+        'histogramas de /api/metrics/) a las rutas más usadas, comparando las '
+        'mismas solicitudes con y sin el middleware.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=300,
+                            help='Solicitudes por ruta y variante')
+        parser.add_argument('--maximo-us', type=float, default=250,
+                            help='Sobrecosto máximo permitido por solicitud, en microsegundos')
+
+    def handle(self, *args, **options):
+        if MIDDLEWARE_METRICAS not in settings.MIDDLEWARE:
+            raise CommandError(f'{MIDDLEWARE_METRICAS} no está en MIDDLEWARE')
+        sin_metricas = [clase for clase in settings.MIDDLEWARE if clase != MIDDLEWARE_METRICAS]
+
+        with base_datos_temporal():
+            usuario = sembrar_datos(pacientes=500, actividades=2000, usuarios=1)[0]
+            token = Token.objects.create(user=usuario).key
+            paciente = Paciente.objects.first()
+            casos = {
+                'qr_buscar': lambda c: c.post('/api/pacientes/qr/buscar/', {'codigo_qr': paciente.codigo_qr}, format='json'),
+                'paciente_detalle': lambda c: c.get(f'/api/pacientes/{paciente.id_paciente}/'),
+                'pacientes_listar': lambda c: c.get('/api/pacientes/?page_size=50'),
+                'actividades_listar': lambda c: c.get('/api/actividades/'),
+            }
+
+            clientes = {}
+            for variante, middleware in (('con', settings.MIDDLEWARE), ('sin', sin_metricas)):
+                with override_settings(MIDDLEWARE=middleware):
+                    cliente = APIClient()
+                    cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+                    # La primera solicitud carga la cadena de middleware
+                    for solicitud in casos.values():
+                        solicitud(cliente)
+                clientes[variante] = cliente
+
+            resultados = {nombre: {'con': [], 'sin': []} for nombre in casos}
+            # Intercalar las variantes, alternando cuál va primero, reparte el
+            # ruido entre ambas
+            orden = list(clientes.items())
+            for _ in range(options['repeticiones']):
+                orden.reverse()
+                for nombre, solicitud in casos.items():
+                    for variante, cliente in orden:
+                        inicio = time.perf_counter()
+                        respuesta = solicitud(cliente)
+                        resultados[nombre][variante].append((time.perf_counter() - inicio) * 1e6)
+                        if respuesta.status_code != 200:
+                            raise CommandError(f'{nombre} respondió {respuesta.status_code}')
+
+        self.stdout.write(f'{"ruta":<22}{"sin (µs)":>12}{"con (µs)":>12}{"sobrecosto":>12}')
+        excedidos = []
+        for nombre, tiempos in resultados.items():
+            sin, con = statistics.median(tiempos['sin']), statistics.median(tiempos['con'])
+            self.stdout.write(f'{nombre:<22}{sin:>12.0f}{con:>12.0f}{con - sin:>10.0f}µs')
+            if con - sin > options['maximo_us']:
+                excedidos.append(f'{nombre}: {con - sin:.0f}µs')
+
+        if excedidos:
+            raise CommandError(
+                f'Las métricas añaden más de {options["maximo_us"]:.0f}µs por solicitud: ' + ', '.join(excedidos)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'MetricasMiddleware añade menos de {options["maximo_us"]:.0f}µs por solicitud'
+        ))
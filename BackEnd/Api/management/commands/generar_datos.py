@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.datos_sinteticos import generar_actividades, generar_pacientes, generar_usuarios
+from Api.models import Paciente
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera usuarios, pacientes y un historial de actividades sintéticos '
+        'en la base de datos configurada, con inserciones en bloque, para '
+        'probar el rendimiento con volúmenes realistas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=20,
+                            help='Usuarios a crear, con su perfil')
+        parser.add_argument('--pacientes', type=int, default=10000,
+                            help='Pacientes a crear')
+        parser.add_argument('--actividades', type=int, default=100000,
+                            help='Actividades a crear en el historial')
+        parser.add_argument('--dias', type=int, default=365,
+                            help='Días hacia atrás en que se reparten nacimientos y actividades')
+        parser.add_argument('--prefijo', default='carga',
+                            help='Prefijo de los nombres de usuario ({prefijo}0, {prefijo}1, ...)')
+        parser.add_argument('--password', default='carga',
+                            help='Contraseña de los usuarios creados')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Pacientes insertados por transacción')
+        parser.add_argument('--semilla', type=int, default=None,
+                            help='Semilla para generar siempre los mismos datos')
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(options['semilla'])
+        inicio = time.perf_counter()
+
+        usuarios = generar_usuarios(options['usuarios'], options['prefijo'], options['password'], aleatorio)
+        self.stdout.write(f'{len(usuarios)} usuarios creados')
+        ids_usuarios = [usuario.pk for usuario in usuarios] or list(
+            User.objects.filter(username__startswith=options['prefijo']).values_list('pk', flat=True)
+        )
+
+        def avance(nombre, total):
+            def al_avanzar(creados):
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'  {creados}/{total} {nombre}')
+            return al_avanzar
+
+        pacientes = generar_pacientes(
+            options['pacientes'], options['dias'], options['lote'], aleatorio,
+            avance('pacientes', options['pacientes'])
+        )
+        self.stdout.write(f'{len(pacientes)} pacientes creados')
+
+        if options['actividades']:
+            # Sin pacientes nuevos, el historial se reparte entre los existentes
+            pacientes = pacientes or list(Paciente.objects.values_list('pk', 'fecha_nacimiento'))
+            if not ids_usuarios or not pacientes:
+                raise CommandError('Se necesitan usuarios y pacientes para generar actividades')
+            actividades = generar_actividades(
+                options['actividades'], ids_usuarios, pacientes, options['dias'],
+                aleatorio=aleatorio, al_avanzar=avance('actividades', options['actividades'])
+            )
+            self.stdout.write(f'{actividades} actividades creadas')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Datos generados en {time.perf_counter() - inicio:.1f}s'
+        ))
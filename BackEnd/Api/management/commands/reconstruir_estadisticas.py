@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from Api.estadisticas import recalcular_dias, reconstruir
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula desde la tabla de pacientes las estadísticas diarias de '
+        'nacimientos (por ejemplo, después de cargar datos sin pasar por los modelos).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', action='append', default=[],
+                            help='Recalcula solo esta fecha de nacimiento (YYYY-MM-DD); se puede repetir')
+        parser.add_argument('--lote', type=int, default=5000,
+                            help='Pacientes leídos por consulta')
+
+    def handle(self, *args, **options):
+        if options['fecha']:
+            fechas = [parse_date(fecha) for fecha in options['fecha']]
+            recalcular_dias(fechas)
+            self.stdout.write(self.style.SUCCESS(f'Estadísticas recalculadas para {len(fechas)} fechas'))
+            return
+
+        pacientes, dias = reconstruir(options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Estadísticas reconstruidas: {pacientes} pacientes en {dias} días'
+        ))
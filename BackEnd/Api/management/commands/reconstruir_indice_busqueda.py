@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from Api.busqueda import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = (
+        'Vuelve a generar el índice de búsqueda de pacientes y usuarios, por '
+        'ejemplo después de cargar datos sin pasar por los modelos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Objetos indexados por transacción')
+
+    def handle(self, *args, **options):
+        pacientes, usuarios = reconstruir_indice(options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice de búsqueda reconstruido: {pacientes} pacientes y {usuarios} usuarios'
+        ))
@@ -0,0 +1,277 @@
+import http.client
+import json
+import random
+import ssl
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from Api.models import Paciente
+
+# Peso de cada tipo de solicitud en la mezcla por omisión: sobre todo
+# escaneos QR, como en planta
+MEZCLA = 'qr=55,detalle=25,actividades=15,editar=5'
+TIPOS = ('qr', 'detalle', 'actividades', 'editar')
+# Páginas del historial que se recorren al consultar actividades
+PAGINAS_ACTIVIDADES = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Reproduce contra un servidor en marcha una mezcla de escaneos QR, '
+        'consultas de detalle, ediciones y consultas del historial con varios '
+        'trabajadores concurrentes, y muestra las solicitudes por segundo y '
+        'las latencias p50/p95/p99 de cada ruta. Los usuarios y pacientes se '
+        'leen de la base de datos configurada (ver generar_datos), que debe '
+        'ser la misma que usa el servidor. Las ediciones cambian el peso de los '
+        'pacientes: úsese solo sobre datos generados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Dirección del servidor')
+        parser.add_argument('--trabajadores', type=int, default=8,
+                            help='Trabajadores concurrentes, cada uno con su conexión')
+        parser.add_argument('--solicitudes', type=int, default=2000,
+                            help='Solicitudes medidas en total')
+        parser.add_argument('--calentamiento', type=int, default=20,
+                            help='Solicitudes sin medir por trabajador antes de empezar')
+        parser.add_argument('--mezcla', default=MEZCLA,
+                            help=f'Pesos de cada tipo de solicitud ({", ".join(TIPOS)})')
+        parser.add_argument('--prefijo', default='carga',
+                            help='Prefijo de los usuarios con que se inicia sesión')
+        parser.add_argument('--password', default='carga',
+                            help='Contraseña de esos usuarios')
+        parser.add_argument('--muestra', type=int, default=5000,
+                            help='Pacientes sobre los que se reparten las solicitudes')
+        parser.add_argument('--semilla', type=int, default=None,
+                            help='Semilla para repetir la misma secuencia de solicitudes')
+        parser.add_argument('--inseguro', action='store_true',
+                            help='No verificar el certificado HTTPS (certificados propios)')
+        parser.add_argument('--sin-keepalive', action='store_true',
+                            help='Abrir una conexión por solicitud. runserver envía la respuesta en '
+                                 'dos escrituras y en conexiones reutilizadas cada solicitud espera '
+                                 'unos 40 ms el ACK retardado de TCP')
+
+    def handle(self, *args, **options):
+        mezcla = _leer_mezcla(options['mezcla'])
+        trabajadores = options['trabajadores']
+        if trabajadores < 1 or options['solicitudes'] < 1:
+            raise CommandError('--trabajadores y --solicitudes deben ser mayores que cero')
+
+        usernames = list(
+            User.objects.filter(username__startswith=options['prefijo'], is_active=True)
+            .order_by('pk').values_list('username', flat=True)[:trabajadores]
+        )
+        pacientes = list(Paciente.objects.values_list('id_paciente', 'codigo_qr', 'peso'))
+        if not usernames or not pacientes:
+            raise CommandError(
+                f'No hay usuarios "{options["prefijo"]}*" o pacientes: genérelos con python manage.py generar_datos'
+            )
+        aleatorio = random.Random(options['semilla'])
+        if len(pacientes) > options['muestra']:
+            pacientes = aleatorio.sample(pacientes, options['muestra'])
+
+        servidor = _Servidor(options['url'], options['inseguro'], not options['sin_keepalive'])
+        # Un usuario por trabajador, como en planta, para no chocar con los límites por usuario
+        tokens = {username: servidor.iniciar_sesion(username, options['password']) for username in usernames}
+
+        tiempos = defaultdict(list)
+        errores = defaultdict(Counter)
+        lock = threading.Lock()
+        barrera = threading.Barrier(trabajadores + 1)
+
+        semillas = [aleatorio.random() for _ in range(trabajadores)]
+
+        def trabajador(numero):
+            conexion = servidor.conectar()
+            generador = _Solicitudes(pacientes, mezcla, random.Random(semillas[numero]))
+            token = tokens[usernames[numero % len(usernames)]]
+            propios, fallidos = defaultdict(list), defaultdict(Counter)
+            cantidad = options['solicitudes'] // trabajadores + (numero < options['solicitudes'] % trabajadores)
+            try:
+                for _ in range(options['calentamiento']):
+                    conexion.enviar(*generador.siguiente()[1:], token)
+                barrera.wait()
+                for _ in range(cantidad):
+                    ruta, *solicitud = generador.siguiente()
+                    inicio = time.perf_counter()
+                    codigo = conexion.enviar(*solicitud, token)
+                    propios[ruta].append((time.perf_counter() - inicio) * 1000)
+                    if codigo >= 400:
+                        fallidos[ruta][codigo] += 1
+            except BaseException:
+                barrera.abort()
+                raise
+            finally:
+                conexion.cerrar()
+            with lock:
+                for ruta, valores in propios.items():
+                    tiempos[ruta].extend(valores)
+                for ruta, codigos in fallidos.items():
+                    errores[ruta].update(codigos)
+
+        with ThreadPoolExecutor(max_workers=trabajadores) as hilos:
+            futuros = [hilos.submit(trabajador, numero) for numero in range(trabajadores)]
+            try:
+                barrera.wait()
+            except threading.BrokenBarrierError:
+                pass
+            inicio = time.perf_counter()
+            for futuro in futuros:
+                futuro.result()
+            duracion = time.perf_counter() - inicio
+
+        self.stdout.write(
+            f'{options["solicitudes"]} solicitudes contra {options["url"]} con {trabajadores} trabajadores '
+            f'en {duracion:.1f}s\n'
+        )
+        self.stdout.write(
+            f'{"ruta":<28}{"solicitudes":>12}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"errores":>9}'
+        )
+        todos = []
+        for ruta, valores in sorted(tiempos.items()):
+            todos.extend(valores)
+            self._fila(ruta, valores, duracion, sum(errores.get(ruta, {}).values()))
+        self._fila('total', todos, duracion, sum(sum(codigos.values()) for codigos in errores.values()))
+
+        if errores:
+            self.stdout.write(self.style.WARNING(
+                'Respuestas con error: ' + '; '.join(
+                    f'{ruta}: ' + ', '.join(f'{codigo} x{veces}' for codigo, veces in sorted(codigos.items()))
+                    for ruta, codigos in sorted(errores.items())
+                )
+            ))
+
+    def _fila(self, ruta, tiempos, duracion, errores):
+        self.stdout.write(
+            f'{ruta:<28}{len(tiempos):>12}{len(tiempos) / duracion:>9.0f}{_percentil(tiempos, 50):>9.1f}'
+            f'{_percentil(tiempos, 95):>9.1f}{_percentil(tiempos, 99):>9.1f}{errores:>9}'
+        )
+
+
+def _leer_mezcla(texto):
+    """Convierte 'qr=55,detalle=25' en ([tipos], [pesos])."""
+    pesos = {}
+    try:
+        for parte in texto.split(','):
+            tipo, peso = parte.split('=')
+            pesos[tipo.strip()] = float(peso)
+    except ValueError:
+        raise CommandError(f'Mezcla inválida: {texto}')
+    desconocidos = set(pesos) - set(TIPOS)
+    if desconocidos:
+        raise CommandError(f'Tipos de solicitud desconocidos: {", ".join(sorted(desconocidos))}')
+    if sum(pesos.values()) <= 0:
+        raise CommandError('La mezcla no tiene ningún peso positivo')
+    return list(pesos), list(pesos.values())
+
+
+class _Solicitudes:
+    """Genera las solicitudes de un trabajador: (ruta, método, camino, cuerpo)."""
+    def __init__(self, pacientes, mezcla, aleatorio):
+        self.pacientes, self.mezcla, self.aleatorio = pacientes, mezcla, aleatorio
+
+    def siguiente(self):
+        aleatorio = self.aleatorio
+        tipo = aleatorio.choices(*self.mezcla)[0]
+        id_paciente, codigo_qr, peso = aleatorio.choice(self.pacientes)
+        if tipo == 'qr':
+            return 'POST pacientes/qr/buscar/', 'POST', '/api/pacientes/qr/buscar/', {'codigo_qr': codigo_qr}
+        if tipo == 'detalle':
+            return 'GET pacientes/<id>/', 'GET', f'/api/pacientes/{id_paciente}/', None
+        if tipo == 'editar':
+            # Corrige el peso registrado en unos gramos, como una corrección real
+            nuevo = max(float(peso) + aleatorio.choice([-1, 1]) * aleatorio.randint(1, 5) / 100, 1)
+            return 'PATCH pacientes/<id>/', 'PATCH', f'/api/pacientes/{id_paciente}/', {'peso': f'{nuevo:.2f}'}
+        camino = f'/api/actividades/?page={aleatorio.randint(1, PAGINAS_ACTIVIDADES)}'
+        if aleatorio.random() < 0.3:
+            camino += '&tipo_actividad=' + aleatorio.choice(['busqueda', 'edicion'])
+        return 'GET actividades/', 'GET', camino, None
+
+
+class _Servidor:
+    def __init__(self, url, inseguro=False, keepalive=True):
+        partes = urlsplit(url)
+        if partes.scheme not in ('http', 'https') or not partes.hostname:
+            raise CommandError(f'URL inválida: {url}')
+        self.https = partes.scheme == 'https'
+        self.host, self.puerto = partes.hostname, partes.port
+        self.base = partes.path.rstrip('/')
+        self.contexto = ssl._create_unverified_context() if inseguro else None
+        self.keepalive = keepalive
+
+    def conectar(self):
+        return _Conexion(self)
+
+    def iniciar_sesion(self, username, password):
+        conexion = self.conectar()
+        try:
+            codigo, datos = conexion.enviar(
+                'POST', '/api/auth/token/login/', {'username': username, 'password': password}, leer=True
+            )
+        except OSError as e:
+            raise CommandError(f'No se pudo conectar con el servidor: {e}')
+        finally:
+            conexion.cerrar()
+        if codigo != 200:
+            raise CommandError(f'No se pudo iniciar sesión como {username}: {codigo} {datos}')
+        return datos['auth_token']
+
+
+class _Conexion:
+    """Conexión HTTP de un trabajador, persistente (keep-alive) salvo que se indique lo contrario."""
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.http = None
+
+    def _abrir(self):
+        servidor = self.servidor
+        if servidor.https:
+            return http.client.HTTPSConnection(servidor.host, servidor.puerto, timeout=60, context=servidor.contexto)
+        return http.client.HTTPConnection(servidor.host, servidor.puerto, timeout=60)
+
+    def enviar(self, metodo, camino, datos, token=None, leer=False):
+        """Devuelve el código de estado, o (código, JSON) con leer=True."""
+        cabeceras = {'Accept': 'application/json'}
+        cuerpo = None
+        if datos is not None:
+            cuerpo = json.dumps(datos).encode()
+            cabeceras['Content-Type'] = 'application/json'
+        if token:
+            cabeceras['Authorization'] = f'Token {token}'
+        for intento in range(2):
+            if self.http is None:
+                self.http = self._abrir()
+            try:
+                self.http.request(metodo, self.servidor.base + camino, body=cuerpo, headers=cabeceras)
+                respuesta = self.http.getresponse()
+                contenido = respuesta.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # El servidor cerró la conexión persistente: reintentar con una nueva
+                self.cerrar()
+                if intento:
+                    raise
+        if respuesta.will_close or not self.servidor.keepalive:
+            self.cerrar()
+        if leer:
+            return respuesta.status, json.loads(contenido) if contenido else None
+        return respuesta.status
+
+    def cerrar(self):
+        if self.http is not None:
+            self.http.close()
+            self.http = None
+
+
+def _percentil(tiempos, percentil):
+    if len(tiempos) < 2:
+        return tiempos[0] if tiempos else 0.0
+    return statistics.quantiles(tiempos, n=100)[percentil - 1]
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from Api.enrutamiento import alias_replica
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia la base de datos principal SQLite sobre la réplica '
+        '(BD_REPLICA_NAME) para probar localmente las lecturas en réplica. '
+        'Con --cada la copia se repite, simulando una réplica con retraso.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, default=None,
+                            help='Segundos entre copias; sin esta opción se copia una sola vez')
+
+    def handle(self, *args, **options):
+        alias = alias_replica()
+        if alias is None:
+            raise CommandError('No hay réplica configurada: define la variable de entorno BD_REPLICA_NAME')
+        principal, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if principal.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError(
+                'Solo se copian bases SQLite; una réplica PostgreSQL se mantiene con la replicación del servidor'
+            )
+
+        while True:
+            inicio = time.perf_counter()
+            origen = sqlite3.connect(principal.settings_dict['NAME'])
+            destino = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                # La API de copia de SQLite toma una instantánea consistente
+                # aunque otros procesos estén escribiendo
+                origen.backup(destino)
+            finally:
+                destino.close()
+                origen.close()
+            self.stdout.write(
+                f'Réplica actualizada en {(time.perf_counter() - inicio) * 1000:.0f} ms: '
+                f'{replica.settings_dict["NAME"]}'
+            )
+            if options['cada'] is None:
+                return
+            time.sleep(options['cada'])
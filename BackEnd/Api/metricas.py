@@ -0,0 +1,457 @@
+"""
+Métricas de rendimiento de la API, para dejar activas en producción.
+
+MetricasMiddleware mide cada solicitud a /api/: su duración, las consultas
+a la base de datos y su tiempo, el tiempo de serialización y el tamaño de
+la respuesta. Lo devuelve en la cabecera Server-Timing (visible en las
+herramientas de desarrollo del navegador) y lo acumula por ruta en los
+histogramas que /api/metrics/ expone en el formato de texto de Prometheus.
+
+Por solicitud cuesta dos perf_counter por consulta y una actualización de
+contadores bajo un lock. Cada worker acumula en memoria y cada
+METRICAS_VOLCADO segundos copia sus totales en la caché compartida
+(METRICAS_CACHE_ALIAS), en una ranura por host:pid; /api/metrics/ suma los
+de todos los workers, así que Prometheus ve los mismos contadores sin
+importar qué worker responda. La ranura de un worker que lleva
+METRICAS_LATIDO segundos sin volcar se retira: sus totales pasan a un
+acumulado común, de modo que los contadores no retroceden cuando un worker
+termina y las ranuras no crecen sin límite al reciclar procesos.
+En las respuestas en streaming (exportaciones) se mide hasta que sale la
+respuesta y no se cuenta su tamaño.
+"""
+import bisect
+import contextvars
+import hmac
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import BaseRenderer
+
+PREFIJO = '/api/'
+
+# Límites de los histogramas: segundos de duración y bytes de respuesta
+CUBETAS_DURACION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CUBETAS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Otros métodos se agrupan para no crear una serie por cada método inventado
+METODOS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+# Ranuras registradas, totales de los workers retirados y lock entre
+# procesos para modificar ambos
+CLAVE_PROCESOS = 'metricas:procesos'
+CLAVE_RETIRADOS = 'metricas:retirados'
+CLAVE_BLOQUEO = 'metricas:bloqueo'
+
+# Posiciones de los acumulados de cada serie (metodo, ruta)
+DURACIONES, SUMA_DURACION, TAMANOS, SUMA_BYTES, CONSULTAS, TIEMPO_BD, TIEMPO_SERIALIZACION = range(7)
+
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    """Lo medido durante una solicitud."""
+    __slots__ = ('consultas', 'tiempo_bd', 'tiempo_serializacion', 'serializando', 'sql')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.tiempo_serializacion = 0.0
+        self.serializando = False
+        # Lista de (sql, segundos) solo dentro de capturar_consultas
+        self.sql = None
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        medicion.consultas += 1
+        medicion.tiempo_bd += duracion
+        if medicion.sql is not None:
+            medicion.sql.append((sql, duracion))
+
+
+@contextmanager
+def capturar_consultas():
+    """
+    Devuelve la lista donde se guardan (sql, segundos) de las consultas
+    ejecutadas dentro del bloque, incluidas las de otros hilos de la misma
+    solicitud (sync_to_async). Los parámetros no se guardan.
+    """
+    medicion = _medicion_actual.get()
+    token = None
+    if medicion is None:
+        # Fuera de /api/ (o sin MetricasMiddleware) no hay medición en curso
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+    anterior, medicion.sql = medicion.sql, []
+    try:
+        yield medicion.sql
+    finally:
+        medicion.sql = anterior
+        if token is not None:
+            _medicion_actual.reset(token)
+
+
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs):
+    # Al principio de la lista: connection.execute_wrapper quita el último
+    # al salir de su bloque
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _medir_consulta)
+
+
+class MedirSerializacion:
+    """
+    Mixin de serializadores: suma el tiempo de to_representation al de la
+    solicitud en curso. Los serializadores anidados se cuentan dentro del
+    que los contiene.
+    """
+    def to_representation(self, instance):
+        medicion = _medicion_actual.get()
+        if medicion is None or medicion.serializando:
+            return super().to_representation(instance)
+        medicion.serializando = True
+        inicio = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            medicion.serializando = False
+            medicion.tiempo_serializacion += time.perf_counter() - inicio
+
+
+def _serie_vacia():
+    return [[0] * (len(CUBETAS_DURACION) + 1), 0.0, [0] * (len(CUBETAS_BYTES) + 1), 0, 0, 0.0, 0.0]
+
+
+def _sumar_series(destino, origen, signo=1):
+    for posicion, valor in enumerate(origen):
+        if isinstance(valor, list):
+            destino[posicion] = [a + signo * b for a, b in zip(destino[posicion], valor)]
+        else:
+            destino[posicion] += signo * valor
+
+
+def _sumar_instantanea(series, codigos, instantanea, signo=1):
+    for clave, serie in instantanea['series'].items():
+        _sumar_series(series.setdefault(clave, _serie_vacia()), serie, signo)
+    for clave, cantidad in instantanea['codigos'].items():
+        codigos[clave] = codigos.get(clave, 0) + signo * cantidad
+
+
+def _clave_ranura(ranura):
+    return f'metricas:ranura:{ranura}'
+
+
+def _clave_latido(ranura):
+    return f'metricas:latido:{ranura}'
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lock_volcado = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        with self._lock:
+            # (metodo, ruta) -> acumulados; (metodo, ruta, codigo) -> solicitudes
+            self._series = {}
+            self._codigos = {}
+        self._pid = os.getpid()
+        self._ranura = None
+        # Lo último copiado a la ranura, por si se retira con este worker vivo
+        self._volcado = None
+        self._proximo_volcado = 0.0
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'METRICAS_CACHE_ALIAS', 'default')]
+
+    def observar(self, metodo, ruta, codigo, duracion, tamano, medicion):
+        if os.getpid() != self._pid:
+            # Proceso hijo (fork): sus métricas empiezan de cero
+            self._reiniciar()
+        with self._lock:
+            serie = self._series.get((metodo, ruta))
+            if serie is None:
+                serie = self._series[(metodo, ruta)] = _serie_vacia()
+            serie[DURACIONES][bisect.bisect_left(CUBETAS_DURACION, duracion)] += 1
+            serie[SUMA_DURACION] += duracion
+            if tamano is not None:
+                serie[TAMANOS][bisect.bisect_left(CUBETAS_BYTES, tamano)] += 1
+                serie[SUMA_BYTES] += tamano
+            serie[CONSULTAS] += medicion.consultas
+            serie[TIEMPO_BD] += medicion.tiempo_bd
+            serie[TIEMPO_SERIALIZACION] += medicion.tiempo_serializacion
+            clave = (metodo, ruta, codigo)
+            self._codigos[clave] = self._codigos.get(clave, 0) + 1
+
+        if time.monotonic() >= self._proximo_volcado:
+            self.volcar()
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                'series': {clave: [list(v) if isinstance(v, list) else v for v in serie]
+                           for clave, serie in self._series.items()},
+                'codigos': dict(self._codigos),
+            }
+
+    @contextmanager
+    def _bloqueo(self):
+        """Lock entre procesos sobre el registro de ranuras; cede False si no se obtuvo."""
+        limite = time.monotonic() + 2
+        while not self.cache.add(CLAVE_BLOQUEO, self._pid, 10):
+            if time.monotonic() >= limite:
+                yield False
+                return
+            time.sleep(0.01)
+        try:
+            yield True
+        finally:
+            self.cache.delete(CLAVE_BLOQUEO)
+
+    def _retirar(self, ranuras):
+        """Pasa los totales de las ranuras al acumulado de retirados y las elimina. Requiere _bloqueo."""
+        valores = self.cache.get_many([CLAVE_PROCESOS, CLAVE_RETIRADOS, *map(_clave_ranura, ranuras)])
+        procesos = valores.get(CLAVE_PROCESOS, set())
+        retirados = valores.get(CLAVE_RETIRADOS) or {'series': {}, 'codigos': {}}
+        for ranura in ranuras:
+            instantanea = valores.get(_clave_ranura(ranura))
+            if ranura in procesos and instantanea is not None:
+                _sumar_instantanea(retirados['series'], retirados['codigos'], instantanea)
+        # Registro y acumulado en una sola escritura: quien lea ambos a la
+        # vez nunca cuenta una ranura dos veces
+        self.cache.set_many({CLAVE_PROCESOS: procesos - set(ranuras), CLAVE_RETIRADOS: retirados}, None)
+        self.cache.delete_many([
+            clave for ranura in ranuras for clave in (_clave_ranura(ranura), _clave_latido(ranura))
+        ])
+
+    def _registrar(self):
+        ranura = f'{socket.gethostname()}:{self._pid}'
+        with self._bloqueo() as obtenido:
+            if not obtenido:
+                return None
+            if ranura in self.cache.get(CLAVE_PROCESOS, set()):
+                # Un proceso anterior con el mismo pid terminó sin retirarse
+                self._retirar([ranura])
+            self.cache.set(CLAVE_PROCESOS, self.cache.get(CLAVE_PROCESOS, set()) | {ranura}, None)
+            self.cache.set(_clave_latido(ranura), True, getattr(settings, 'METRICAS_LATIDO', 300))
+        return ranura
+
+    def _retirarse(self):
+        """
+        Retira la ranura propia (si otro proceso no lo hizo ya) y descuenta
+        de los totales propios lo volcado, que queda en el acumulado.
+        """
+        with self._bloqueo() as obtenido:
+            if not obtenido:
+                return False
+            self._retirar([self._ranura])
+        with self._lock:
+            _sumar_instantanea(self._series, self._codigos, self._volcado, signo=-1)
+        self._ranura = None
+        return True
+
+    def volcar(self):
+        """Copia los totales de este worker en la caché compartida."""
+        with self._lock_volcado:
+            self._proximo_volcado = time.monotonic() + getattr(settings, 'METRICAS_VOLCADO', 5)
+            latido = getattr(settings, 'METRICAS_LATIDO', 300)
+            # Con el latido vigente nadie retira la ranura mientras se escribe
+            if self._ranura is not None and not self.cache.touch(_clave_latido(self._ranura), latido):
+                # Tanto tiempo sin solicitudes que la ranura pudo retirarse
+                if not self._retirarse():
+                    return
+            if self._ranura is None:
+                self._ranura = self._registrar()
+                if self._ranura is None:
+                    return
+            self._volcado = self.instantanea()
+            self.cache.set(_clave_ranura(self._ranura), self._volcado, None)
+
+    def totales(self):
+        """Suma de las instantáneas de todos los workers, incluida la actual de este."""
+        self.volcar()
+        procesos = self.cache.get(CLAVE_PROCESOS, set())
+        valores = self.cache.get_many([
+            CLAVE_PROCESOS, CLAVE_RETIRADOS,
+            *(clave for ranura in procesos for clave in (_clave_ranura(ranura), _clave_latido(ranura))),
+        ])
+        series, codigos = {}, {}
+        if CLAVE_RETIRADOS in valores:
+            _sumar_instantanea(series, codigos, valores[CLAVE_RETIRADOS])
+        # Solo las ranuras que siguen registradas en la misma lectura que el
+        # acumulado, para no contar dos veces una que se está retirando
+        vigentes = valores.get(CLAVE_PROCESOS, set()) & procesos
+        for ranura in vigentes:
+            if _clave_ranura(ranura) in valores:
+                _sumar_instantanea(series, codigos, valores[_clave_ranura(ranura)])
+
+        if any(_clave_latido(ranura) not in valores for ranura in vigentes):
+            self._retirar_terminados()
+        return series, codigos
+
+    def _retirar_terminados(self):
+        """Retira las ranuras sin latido de los workers que ya no vuelcan."""
+        with self._bloqueo() as obtenido:
+            if not obtenido:
+                return
+            # Se vuelve a leer con el lock: un worker pudo renovar su latido
+            procesos = self.cache.get(CLAVE_PROCESOS, set())
+            latidos = self.cache.get_many([_clave_latido(ranura) for ranura in procesos])
+            terminados = [ranura for ranura in procesos if _clave_latido(ranura) not in latidos]
+            if terminados:
+                self._retirar(terminados)
+
+    def limpiar(self):
+        procesos = self.cache.get(CLAVE_PROCESOS, set())
+        self.cache.delete_many([
+            CLAVE_PROCESOS, CLAVE_RETIRADOS, CLAVE_BLOQUEO,
+            *(clave for ranura in procesos for clave in (_clave_ranura(ranura), _clave_latido(ranura))),
+        ])
+        self._reiniciar()
+
+    def exportar(self):
+        """Totales en el formato de texto de Prometheus."""
+        series, codigos = self.totales()
+        lineas = []
+
+        def encabezado(nombre, tipo, ayuda):
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+
+        def histograma(nombre, cubetas, posicion, posicion_suma):
+            for (metodo, ruta), serie in sorted(series.items()):
+                etiquetas = _etiquetas(metodo=metodo, ruta=ruta)
+                acumulado = 0
+                for limite, cantidad in zip((*cubetas, '+Inf'), serie[posicion]):
+                    acumulado += cantidad
+                    lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+                lineas.append(f'{nombre}_sum{{{etiquetas}}} {serie[posicion_suma]}')
+                lineas.append(f'{nombre}_count{{{etiquetas}}} {acumulado}')
+
+        encabezado('api_solicitud_duracion_segundos', 'histogram', 'Duración de las solicitudes por ruta.')
+        histograma('api_solicitud_duracion_segundos', CUBETAS_DURACION, DURACIONES, SUMA_DURACION)
+        encabezado('api_respuesta_bytes', 'histogram', 'Tamaño de las respuestas por ruta (sin streaming).')
+        histograma('api_respuesta_bytes', CUBETAS_BYTES, TAMANOS, SUMA_BYTES)
+
+        encabezado('api_solicitudes_total', 'counter', 'Solicitudes por ruta y código de estado.')
+        for (metodo, ruta, codigo), cantidad in sorted(codigos.items()):
+            lineas.append(f'api_solicitudes_total{{{_etiquetas(metodo=metodo, ruta=ruta, codigo=codigo)}}} {cantidad}')
+
+        for nombre, posicion, ayuda in (
+            ('api_consultas_bd_total', CONSULTAS, 'Consultas a la base de datos por ruta.'),
+            ('api_consultas_bd_segundos_total', TIEMPO_BD, 'Tiempo en consultas a la base de datos por ruta.'),
+            ('api_serializacion_segundos_total', TIEMPO_SERIALIZACION, 'Tiempo serializando por ruta.'),
+        ):
+            encabezado(nombre, 'counter', ayuda)
+            for (metodo, ruta), serie in sorted(series.items()):
+                lineas.append(f'{nombre}{{{_etiquetas(metodo=metodo, ruta=ruta)}}} {serie[posicion]}')
+
+        return '\n'.join(lineas) + '\n'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(**valores):
+    return ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in valores.items())
+
+
+registro_metricas = RegistroMetricas()
+
+
+class MetricasMiddleware:
+    # También async: bajo ASGI no añade un paso por un hilo en cada solicitud
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not request.path_info.startswith(PREFIJO):
+            return self.get_response(request)
+
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        return self._registrar(request, response, time.perf_counter() - inicio, medicion)
+
+    async def __acall__(self, request):
+        if not request.path_info.startswith(PREFIJO):
+            return await self.get_response(request)
+
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        return self._registrar(request, response, time.perf_counter() - inicio, medicion)
+
+    def _registrar(self, request, response, duracion, medicion):
+        coincidencia = request.resolver_match
+        ruta = coincidencia.route if coincidencia else 'sin_ruta'
+        metodo = request.method if request.method in METODOS else 'OTRO'
+        tamano = None if response.streaming else len(response.content)
+        registro_metricas.observar(metodo, ruta, response.status_code, duracion, tamano, medicion)
+
+        if getattr(settings, 'METRICAS_SERVER_TIMING', True):
+            response['Server-Timing'] = (
+                f'bd;dur={medicion.tiempo_bd * 1000:.2f};desc="{medicion.consultas} consultas", '
+                f'serializacion;dur={medicion.tiempo_serializacion * 1000:.2f}, '
+                f'total;dur={duracion * 1000:.2f}'
+            )
+        return response
+
+
+class PuedeVerMetricas(BasePermission):
+    """
+    Administradores, o Prometheus con la cabecera
+    "Authorization: Metricas <METRICAS_TOKEN>".
+    """
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        token = getattr(settings, 'METRICAS_TOKEN', '')
+        tipo, _, credencial = request.headers.get('Authorization', '').partition(' ')
+        return bool(token) and tipo == 'Metricas' and hmac.compare_digest(credencial.encode(), token.encode())
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            # Errores (401, 403)
+            return '\n'.join(f'{clave}: {valor}' for clave, valor in data.items()) + '\n'
+        return data
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+def inicializar_secuencia(apps, schema_editor):
+    """Arranca la secuencia de IDs en el mayor número ya asignado."""
+    Paciente = apps.get_model('Api', 'Paciente')
+    Secuencia = apps.get_model('Api', 'Secuencia')
+    numeros = [int(id_paciente[4:]) for id_paciente in
+               Paciente.objects.values_list('id_paciente', flat=True)
+               if id_paciente[4:].isdigit()]
+    Secuencia.objects.update_or_create(
+        nombre='id_paciente', defaults={'valor': max(numeros, default=0)}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0003_actividadusuario_detalles_cambio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Secuencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Secuencia',
+                'verbose_name_plural': 'Secuencias',
+            },
+        ),
+        migrations.AlterField(
+            model_name='paciente',
+            name='id_paciente',
+            field=models.CharField(editable=False, max_length=10, unique=True),
+        ),
+        migrations.RunPython(inicializar_secuencia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:19
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0004_secuencia'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='actividadusuario',
+            name='fecha_hora',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0005_actividadusuario_fecha_hora_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actividadusuario',
+            index=models.Index(fields=['-fecha_hora', '-id'], name='actividad_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividadusuario',
+            index=models.Index(fields=['usuario', '-fecha_hora', '-id'], name='actividad_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividadusuario',
+            index=models.Index(fields=['tipo_actividad', '-fecha_hora', '-id'], name='actividad_tipo_fecha_idx'),
+        ),
+    ]
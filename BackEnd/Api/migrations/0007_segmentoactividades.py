@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0006_actividadusuario_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentoActividades',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(unique=True, verbose_name='Mes')),
+                ('archivo', models.CharField(max_length=100, verbose_name='Archivo')),
+                ('filas', models.PositiveIntegerField(default=0, verbose_name='Actividades archivadas')),
+                ('fecha_min', models.DateTimeField(verbose_name='Primera actividad')),
+                ('fecha_max', models.DateTimeField(verbose_name='Última actividad')),
+            ],
+            options={
+                'verbose_name': 'Segmento de actividades archivadas',
+                'verbose_name_plural': 'Segmentos de actividades archivadas',
+                'ordering': ['-mes'],
+            },
+        ),
+    ]
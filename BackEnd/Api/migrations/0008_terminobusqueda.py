@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _terminos(*textos):
+    # Copia de Api.busqueda.terminos para no depender de los modelos actuales
+    encontrados = []
+    for texto in textos:
+        texto = unicodedata.normalize('NFKD', texto or '')
+        texto = ''.join(c for c in texto if not unicodedata.combining(c)).casefold()
+        for termino in re.findall(r'\w+', texto):
+            if termino[:100] not in encontrados:
+                encontrados.append(termino[:100])
+    return encontrados
+
+
+def indexar_existentes(apps, schema_editor):
+    """Genera los términos de los pacientes y usuarios ya registrados."""
+    Paciente = apps.get_model('Api', 'Paciente')
+    User = apps.get_model('auth', 'User')
+    TerminoBusqueda = apps.get_model('Api', 'TerminoBusqueda')
+    terminos = []
+    for paciente in Paciente.objects.iterator():
+        terminos.extend(
+            TerminoBusqueda(tipo='paciente', objeto_id=paciente.pk, termino=termino)
+            for termino in _terminos(paciente.id_paciente, paciente.nombre_madre, paciente.documento_madre)
+        )
+    for usuario in User.objects.iterator():
+        terminos.extend(
+            TerminoBusqueda(tipo='usuario', objeto_id=usuario.pk, termino=termino)
+            for termino in _terminos(usuario.username, usuario.first_name, usuario.last_name)
+        )
+    TerminoBusqueda.objects.bulk_create(terminos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0007_segmentoactividades'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('paciente', 'Paciente'), ('usuario', 'Usuario')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('termino', models.CharField(max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Término de búsqueda',
+                'verbose_name_plural': 'Términos de búsqueda',
+                'indexes': [models.Index(fields=['tipo', 'termino', 'objeto_id'], name='termino_busqueda_idx'), models.Index(fields=['tipo', 'objeto_id'], name='termino_objeto_idx')],
+            },
+        ),
+        migrations.RunPython(indexar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:33
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar_nombres(apps, schema_editor):
+    """Rellena nombre_madre_normalizado de los pacientes existentes."""
+    Paciente = apps.get_model('Api', 'Paciente')
+    pacientes = list(Paciente.objects.only('nombre_madre'))
+    for paciente in pacientes:
+        # Igual que Api.models.normalizar
+        texto = unicodedata.normalize('NFKD', paciente.nombre_madre or '')
+        texto = ''.join(c for c in texto if not unicodedata.combining(c)).casefold()
+        paciente.nombre_madre_normalizado = ' '.join(texto.split())
+    Paciente.objects.bulk_update(pacientes, ['nombre_madre_normalizado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0008_terminobusqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='nombre_madre_normalizado',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AlterField(
+            model_name='paciente',
+            name='documento_madre',
+            field=models.CharField(db_index=True, max_length=20, verbose_name='Documento de la madre'),
+        ),
+        migrations.RunPython(normalizar_nombres, migrations.RunPython.noop),
+    ]
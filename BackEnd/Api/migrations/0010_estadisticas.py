@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:41
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Igual que Api.estadisticas.MEDIDAS
+MEDIDAS = {
+    'peso': (Decimal('0'), Decimal('0.05'), 120),
+    'talla': (Decimal('0'), Decimal('0.5'), 200),
+}
+
+
+def calcular_estadisticas(apps, schema_editor):
+    """Calcula las estadísticas de los pacientes ya registrados."""
+    Paciente = apps.get_model('Api', 'Paciente')
+    EstadisticaDiaria = apps.get_model('Api', 'EstadisticaDiaria')
+    DistribucionDiaria = apps.get_model('Api', 'DistribucionDiaria')
+    dias = {}
+    distribuciones = defaultdict(int)
+    for paciente in Paciente.objects.iterator():
+        dia = dias.setdefault(paciente.fecha_nacimiento, EstadisticaDiaria(fecha=paciente.fecha_nacimiento))
+        dia.nacimientos += 1
+        dia.masculinos += paciente.sexo_bebe == 'M'
+        dia.femeninos += paciente.sexo_bebe == 'F'
+        dia.dados_alta += paciente.dado_alta == 'True'
+        dia.suma_peso += paciente.peso
+        dia.suma_talla += paciente.talla
+        for medida, (minimo, ancho, cantidad) in MEDIDAS.items():
+            intervalo = min(max(int((getattr(paciente, medida) - minimo) // ancho), 0), cantidad - 1)
+            distribuciones[(paciente.fecha_nacimiento, medida, intervalo)] += 1
+    EstadisticaDiaria.objects.bulk_create(dias.values(), batch_size=500)
+    DistribucionDiaria.objects.bulk_create([
+        DistribucionDiaria(fecha=fecha, medida=medida, intervalo=intervalo, cantidad=cantidad)
+        for (fecha, medida, intervalo), cantidad in distribuciones.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0009_paciente_nombre_normalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistribucionDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha de nacimiento')),
+                ('medida', models.CharField(choices=[('peso', 'Peso'), ('talla', 'Talla')], max_length=5)),
+                ('intervalo', models.PositiveSmallIntegerField()),
+                ('cantidad', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Distribución diaria',
+                'verbose_name_plural': 'Distribuciones diarias',
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True, verbose_name='Fecha de nacimiento')),
+                ('nacimientos', models.IntegerField(default=0)),
+                ('masculinos', models.IntegerField(default=0)),
+                ('femeninos', models.IntegerField(default=0)),
+                ('dados_alta', models.IntegerField(default=0, verbose_name='Dados de alta')),
+                ('suma_peso', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Suma de pesos (kg)')),
+                ('suma_talla', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Suma de tallas (cm)')),
+            ],
+            options={
+                'verbose_name': 'Estadística diaria',
+                'verbose_name_plural': 'Estadísticas diarias',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['fecha_nacimiento'], name='paciente_nacimiento_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='distribuciondiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'medida', 'intervalo'), name='distribucion_diaria_unica'),
+        ),
+        migrations.RunPython(calcular_estadisticas, migrations.RunPython.noop),
+    ]
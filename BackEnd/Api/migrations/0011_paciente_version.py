@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0010_estadisticas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0011_paciente_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InformePerfil',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_hora', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha y hora')),
+                ('metodo', models.CharField(max_length=10, verbose_name='Método')),
+                ('ruta', models.CharField(max_length=2000)),
+                ('codigo_estado', models.PositiveSmallIntegerField(verbose_name='Código de estado')),
+                ('duracion_ms', models.FloatField(verbose_name='Duración (ms)')),
+                ('consultas', models.PositiveIntegerField(verbose_name='Consultas SQL')),
+                ('tiempo_bd_ms', models.FloatField(verbose_name='Tiempo en la base de datos (ms)')),
+                ('informe', models.TextField()),
+                ('estadisticas', models.BinaryField(verbose_name='Estadísticas de cProfile')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='informes_perfil', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Informe de perfilado',
+                'verbose_name_plural': 'Informes de perfilado',
+                'ordering': ['-fecha_hora', '-id'],
+            },
+        ),
+    ]
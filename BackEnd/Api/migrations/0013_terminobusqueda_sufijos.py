@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def agregar_sufijos(apps, schema_editor):
+    """Agrega los sufijos numéricos de los términos ya indexados (ver Api.busqueda.terminos_indice)."""
+    TerminoBusqueda = apps.get_model('Api', 'TerminoBusqueda')
+    existentes = {}
+    for tipo, objeto_id, termino in TerminoBusqueda.objects.values_list('tipo', 'objeto_id', 'termino').iterator():
+        existentes.setdefault((tipo, objeto_id), set()).add(termino)
+    nuevos = []
+    for (tipo, objeto_id), terminos in existentes.items():
+        for termino in list(terminos):
+            # Sufijos de al menos 3 caracteres (LARGO_MINIMO_SUFIJO)
+            for inicio in range(1, len(termino) - 2):
+                if termino[inicio].isdigit() and termino[inicio:] not in terminos:
+                    terminos.add(termino[inicio:])
+                    nuevos.append(TerminoBusqueda(tipo=tipo, objeto_id=objeto_id, termino=termino[inicio:]))
+    TerminoBusqueda.objects.bulk_create(nuevos, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Api', '0012_informeperfil'),
+    ]
+
+    operations = [
+        migrations.RunPython(agregar_sufijos, migrations.RunPython.noop),
+    ]
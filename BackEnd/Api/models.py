@@ -1,13 +1,54 @@
 from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, router, transaction, DatabaseError, IntegrityError
+from django.db.models import F
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 import datetime
+import os
+import threading
+import unicodedata
 
-class Perfil(models.Model):
+class RastreoCambiosMixin:
+    """
+    Recuerda los valores leídos de la base de datos para saber qué campos
+    cambiaron antes de guardar, y así escribir solo cuando hace falta.
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores leídos de la base de datos, para saber qué campos cambian al guardar
+        instancia._valores_originales = dict(zip(field_names, values))
+        return instancia
+    
+    def campos_modificados(self):
+        """
+        Nombres de los campos cuyo valor difiere del leído de la base de
+        datos. En un registro que no se leyó de la base de datos son todos.
+        """
+        originales = getattr(self, '_valores_originales', None)
+        campos = [campo.attname for campo in self._meta.concrete_fields]
+        if originales is None:
+            return set(campos)
+        diferidos = self.get_deferred_fields()
+        return {
+            campo for campo in campos
+            if campo not in diferidos and (campo not in originales or getattr(self, campo) != originales[campo])
+        }
+    
+    def _recordar_valores(self):
+        """Lo guardado pasa a ser el nuevo estado original."""
+        self._valores_originales = {
+            campo.attname: getattr(self, campo.attname)
+            for campo in self._meta.concrete_fields
+            if campo.attname not in self.get_deferred_fields()
+        }
+
+class Perfil(RastreoCambiosMixin, models.Model):
     OPCIONES_CARGO = (
         ('Doctor(a)', 'Doctor(a)'),
         ('Enfermero(a)', 'Enfermero(a)'),
@@ -20,6 +61,10 @@ class Perfil(models.Model):
     
     def __str__(self):
         return f"{self.nombre} {self.apellido} - {self.cargo}"
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._recordar_valores()
 
 @receiver(post_save, sender=User)
 def crear_perfil_usuario(sender, instance, created, **kwargs):
@@ -27,23 +72,169 @@ def crear_perfil_usuario(sender, instance, created, **kwargs):
         Perfil.objects.create(usuario=instance)
 
 @receiver(post_save, sender=User)
-def guardar_perfil_usuario(sender, instance, **kwargs):
-    instance.perfil.save()
+def guardar_perfil_usuario(sender, instance, created, **kwargs):
+    """
+    Guarda el perfil junto con el usuario solo si ya estaba cargado y se
+    modificó. Al iniciar sesión (que guarda last_login) el perfil no se
+    consulta ni se escribe.
+    """
+    if created or not User.perfil.is_cached(instance):
+        return
+    perfil = instance.perfil
+    if perfil._state.adding:
+        perfil.save()
+    elif modificados := perfil.campos_modificados():
+        perfil.save(update_fields=modificados)
+
+class SecuenciaManager(models.Manager):
+    def reservar(self, nombre, cantidad=1, inicial=None):
+        """
+        Reserva `cantidad` valores consecutivos de la secuencia `nombre` y
+        devuelve el último valor reservado.
+
+        El incremento es un único UPDATE atómico sobre una fila, por lo que
+        dos procesos concurrentes nunca reciben el mismo valor.
+        """
+        # self.db es la base de lectura, que puede ser una réplica
+        alias = router.db_for_write(self.model)
+        with transaction.atomic(using=alias):
+            actualizadas = self.filter(nombre=nombre).update(valor=F('valor') + cantidad)
+            if not actualizadas:
+                # Primera vez que se usa la secuencia: se crea partiendo del valor inicial
+                valor_inicial = inicial() if inicial else 0
+                try:
+                    with transaction.atomic(using=alias):
+                        self.create(nombre=nombre, valor=valor_inicial + cantidad)
+                except IntegrityError:
+                    # Otro proceso la creó al mismo tiempo
+                    self.filter(nombre=nombre).update(valor=F('valor') + cantidad)
+            return self.filter(nombre=nombre).values_list('valor', flat=True).get()
+    
+    def avanzar(self, nombre):
+        """Incrementa en uno la secuencia `nombre` sin leer su valor."""
+        if not self.filter(nombre=nombre).update(valor=F('valor') + 1):
+            self.reservar(nombre)
+    
+    def valor(self, nombre):
+        """Valor actual de la secuencia `nombre` (0 si todavía no existe)."""
+        return self.filter(nombre=nombre).values_list('valor', flat=True).first() or 0
+
+class Secuencia(models.Model):
+    """
+    Contador persistente usado para asignar identificadores sin recorrer tablas.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    
+    objects = SecuenciaManager()
+    
+    class Meta:
+        verbose_name = "Secuencia"
+        verbose_name_plural = "Secuencias"
+    
+    def __str__(self):
+        return f"{self.nombre} = {self.valor}"
+
+SECUENCIA_ID_PACIENTE = 'id_paciente'
+
+def formatear_id_paciente(numero):
+    return f'FOSB{numero:02d}'  # Asegura que siempre tenga al menos 2 dígitos
+
+def ultimo_numero_paciente():
+    """
+    Obtiene el mayor número usado en los IDs existentes.
+    Solo se usa para inicializar la secuencia.
+    """
+    numeros = [int(id_paciente[4:]) for id_paciente in
+               Paciente.objects.values_list('id_paciente', flat=True)
+               if id_paciente[4:].isdigit()]
+    return max(numeros, default=0)
+
+class AsignadorIdPaciente:
+    """
+    Asigna números de paciente a partir de la secuencia `id_paciente`.
+
+    Con ID_PACIENTE_BLOQUE > 1 cada proceso reserva un bloque de números
+    de una sola vez y los entrega desde memoria, de modo que la mayoría de
+    las asignaciones no escriben en la base de datos. Los números que no se
+    lleguen a usar en un bloque quedan como huecos en la numeración.
+
+    La reserva ocurre dentro de la transacción de quien pide el número: el
+    resto del bloque solo se entrega a otros cuando esa transacción se
+    confirma. Si se deshace, la secuencia vuelve atrás y el bloque se
+    descarta, porque otro proceso puede reservar los mismos números.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reiniciar()
+    
+    def _reiniciar(self):
+        self._siguiente = 1
+        self._limite = 0
+    
+    def siguiente(self):
+        bloque = max(1, getattr(settings, 'ID_PACIENTE_BLOQUE', 1))
+        with self._lock:
+            if self._siguiente <= self._limite:
+                numero = self._siguiente
+                self._siguiente += 1
+                return numero
+        limite = Secuencia.objects.reservar(SECUENCIA_ID_PACIENTE, bloque, inicial=ultimo_numero_paciente)
+        numero = limite - bloque + 1
+        if bloque > 1:
+            # Fuera de una transacción on_commit lo ejecuta de inmediato
+            transaction.on_commit(lambda: self._usar_bloque(numero + 1, limite))
+        return numero
+    
+    def _usar_bloque(self, siguiente, limite):
+        with self._lock:
+            # Si otro hilo ya tiene un bloque en uso, los números de este quedan como hueco
+            if self._siguiente > self._limite:
+                self._siguiente, self._limite = siguiente, limite
+    
+    def reservar(self, cantidad):
+        """Reserva `cantidad` números consecutivos en un solo paso."""
+        ultimo = Secuencia.objects.reservar(
+            SECUENCIA_ID_PACIENTE, cantidad, inicial=ultimo_numero_paciente
+        )
+        return list(range(ultimo - cantidad + 1, ultimo + 1))
+
+asignador_id_paciente = AsignadorIdPaciente()
+
+if hasattr(os, 'register_at_fork'):
+    # Un proceso hijo no debe heredar el bloque reservado por el padre
+    os.register_at_fork(after_in_child=asignador_id_paciente._reiniciar)
 
 def generar_id_paciente():
     """Genera un ID único para cada paciente con el formato FOSB##"""
-    ultimo_paciente = Paciente.objects.order_by('-id').first()
-    if ultimo_paciente is None:
-        # Si no hay pacientes en la base de datos, comienza con FOSB01
-        return 'FOSB01'
-    
-    # Extrae el número del último ID y lo incrementa
-    ultimo_id = ultimo_paciente.id_paciente
-    num = int(ultimo_id[4:])
-    nuevo_num = num + 1
-    return f'FOSB{nuevo_num:02d}'  # Asegura que siempre tenga al menos 2 dígitos
-
-class Paciente(models.Model):
+    return formatear_id_paciente(asignador_id_paciente.siguiente())
+
+def normalizar(texto):
+    """Pasa a minúsculas, elimina tildes y diacríticos y colapsa los espacios."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ' '.join(''.join(c for c in texto if not unicodedata.combining(c)).casefold().split())
+
+def _mostrar_valor(campo, valor):
+    """Texto de un valor tal como se muestra al usuario."""
+    if campo.choices:
+        return str(dict(campo.flatchoices).get(valor, valor))
+    return '' if valor is None else str(valor)
+
+def detalle_cambio(campo, antiguo, nuevo):
+    """Entrada de ActividadUsuario.detalles_cambio para un campo modificado."""
+    return {
+        'campo_display': str(campo.verbose_name),
+        'valor_antiguo': str(antiguo),
+        'valor_nuevo': str(nuevo),
+        'valor_antiguo_display': _mostrar_valor(campo, antiguo),
+        'valor_nuevo_display': _mostrar_valor(campo, nuevo),
+    }
+
+class VersionObsoleta(DatabaseError):
+    """El paciente cambió en la base de datos desde que se leyó."""
+
+
+class Paciente(RastreoCambiosMixin, models.Model):
     OPCIONES_SEXO = (
         ('M', 'Masculino'),
         ('F', 'Femenino'),
@@ -54,9 +245,11 @@ class Paciente(models.Model):
         ('False', 'No'),
     )
     
-    id_paciente = models.CharField(max_length=10, unique=True, default=generar_id_paciente, editable=False)
+    id_paciente = models.CharField(max_length=10, unique=True, editable=False)
     nombre_madre = models.CharField(max_length=150, verbose_name="Nombre de la madre")
-    documento_madre = models.CharField(max_length=20, verbose_name="Documento de la madre")
+    # Nombre sin tildes y en minúsculas, para buscar por prefijo con el índice
+    nombre_madre_normalizado = models.CharField(max_length=150, default='', editable=False, db_index=True)
+    documento_madre = models.CharField(max_length=20, db_index=True, verbose_name="Documento de la madre")
     sexo_bebe = models.CharField(max_length=1, choices=OPCIONES_SEXO, verbose_name="Sexo del bebé")
     talla = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Talla (cm)")
     peso = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Peso (kg)")
@@ -65,20 +258,99 @@ class Paciente(models.Model):
     fecha_hora_registro = models.DateTimeField(auto_now_add=True, verbose_name="Fecha y hora de registro")
     dado_alta = models.CharField(max_length=5, choices=OPCIONES_ALTA, default='False', verbose_name="¿Dado de alta?")
     codigo_qr = models.CharField(max_length=100, unique=True, blank=True, null=True, verbose_name="Código QR")
+    # Se incrementa en cada modificación; identifica la versión en los ETag
+    version = models.PositiveIntegerField(default=1, editable=False)
     
     class Meta:
         verbose_name = "Paciente"
         verbose_name_plural = "Pacientes"
         ordering = ['-fecha_hora_registro']
+        # Para recalcular las estadísticas de un día sin recorrer la tabla
+        indexes = [
+            models.Index(fields=['fecha_nacimiento'], name='paciente_nacimiento_idx'),
+        ]
     
     def __str__(self):
         return f"{self.id_paciente} - {self.nombre_madre} - Bebé {self.sexo_bebe}"
     
+    def detalle_cambios(self):
+        """
+        Cambios de los campos editables respecto a lo leído de la base de
+        datos, en el formato de ActividadUsuario.detalles_cambio. Los nombres
+        visibles salen de verbose_name y los valores con opciones se muestran
+        con la etiqueta de `choices`, así que se mantienen al día con el modelo.
+        """
+        originales = getattr(self, '_valores_originales', None) or {}
+        modificados = self.campos_modificados()
+        cambios = {}
+        for campo in self._meta.concrete_fields:
+            if not campo.editable or campo.primary_key or campo.attname not in modificados:
+                continue
+            cambios[campo.name] = detalle_cambio(campo, originales.get(campo.attname), getattr(self, campo.attname))
+        return cambios
+    
+    def normalizar_campos(self):
+        """
+        Actualiza los campos derivados. save() lo hace solo; las inserciones
+        con crear_pacientes_en_bloque deben llamarlo antes.
+        """
+        self.nombre_madre_normalizado = normalizar(self.nombre_madre)
+    
     def save(self, *args, **kwargs):
         # Si es un nuevo registro sin ID asignado
         if not self.pk and not self.id_paciente:
             self.id_paciente = generar_id_paciente()
-        super().save(*args, **kwargs)
+        self.normalizar_campos()
+        update_fields = kwargs.get('update_fields')
+        esperada = None
+        if not self._state.adding:
+            # Cada modificación cambia la versión (y con ella el ETag). El
+            # UPDATE solo se aplica si la fila sigue en la versión leída
+            # (ver _do_update), así dos escrituras concurrentes no pueden
+            # dejar la misma versión con datos distintos
+            esperada = self.version
+            self.version = esperada + 1
+            self._version_esperada = esperada
+            if update_fields is not None:
+                update_fields = {*update_fields, 'version'}
+        if update_fields is not None and 'nombre_madre' in update_fields:
+            update_fields = {*update_fields, 'nombre_madre_normalizado'}
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        try:
+            super().save(*args, **kwargs)
+        except VersionObsoleta:
+            self.version = esperada
+            raise
+        finally:
+            self._version_esperada = None
+        # Los receptores de post_save ya vieron los cambios
+        self._recordar_valores()
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        esperada = getattr(self, '_version_esperada', None)
+        if esperada is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if super()._do_update(base_qs.filter(version=esperada), using, pk_val, values, update_fields, forced_update):
+            return True
+        raise VersionObsoleta(f'El paciente {self.id_paciente} ya no está en la versión {esperada}')
+
+
+# bulk_create no envía post_save: las altas en bloque envían esta señal con
+# la lista de `pacientes` creados, y cada módulo que atiende el post_save de
+# Paciente (búsqueda, estadísticas, ETag, caché de QR) la atiende junto a él
+pacientes_creados = Signal()
+
+
+def crear_pacientes_en_bloque(pacientes, batch_size=None, estadisticas=True):
+    """
+    Inserta los pacientes con bulk_create y envía pacientes_creados. Con
+    estadisticas=False no se suman a las estadísticas: el llamador debe
+    recalcular después los días afectados.
+    """
+    Paciente.objects.bulk_create(pacientes, batch_size=batch_size)
+    pacientes_creados.send(sender=Paciente, pacientes=pacientes, estadisticas=estadisticas)
+    return pacientes
 
 class ActividadUsuario(models.Model):
     TIPO_ACTIVIDAD = (
@@ -95,7 +367,9 @@ class ActividadUsuario(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='actividades')
     tipo_actividad = models.CharField(max_length=10, choices=TIPO_ACTIVIDAD)
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='actividades')
-    fecha_hora = models.DateTimeField(auto_now_add=True)
+    # Se fija al crear la instancia y no al insertarla, para que las actividades
+    # con escritura diferida conserven la hora real de la búsqueda
+    fecha_hora = models.DateTimeField(default=timezone.now, editable=False)
     metodo_busqueda = models.CharField(max_length=10, choices=METODO_BUSQUEDA, null=True, blank=True)
     detalles_cambio = models.JSONField(null=True, blank=True, verbose_name="Detalles del cambio")
     
@@ -103,6 +377,130 @@ class ActividadUsuario(models.Model):
         verbose_name = "Actividad de Usuario"
         verbose_name_plural = "Actividades de Usuarios"
         ordering = ['-fecha_hora']  # Ordenar del más reciente al más antiguo
+        # Índices para recorrer el historial por (fecha_hora, id) con paginación por cursor
+        indexes = [
+            models.Index(fields=['-fecha_hora', '-id'], name='actividad_fecha_idx'),
+            models.Index(fields=['usuario', '-fecha_hora', '-id'], name='actividad_usuario_fecha_idx'),
+            models.Index(fields=['tipo_actividad', '-fecha_hora', '-id'], name='actividad_tipo_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.usuario.username} - {self.get_tipo_actividad_display()} - {self.paciente.id_paciente} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
+
+class SegmentoActividades(models.Model):
+    """
+    Catálogo de los segmentos mensuales de actividades archivadas.
+    """
+    mes = models.DateField(unique=True, verbose_name="Mes")
+    archivo = models.CharField(max_length=100, verbose_name="Archivo")
+    filas = models.PositiveIntegerField(default=0, verbose_name="Actividades archivadas")
+    fecha_min = models.DateTimeField(verbose_name="Primera actividad")
+    fecha_max = models.DateTimeField(verbose_name="Última actividad")
+    
+    class Meta:
+        verbose_name = "Segmento de actividades archivadas"
+        verbose_name_plural = "Segmentos de actividades archivadas"
+        ordering = ['-mes']
+    
+    def __str__(self):
+        return f"{self.mes.strftime('%m/%Y')} - {self.filas} actividades"
+
+class TerminoBusqueda(models.Model):
+    """
+    Término normalizado (sin tildes y en minúsculas) de un paciente o
+    usuario. Lo mantiene Api/busqueda.py y sirve para buscar por prefijo
+    usando un índice en lugar de recorrer las tablas con LIKE.
+    """
+    TIPO_PACIENTE = 'paciente'
+    TIPO_USUARIO = 'usuario'
+    TIPOS = (
+        (TIPO_PACIENTE, 'Paciente'),
+        (TIPO_USUARIO, 'Usuario'),
+    )
+    
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    objeto_id = models.BigIntegerField()
+    termino = models.CharField(max_length=100)
+    
+    class Meta:
+        verbose_name = "Término de búsqueda"
+        verbose_name_plural = "Términos de búsqueda"
+        indexes = [
+            models.Index(fields=['tipo', 'termino', 'objeto_id'], name='termino_busqueda_idx'),
+            models.Index(fields=['tipo', 'objeto_id'], name='termino_objeto_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} {self.objeto_id}: {self.termino}"
+
+class EstadisticaDiaria(models.Model):
+    """
+    Totales de los pacientes nacidos en una fecha. Los mantiene
+    Api/estadisticas.py al crear, editar, dar de alta o eliminar pacientes.
+    """
+    fecha = models.DateField(unique=True, verbose_name="Fecha de nacimiento")
+    nacimientos = models.IntegerField(default=0)
+    masculinos = models.IntegerField(default=0)
+    femeninos = models.IntegerField(default=0)
+    dados_alta = models.IntegerField(default=0, verbose_name="Dados de alta")
+    suma_peso = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Suma de pesos (kg)")
+    suma_talla = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Suma de tallas (cm)")
+    
+    class Meta:
+        verbose_name = "Estadística diaria"
+        verbose_name_plural = "Estadísticas diarias"
+        ordering = ['-fecha']
+    
+    def __str__(self):
+        return f"{self.fecha.strftime('%d/%m/%Y')} - {self.nacimientos} nacimientos"
+
+class DistribucionDiaria(models.Model):
+    """
+    Histograma diario de peso o talla: cuántos pacientes nacidos en la
+    fecha caen en cada intervalo de la medida.
+    """
+    MEDIDAS = (
+        ('peso', 'Peso'),
+        ('talla', 'Talla'),
+    )
+    
+    fecha = models.DateField(verbose_name="Fecha de nacimiento")
+    medida = models.CharField(max_length=5, choices=MEDIDAS)
+    intervalo = models.PositiveSmallIntegerField()
+    cantidad = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Distribución diaria"
+        verbose_name_plural = "Distribuciones diarias"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'medida', 'intervalo'], name='distribucion_diaria_unica'),
+        ]
+    
+    def __str__(self):
+        return f"{self.fecha.strftime('%d/%m/%Y')} - {self.medida} [{self.intervalo}] = {self.cantidad}"
+
+class InformePerfil(models.Model):
+    """
+    Perfil de una solicitud que un administrador pidió perfilar (ver
+    Api/perfilado.py): el informe en texto con las consultas SQL y las
+    funciones más costosas, y las estadísticas de cProfile para abrirlas
+    con pstats o snakeviz.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='informes_perfil')
+    fecha_hora = models.DateTimeField(default=timezone.now, verbose_name="Fecha y hora")
+    metodo = models.CharField(max_length=10, verbose_name="Método")
+    ruta = models.CharField(max_length=2000)
+    codigo_estado = models.PositiveSmallIntegerField(verbose_name="Código de estado")
+    duracion_ms = models.FloatField(verbose_name="Duración (ms)")
+    consultas = models.PositiveIntegerField(verbose_name="Consultas SQL")
+    tiempo_bd_ms = models.FloatField(verbose_name="Tiempo en la base de datos (ms)")
+    informe = models.TextField()
+    estadisticas = models.BinaryField(verbose_name="Estadísticas de cProfile")
+    
+    class Meta:
+        verbose_name = "Informe de perfilado"
+        verbose_name_plural = "Informes de perfilado"
+        ordering = ['-fecha_hora', '-id']
     
     def __str__(self):
-        return f"{self.usuario.username} - {self.get_tipo_actividad_display()} - {self.paciente.id_paciente} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
+        return f"{self.metodo} {self.ruta} - {self.duracion_ms:.0f} ms - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
@@ -0,0 +1,167 @@
+"""
+Perfilado bajo demanda de una solicitud, para los administradores.
+
+Cuando un usuario is_staff envía la cabecera X-Perfilar (o el parámetro
+?perfilar=1), su solicitud se ejecuta con cProfile y se registran las
+consultas SQL que hizo, con su duración. El informe se guarda en
+InformePerfil para descargarlo desde el admin, y la respuesta lleva su ID
+en la cabecera X-Perfil-Id. Las consultas se guardan sin sus parámetros
+para no copiar datos de pacientes en los informes; por lo mismo, de la
+cadena de consulta solo se conservan los nombres de los parámetros y los
+valores de PARAMETROS_VISIBLES (paginación, formato, orden).
+
+Si nadie lo pide, el middleware solo comprueba si la cabecera o el
+parámetro están presentes; la autenticación para saber si el usuario es
+is_staff se hace únicamente cuando se pide el perfil. Bajo ASGI cProfile
+mide el hilo del bucle de eventos: lo que se ejecuta en otros hilos
+(sync_to_async) aparece como espera, aunque sus consultas sí se registran.
+Las respuestas en streaming se perfilan hasta que empieza el envío.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import QueryDict
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .autenticacion import autenticar_async
+from .metricas import capturar_consultas
+from .models import InformePerfil
+
+META_CABECERA = 'HTTP_X_PERFILAR'
+PARAMETRO = 'perfilar'
+# Parámetros cuyo valor no puede contener datos de pacientes
+PARAMETROS_VISIBLES = {'page', 'page_size', 'format', 'formato', 'ordering', 'contar', 'tipo_actividad',
+                       'metodo_busqueda', PARAMETRO}
+
+
+def _pedido(request):
+    # Comprobaciones baratas: no construye request.headers ni request.GET
+    # salvo que el parámetro aparezca en la cadena de consulta
+    if META_CABECERA in request.META:
+        return True
+    return f'{PARAMETRO}=' in request.META.get('QUERY_STRING', '') and PARAMETRO in request.GET
+
+
+def _solicitud_drf(request):
+    return Request(request, authenticators=[clase() for clase in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+
+
+def _staff(solicitud):
+    """Usuario autenticado de la solicitud DRF si es is_staff, si no None."""
+    try:
+        usuario = solicitud.user
+    except APIException:
+        return None
+    return usuario if usuario.is_staff else None
+
+
+def ruta_sin_datos(request):
+    """Ruta de la solicitud con los valores de los parámetros reemplazados por *."""
+    parametros = QueryDict(mutable=True)
+    for nombre, valores in request.GET.lists():
+        parametros.setlist(nombre, valores if nombre in PARAMETROS_VISIBLES else ['*'] * len(valores))
+    return f'{request.path}?{parametros.urlencode(safe="*")}' if parametros else request.path
+
+
+def guardar_informe(request, response, usuario, duracion, perfil, consultas):
+    estadisticas = pstats.Stats(perfil)
+    funciones = getattr(settings, 'PERFILADO_FUNCIONES', 40)
+    tiempo_bd = sum(segundos for _, segundos in consultas)
+    ruta = ruta_sin_datos(request)
+
+    salida = io.StringIO()
+    salida.write(
+        f'{request.method} {ruta} -> {response.status_code} en {duracion * 1000:.1f} ms\n'
+        f'Usuario: {usuario.username}\n'
+        f'Consultas SQL: {len(consultas)} en {tiempo_bd * 1000:.1f} ms\n\n'
+        '== Consultas SQL, en orden de ejecución ==\n'
+    )
+    for numero, (sql, segundos) in enumerate(consultas, 1):
+        salida.write(f'{numero:>4}. {segundos * 1000:>9.2f} ms  {sql}\n')
+    salida.write('\n== Funciones por tiempo acumulado ==\n')
+    estadisticas.stream = salida
+    estadisticas.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(funciones)
+    salida.write('== Funciones por tiempo propio ==\n')
+    estadisticas.sort_stats(pstats.SortKey.TIME).print_stats(funciones)
+
+    informe = InformePerfil.objects.create(
+        usuario=usuario,
+        metodo=request.method,
+        ruta=ruta[:2000],
+        codigo_estado=response.status_code,
+        duracion_ms=duracion * 1000,
+        consultas=len(consultas),
+        tiempo_bd_ms=tiempo_bd * 1000,
+        informe=salida.getvalue(),
+        # Mismo formato que pstats.Stats.dump_stats
+        estadisticas=marshal.dumps(estadisticas.stats),
+    )
+    # Conservar solo los informes más recientes
+    antiguos = InformePerfil.objects.values_list('pk', flat=True)[getattr(settings, 'PERFILADO_MAXIMO_INFORMES', 200):]
+    InformePerfil.objects.filter(pk__in=list(antiguos)).delete()
+    return informe
+
+
+class PerfiladoMiddleware:
+    # También async: bajo ASGI no añade un paso por un hilo en cada solicitud
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _pedido(request):
+            return self.get_response(request)
+        usuario = _staff(_solicitud_drf(request))
+        if usuario is None:
+            return self.get_response(request)
+
+        perfil = cProfile.Profile()
+        with capturar_consultas() as consultas:
+            inicio = time.perf_counter()
+            perfil.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                perfil.disable()
+            duracion = time.perf_counter() - inicio
+        informe = guardar_informe(request, response, usuario, duracion, perfil, consultas)
+        response['X-Perfil-Id'] = str(informe.pk)
+        return response
+
+    async def __acall__(self, request):
+        if not _pedido(request):
+            return await self.get_response(request)
+        solicitud = _solicitud_drf(request)
+        try:
+            await autenticar_async(solicitud)
+        except APIException:
+            return await self.get_response(request)
+        usuario = _staff(solicitud)
+        if usuario is None:
+            return await self.get_response(request)
+
+        perfil = cProfile.Profile()
+        with capturar_consultas() as consultas:
+            inicio = time.perf_counter()
+            perfil.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                perfil.disable()
+            duracion = time.perf_counter() - inicio
+        informe = await sync_to_async(guardar_informe)(request, response, usuario, duracion, perfil, consultas)
+        response['X-Perfil-Id'] = str(informe.pk)
+        return response
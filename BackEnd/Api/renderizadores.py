@@ -0,0 +1,44 @@
+"""
+Renderizadores opcionales (XML, CSV y YAML) que importan su paquete la
+primera vez que una respuesta los usa.
+
+La negociación de contenido solo necesita media_type y format, así que los
+clientes pueden seguir pidiendo ?format=xml, csv o yaml (o la cabecera
+Accept) sin que cada worker cargue esos paquetes al arrancar.
+"""
+from django.utils.module_loading import import_string
+from rest_framework.renderers import BaseRenderer
+
+
+class RenderizadorDiferido(BaseRenderer):
+    """Delega en la clase indicada en `renderizador`, importada al primer uso."""
+    renderizador = None
+    charset = 'utf-8'
+
+    @classmethod
+    def clase_real(cls):
+        # Se guarda en cada subclase: la importación solo ocurre una vez
+        if '_clase_real' not in cls.__dict__:
+            cls._clase_real = import_string(cls.renderizador)
+        return cls._clase_real
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return self.clase_real()().render(data, accepted_media_type, renderer_context)
+
+
+class XMLDiferido(RenderizadorDiferido):
+    media_type = 'application/xml'
+    format = 'xml'
+    renderizador = 'rest_framework_xml.renderers.XMLRenderer'
+
+
+class CSVDiferido(RenderizadorDiferido):
+    media_type = 'text/csv'
+    format = 'csv'
+    renderizador = 'rest_framework_csv.renderers.CSVRenderer'
+
+
+class YAMLDiferido(RenderizadorDiferido):
+    media_type = 'application/yaml'
+    format = 'yaml'
+    renderizador = 'rest_framework_yaml.renderers.YAMLRenderer'
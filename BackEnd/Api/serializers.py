@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from .metricas import MedirSerializacion
 from .models import Perfil, Paciente, ActividadUsuario
 
-class RegistroUsuarioSerializer(serializers.ModelSerializer):
+class RegistroUsuarioSerializer(MedirSerializacion, serializers.ModelSerializer):
     nombre = serializers.CharField(required=True, write_only=True)
     apellido = serializers.CharField(required=True, write_only=True)
     cargo = serializers.ChoiceField(
@@ -58,26 +59,28 @@ class RegistroUsuarioSerializer(serializers.ModelSerializer):
         
         return user
         
-class PerfilSerializer(serializers.ModelSerializer):
+class PerfilSerializer(MedirSerializacion, serializers.ModelSerializer):
     class Meta:
         model = Perfil
         fields = ('nombre', 'apellido', 'cargo')
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MedirSerializacion, serializers.ModelSerializer):
     perfil = PerfilSerializer(read_only=True)
     
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'perfil')
 
-class PacienteSerializer(serializers.ModelSerializer):
+class PacienteSerializer(MedirSerializacion, serializers.ModelSerializer):
     """
     Serializador para el modelo Paciente.
     Incluye todos los campos y validaciones necesarias.
     """
     class Meta:
         model = Paciente
-        fields = '__all__'
+        # Campos internos: el nombre normalizado para la búsqueda y la versión,
+        # que se expone en el encabezado ETag
+        exclude = ['nombre_madre_normalizado', 'version']
         read_only_fields = ['id_paciente', 'fecha_hora_registro']
     
     def validate_nombre_madre(self, value):
@@ -118,7 +121,7 @@ class PacienteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("La fecha de nacimiento no puede estar en el futuro")
         return value
 
-class PacienteListSerializer(serializers.ModelSerializer):
+class PacienteListSerializer(MedirSerializacion, serializers.ModelSerializer):
     """
     Serializador para listar pacientes con información resumida.
     """
@@ -127,7 +130,7 @@ class PacienteListSerializer(serializers.ModelSerializer):
         fields = ['id', 'id_paciente', 'nombre_madre', 'documento_madre', 'sexo_bebe', 
                  'fecha_nacimiento', 'dado_alta', 'codigo_qr']
 
-class PacienteQRSerializer(serializers.ModelSerializer):
+class PacienteQRSerializer(MedirSerializacion, serializers.ModelSerializer):
     """
     Serializador para buscar pacientes por código QR.
     """
@@ -145,7 +148,7 @@ class PacienteQRSerializer(serializers.ModelSerializer):
         """
         return obj is not None
 
-class ActividadUsuarioSerializer(serializers.ModelSerializer):
+class ActividadUsuarioSerializer(MedirSerializacion, serializers.ModelSerializer):
     username = serializers.CharField(source='usuario.username', read_only=True)
     cargo_usuario = serializers.CharField(source='usuario.perfil.cargo', read_only=True)
     
@@ -0,0 +1,430 @@
+import json
+import pickle
+import tempfile
+import functools
+import threading
+from collections import Counter
+from unittest import mock
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, models, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .actividades import registro_actividades
+from .archivo import archivar, fecha_corte
+from .autenticacion import JWTAuthenticationCache, TokenAuthenticationCache, cache_usuarios
+from .benchmarks import caches_temporales, datos_paciente, sembrar_datos
+from .busqueda import ids_coincidentes
+from .cache_qr import indice_qr
+from .etags import version_coleccion
+from .exportacion import respuesta_exportacion
+from .management.commands.benchmark_endpoints import PRESUPUESTOS, casos_endpoints
+from .models import (
+    ActividadUsuario, EstadisticaDiaria, Paciente, TerminoBusqueda, asignador_id_paciente, crear_pacientes_en_bloque,
+    formatear_id_paciente,
+)
+
+
+# Las actividades se escriben dentro de la solicitud que las genera y, sin
+# réplica, todas las consultas van a la conexión que cuenta assertNumQueries
+@override_settings(ACTIVIDADES_MODO='sincrono', BD_REPLICA_ALIAS=None)
+class PresupuestoConsultasTests(TransactionTestCase):
+    """
+    Consultas SQL de cada endpoint, con las mismas solicitudes y presupuestos
+    que python manage.py benchmark_endpoints. Si un cambio añade o quita
+    consultas, hay que ajustar PRESUPUESTOS en ese comando.
+
+    TransactionTestCase y no TestCase: dentro de la transacción de TestCase
+    no se ejecutan los BEGIN y COMMIT que cada escritura sí hace en producción.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(caches_temporales())
+        super().setUpClass()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.admin, self.enfermero = sembrar_datos(pacientes=60, actividades=300, usuarios=2)
+        self.admin.is_staff = True
+        self.admin.save()
+
+    def comprobar(self, nombre):
+        for numero, variante in enumerate(casos_endpoints(self.admin, self.enfermero)[nombre]):
+            with self.subTest(variante=numero):
+                # Las dos primeras llamadas llenan las cachés y crean las
+                # filas de estadísticas que las siguientes solo actualizan
+                variante()
+                variante()
+                with self.assertNumQueries(PRESUPUESTOS[nombre]):
+                    respuesta = variante()
+                self.assertLess(respuesta.status_code, 400, getattr(respuesta, 'data', ''))
+
+    def test_pacientes_listar(self):
+        self.comprobar('pacientes_listar')
+
+    def test_pacientes_listar_304(self):
+        self.comprobar('pacientes_listar_304')
+
+    def test_pacientes_crear(self):
+        self.comprobar('pacientes_crear')
+
+    def test_pacientes_lote(self):
+        self.comprobar('pacientes_lote')
+
+    def test_pacientes_buscar(self):
+        self.comprobar('pacientes_buscar')
+
+    def test_paciente_detalle(self):
+        self.comprobar('paciente_detalle')
+
+    def test_paciente_detalle_304(self):
+        self.comprobar('paciente_detalle_304')
+
+    def test_paciente_editar(self):
+        self.comprobar('paciente_editar')
+
+    def test_paciente_sin_cambios(self):
+        self.comprobar('paciente_sin_cambios')
+
+    def test_qr_buscar(self):
+        self.comprobar('qr_buscar')
+
+    def test_qr_buscar_lote(self):
+        self.comprobar('qr_buscar_lote')
+
+    def test_qr_cache(self):
+        self.comprobar('qr_cache')
+
+    def test_alta_actualizar(self):
+        self.comprobar('alta_actualizar')
+
+    def test_alta_cambiar(self):
+        self.comprobar('alta_cambiar')
+
+    def test_alta_lote(self):
+        self.comprobar('alta_lote')
+
+    def test_actividades_listar(self):
+        self.comprobar('actividades_listar')
+
+    def test_actividades_listar_admin(self):
+        self.comprobar('actividades_listar_admin')
+
+    def test_actividades_cursor(self):
+        self.comprobar('actividades_cursor')
+
+    def test_estadisticas(self):
+        self.comprobar('estadisticas')
+
+    def test_usuario_actual(self):
+        self.comprobar('usuario_actual')
+
+    def test_usuario_actual_sin_cache(self):
+        self.comprobar('usuario_actual_sin_cache')
+
+    def test_login_token(self):
+        self.comprobar('login_token')
+
+    def test_todos_los_endpoints_tienen_prueba(self):
+        self.assertEqual(set(casos_endpoints(self.admin, self.enfermero)), set(PRESUPUESTOS))
+        for nombre in PRESUPUESTOS:
+            self.assertTrue(hasattr(self, f'test_{nombre}'), nombre)
+
+
+class ExportarActividadesArchivadasTests(TestCase):
+    """La exportación del historial incluye las actividades ya archivadas."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(caches_temporales())
+        directorio = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(ACTIVIDADES_ARCHIVO_DIR=directorio))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = sembrar_datos(pacientes=10, actividades=60, usuarios=2)[0]
+        cls.admin.is_staff = True
+        cls.admin.save()
+        cls.ids = set(ActividadUsuario.objects.values_list('pk', flat=True))
+        # La mitad, en dos meses de hace dos años
+        antiguas = sorted(cls.ids)[:30]
+        hace_dos_anos = timezone.now() - timedelta(days=730)
+        ActividadUsuario.objects.filter(pk__in=antiguas[:15]).update(fecha_hora=hace_dos_anos)
+        ActividadUsuario.objects.filter(pk__in=antiguas[15:]).update(fecha_hora=hace_dos_anos - timedelta(days=40))
+        cls.archivadas = archivar(fecha_corte())
+
+    def test_exporta_activas_y_archivadas(self):
+        self.assertEqual(self.archivadas, 30)
+        self.client.force_login(self.admin)
+        respuesta = self.client.get('/api/actividades/exportar/', {'formato': 'ndjson', 'fecha_desde': '2000-01-01'})
+        self.assertEqual(respuesta.status_code, 200)
+        filas = [json.loads(linea) for linea in b''.join(respuesta.streaming_content).decode().splitlines()]
+        self.assertEqual(len(filas), 60)
+        self.assertEqual({fila['id'] for fila in filas}, self.ids)
+
+
+@override_settings(ACTIVIDADES_MODO='sincrono')
+class BuscarPorQRTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(caches_temporales())
+        super().setUpClass()
+
+    def setUp(self):
+        indice_qr.limpiar()
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(User.objects.create_user('enfermero', password='x'))
+
+    def buscar(self, codigo_qr):
+        respuesta = self.cliente.post('/api/pacientes/qr/buscar/', {'codigo_qr': codigo_qr}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        return respuesta.data['existe']
+
+    def test_codigo_numerico(self):
+        self.cliente.post('/api/pacientes/', datos_paciente(1, codigo_qr='12345'), format='json')
+        self.assertTrue(self.buscar(12345))
+        self.assertFalse(self.buscar(54321))
+
+    def test_registro_invalida_la_cache_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.cliente.post('/api/pacientes/', datos_paciente(2, codigo_qr='QR-NUEVO'), format='json')
+            self.assertEqual(respuesta.status_code, 201)
+            # Un escaneo concurrente que aún no ve el registro
+            indice_qr.guardar_ausente('QR-NUEVO')
+        self.assertIsNone(indice_qr.buscar('QR-NUEVO'))
+        self.assertTrue(self.buscar('QR-NUEVO'))
+
+
+class CrearPacientesEnBloqueTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(caches_temporales())
+        super().setUpClass()
+
+    def crear(self, inicio, **kwargs):
+        pacientes = [
+            Paciente(id_paciente=f'BLOQUE{indice}', **datos_paciente(indice)) for indice in range(inicio, inicio + 3)
+        ]
+        for paciente in pacientes:
+            paciente.normalizar_campos()
+        return crear_pacientes_en_bloque(pacientes, **kwargs)
+
+    def test_receptores_de_post_save(self):
+        version = version_coleccion()
+        indice_qr.guardar_ausente('QR-PRUEBA-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            pacientes = self.crear(0)
+        ids = ids_coincidentes(TerminoBusqueda.TIPO_PACIENTE, 'madre prueba')
+        self.assertEqual(set(ids.values_list('objeto_id', flat=True)), {paciente.pk for paciente in pacientes})
+        self.assertEqual(EstadisticaDiaria.objects.get().nacimientos, 3)
+        self.assertGreater(version_coleccion(), version)
+        self.assertIsNone(indice_qr.buscar('QR-PRUEBA-1'))
+
+    def test_sin_estadisticas(self):
+        self.crear(10, estadisticas=False)
+        self.assertFalse(EstadisticaDiaria.objects.exists())
+
+
+class CacheUsuariosTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(caches_temporales())
+        super().setUpClass()
+
+    def setUp(self):
+        cache_usuarios.limpiar()
+        self.usuario = User.objects.create_user('enfermero', password='secreta')
+
+    def test_token_sin_contrasena_en_cache(self):
+        token = Token.objects.create(user=self.usuario)
+        # La primera búsqueda solo recuerda de quién es el token
+        for _ in range(3):
+            usuario, _token = TokenAuthenticationCache().authenticate_credentials(token.key)
+        self.assertEqual((cache_usuarios.aciertos, cache_usuarios.fallos), (1, 2))
+        self.assertNotIn(self.usuario.password.encode(), pickle.dumps(cache_usuarios.cache.get(f'token:{token.key}')))
+        self.assertEqual(usuario.perfil.usuario_id, self.usuario.pk)
+        # La contraseña diferida se lee al usarla
+        self.assertTrue(usuario.check_password('secreta'))
+
+    @mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_jwt_revocado_con_usuario_en_cache(self):
+        autenticador = JWTAuthenticationCache()
+        token = AccessToken.for_user(self.usuario)
+        for _ in range(2):
+            self.assertEqual(autenticador.get_user(token).pk, self.usuario.pk)
+        self.assertEqual(cache_usuarios.aciertos, 1)
+        entrada = cache_usuarios.cache.get(f'usuario:{self.usuario.pk}')
+        self.assertNotIn(self.usuario.password.encode(), pickle.dumps(entrada))
+        token[api_settings.REVOKE_TOKEN_CLAIM] = 'otra'
+        with self.assertRaises(AuthenticationFailed):
+            autenticador.get_user(token)
+
+
+class Deshacer(Exception):
+    pass
+
+
+@override_settings(ID_PACIENTE_BLOQUE=5)
+class AsignadorIdPacienteTests(TransactionTestCase):
+    """IDs de paciente únicos con bloques reservados en memoria."""
+
+    def setUp(self):
+        asignador_id_paciente._reiniciar()
+        self.addCleanup(asignador_id_paciente._reiniciar)
+
+    def crear(self, indice, deshacer=False):
+        """Registra un paciente en su propia transacción y devuelve su ID."""
+        try:
+            with transaction.atomic():
+                paciente = Paciente(**datos_paciente(indice))
+                paciente.save()
+                if deshacer:
+                    raise Deshacer
+        except Deshacer:
+            return None
+        return paciente.id_paciente
+
+    def test_transaccion_deshecha_descarta_el_bloque(self):
+        self.assertIsNone(self.crear(0, deshacer=True))
+        # Otro proceso reserva los números que volvieron a la secuencia
+        for numero in asignador_id_paciente.reservar(5):
+            Paciente.objects.create(id_paciente=formatear_id_paciente(numero), **datos_paciente(100 + numero))
+        ids = [self.crear(indice) for indice in range(1, 8)]
+        self.assertEqual(Paciente.objects.count(), 12)
+        self.assertEqual(len(set(Paciente.objects.values_list('id_paciente', flat=True))), 12)
+        self.assertEqual(len(set(ids)), 7)
+
+    def test_hilos_simultaneos(self):
+        hilos, por_hilo = 6, 15
+        ids, errores = [], []
+        lock = threading.Lock()
+        # La base de pruebas en memoria falla en lugar de esperar cuando dos
+        # hilos escriben a la vez: se turnan por transacción, como hace
+        # SQLite con BEGIN IMMEDIATE, y comparten el bloque del asignador
+        escritura = threading.Lock()
+        barrera = threading.Barrier(hilos)
+
+        def trabajador(numero_hilo):
+            barrera.wait()
+            try:
+                for i in range(por_hilo):
+                    # Uno de cada cuatro registros se deshace
+                    with escritura:
+                        id_paciente = self.crear(numero_hilo * por_hilo + i, deshacer=i % 4 == 0)
+                    if id_paciente:
+                        with lock:
+                            ids.append(id_paciente)
+            except Exception as error:
+                with lock:
+                    errores.append(error)
+            finally:
+                connection.close()
+
+        trabajadores = [threading.Thread(target=trabajador, args=(n,)) for n in range(hilos)]
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual([id_paciente for id_paciente, veces in Counter(ids).items() if veces > 1], [])
+        self.assertEqual(Paciente.objects.count(), len(ids))
+
+
+@override_settings(ACTIVIDADES_MODO='diferido', ACTIVIDADES_BUFFER_INTERVALO=60)
+class RegistroActividadesDiferidoTests(TransactionTestCase):
+
+    def setUp(self):
+        self.addCleanup(registro_actividades.vaciar)
+        self.usuario = User.objects.create_user('enfermero', password='x')
+
+    def test_solo_se_registran_las_de_transacciones_confirmadas(self):
+        try:
+            with transaction.atomic():
+                paciente = Paciente.objects.create(**datos_paciente(1))
+                registro_actividades.registrar(usuario=self.usuario, tipo_actividad='busqueda', paciente=paciente)
+                raise Deshacer
+        except Deshacer:
+            pass
+        with transaction.atomic():
+            paciente = Paciente.objects.create(**datos_paciente(2))
+            registro_actividades.registrar(usuario=self.usuario, tipo_actividad='busqueda', paciente=paciente)
+            # Hasta el commit no entra al buffer
+            self.assertEqual(registro_actividades.vaciar(), 0)
+
+        self.assertEqual(ActividadUsuario.objects.count(), 0)
+        self.assertEqual(registro_actividades.vaciar(), 1)
+        self.assertEqual(list(ActividadUsuario.objects.values_list('paciente', flat=True)), [paciente.pk])
+
+
+class RespuestaStreamingTests(SimpleTestCase):
+
+    async def test_bajo_asgi_cada_trozo_sale_al_generarse(self):
+        generadas = []
+
+        def filas():
+            for numero in range(450):
+                generadas.append(numero)
+                yield {'numero': numero}
+
+        respuesta = respuesta_exportacion('prueba', 'ndjson', ['numero'], filas())
+        # Filas generadas cuando se envía cada trozo (FILAS_POR_TROZO = 200)
+        self.assertEqual([len(generadas) async for _ in respuesta], [200, 400, 450])
+
+
+@override_settings(ACTIVIDADES_MODO='sincrono')
+class AltaLoteTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.enterClassContext(caches_temporales())
+        super().setUpClass()
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(User.objects.create_user('enfermero', password='x'))
+        self.pacientes = [Paciente.objects.create(**datos_paciente(indice)) for indice in range(3)]
+
+    def test_escritura_concurrente_no_registra_ediciones_ajenas(self):
+        otro = self.pacientes[0]
+        reduce = functools.reduce
+        intentos = []
+
+        def escritura_concurrente(*args):
+            # Entre la lectura y el UPDATE, otra solicitud da de alta a un paciente
+            if not intentos:
+                Paciente.objects.filter(pk=otro.pk).update(dado_alta='True', version=models.F('version') + 1)
+            intentos.append(1)
+            return reduce(*args)
+
+        with mock.patch('Api.views.functools.reduce', escritura_concurrente):
+            respuesta = self.cliente.post('/api/pacientes/alta/lote/', {
+                'pacientes': [paciente.id_paciente for paciente in self.pacientes], 'dado_alta': 'True',
+            }, format='json')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(intentos), 2)
+        # El primer intento se deshizo con la escritura simulada; el segundo
+        # cambió los tres y registró una edición por cada uno
+        self.assertEqual(respuesta.data['actualizados'], 3)
+        versiones = dict(Paciente.objects.values_list('pk', 'version'))
+        for paciente in self.pacientes:
+            self.assertEqual(versiones[paciente.pk], paciente.version + 1)
+        self.assertEqual(
+            sorted(ActividadUsuario.objects.filter(tipo_actividad='edicion').values_list('paciente', flat=True)),
+            sorted(paciente.pk for paciente in self.pacientes)
+        )
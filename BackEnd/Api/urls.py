@@ -9,10 +9,23 @@ urlpatterns = [
     
     # Rutas de pacientes
     path('pacientes/', views.PacienteListCreateView.as_view(), name='paciente-list-create'),
+    path('pacientes/lote/', views.crear_pacientes_lote, name='crear-pacientes-lote'),
+    path('pacientes/alta/lote/', views.actualizar_alta_lote, name='actualizar-alta-lote'),
+    path('pacientes/buscar/', views.buscar_pacientes, name='buscar-pacientes'),
+    path('pacientes/exportar/', views.ExportarPacientesView.as_view(), name='exportar-pacientes'),
     path('pacientes/<str:id_paciente>/', views.PacienteDetailView.as_view(), name='paciente-detail'),
     path('pacientes/qr/buscar/', views.buscar_por_qr, name='buscar-paciente-qr'),
+    path('pacientes/qr/buscar-lote/', views.buscar_por_qr_lote, name='buscar-pacientes-qr-lote'),
+    path('pacientes/qr/cache/', views.estadisticas_cache_qr, name='estadisticas-cache-qr'),
     path('pacientes/<str:id_paciente>/alta/', views.actualizar_estado_alta, name='actualizar-alta-paciente'),
 
     # Añadir URL para actividades del usuario
     path('actividades/', views.ActividadesUsuarioView.as_view(), name='actividades-usuario'),
+    path('actividades/exportar/', views.ExportarActividadesView.as_view(), name='exportar-actividades'),
+
+    # Estadísticas de nacimientos
+    path('estadisticas/', views.estadisticas_nacimientos, name='estadisticas-nacimientos'),
+
+    # Métricas de rendimiento para Prometheus
+    path('metrics/', views.metricas, name='metricas'),
 ]
\ No newline at end of file
@@ -1,11 +1,32 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueValidator
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.contrib.auth.models import User
-from .models import Perfil, Paciente, ActividadUsuario
-from django.db import models
+from .models import Perfil, Paciente, ActividadUsuario, TerminoBusqueda, VersionObsoleta, asignador_id_paciente, crear_pacientes_en_bloque, detalle_cambio, formatear_id_paciente, normalizar
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from .actividades import registro_actividades
+from .cache_qr import AUSENTE, indice_qr
+from .busqueda import FIN_PREFIJO, ids_coincidentes, terminos, terminos_indice
+from .archivo import ArchivoPaginable, HistorialCombinado
+from .estadisticas import CAMPOS_ESTADISTICA, registrar_modificaciones, resumen as resumen_estadisticas
+from .etags import (
+    avanzar_coleccion,
+    con_etag,
+    etag_listado,
+    etag_paciente,
+    no_modificado,
+    precondicion_fallida,
+    respuesta_no_modificada,
+    respuesta_precondicion_fallida,
+    version_coleccion,
+)
+from .metricas import PrometheusRenderer, PuedeVerMetricas, registro_metricas
+from .exportacion import formato_solicitado, respuesta_exportacion, serializar_iterando
 from .serializers import (
     RegistroUsuarioSerializer, 
     UserSerializer, 
@@ -16,7 +37,22 @@ from .serializers import (
 )
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from base64 import b64decode, b64encode
+from datetime import timedelta
+import binascii
+import datetime
+import functools
+import itertools
+import operator
+
+# Veces que una modificación sin If-Match se vuelve a aplicar cuando otra
+# escritura cambió el paciente entre la lectura y el UPDATE
+INTENTOS_ESCRITURA = 3
 
 # Vistas para la gestión de pacientes
 
@@ -35,7 +71,49 @@ class PacienteListCreateView(generics.ListCreateAPIView):
             return PacienteListSerializer
         return PacienteSerializer
     
+    def list(self, request, *args, **kwargs):
+        """
+        Responde 304 sin consultar los pacientes si If-None-Match coincide
+        con el ETag de la página, que depende de la versión de la colección.
+        """
+        # La versión se lee antes que los datos: si otra solicitud escribe
+        # en medio, el ETag queda desactualizado y la próxima vez no coincide
+        etag = etag_listado(request, version_coleccion())
+        if no_modificado(request, etag):
+            return respuesta_no_modificada(etag)
+        
+        if getattr(settings, 'PACIENTES_LISTADO_RAPIDO', True):
+            respuesta = self._listar_rapido()
+        else:
+            respuesta = super().list(request, *args, **kwargs)
+        return con_etag(respuesta, etag)
+    
+    def _listar_rapido(self):
+        """
+        Con PACIENTES_LISTADO_RAPIDO se leen las columnas del listado como
+        tuplas, sin crear instancias del modelo ni pasar por los campos del
+        serializador. La respuesta es idéntica a la de PacienteListSerializer.
+        """
+        campos = PacienteListSerializer.Meta.fields
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*campos)
+        pagina = self.paginate_queryset(queryset)
+        filas = pagina if pagina is not None else queryset
+        resultados = [dict(zip(campos, fila)) for fila in filas]
+        # Las fechas se representan en ISO 8601, como lo hace el DateField del
+        # serializador; el resto de columnas del listado son texto o enteros
+        fechas = [campo for campo in campos if type(Paciente._meta.get_field(campo)) is models.DateField]
+        for resultado in resultados:
+            for campo in fechas:
+                if resultado[campo] is not None:
+                    resultado[campo] = resultado[campo].isoformat()
+        
+        if pagina is not None:
+            return self.get_paginated_response(resultados)
+        return Response(resultados)
+    
+    @transaction.atomic
     def perform_create(self, serializer):
+        # El paciente, sus términos de búsqueda y la actividad se guardan juntos
         paciente = serializer.save()
         # Registrar actividad de creación
         ActividadUsuario.objects.create(
@@ -56,85 +134,182 @@ class PacienteDetailView(generics.RetrieveUpdateAPIView):
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         
-        # Registrar actividad de búsqueda por ID
-        ActividadUsuario.objects.create(
+        # Registrar actividad de búsqueda por ID (escritura diferida)
+        registro_actividades.registrar(
             usuario=request.user,
             tipo_actividad='busqueda',
             paciente=instance,
             metodo_busqueda='id'
         )
         
+        etag = etag_paciente(request, instance)
+        if no_modificado(request, etag):
+            return respuesta_no_modificada(etag)
+        
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return con_etag(Response(serializer.data), etag)
+    
+    def perform_update(self, serializer):
+        """
+        Aplica los datos validados y guarda solo las columnas que cambiaron,
+        junto con la actividad de edición que las detalla. Si no cambió
+        nada no se ejecuta el UPDATE ni se registra actividad.
+        """
+        instance = serializer.instance
+        for campo, valor in serializer.validated_data.items():
+            setattr(instance, campo, valor)
+        cambios = instance.detalle_cambios()
+        if not cambios:
+            return
+        # El paciente, su índice de búsqueda, las estadísticas y la actividad
+        # se guardan juntos
+        with transaction.atomic():
+            instance.save(update_fields=list(cambios))
+            ActividadUsuario.objects.create(
+                usuario=self.request.user,
+                tipo_actividad='edicion',
+                paciente=instance,
+                detalles_cambio=cambios
+            )
     
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
-        instance = self.get_object()
+        for _ in range(INTENTOS_ESCRITURA):
+            instance = self.get_object()
+            
+            # If-Match protege de sobrescribir cambios hechos por otra solicitud
+            etag = etag_paciente(request, instance)
+            if precondicion_fallida(request, etag):
+                return respuesta_precondicion_fallida(etag)
+            
+            serializer = self.get_serializer(instance, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            try:
+                self.perform_update(serializer)
+                break
+            except VersionObsoleta:
+                # Otra solicitud guardó antes: se vuelve a leer el paciente y,
+                # si la solicitud trae If-Match, la comprobación ya no coincide
+                continue
+        else:
+            return respuesta_precondicion_fallida(etag_paciente(request, self.get_object()))
         
-        # Guardar valores antiguos antes de la actualización
-        valores_antiguos = {
-            'nombre_madre': instance.nombre_madre,
-            'documento_madre': instance.documento_madre,
-            'sexo_bebe': instance.sexo_bebe,
-            'talla': str(instance.talla),
-            'peso': str(instance.peso),
-            'fecha_nacimiento': str(instance.fecha_nacimiento),
-            'hora_nacimiento': str(instance.hora_nacimiento),
-            'dado_alta': instance.dado_alta,
-        }
+        if getattr(instance, '_prefetched_objects_cache', None):
+            instance._prefetched_objects_cache = {}
+            
+        return con_etag(Response(serializer.data), etag_paciente(request, instance))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def crear_pacientes_lote(request):
+    """
+    Vista para registrar varios pacientes en una sola solicitud.
+    Cada paciente se valida por separado; los válidos se guardan juntos
+    en una sola transacción y cada elemento recibe su propio resultado.
+    """
+    datos = request.data.get('pacientes') if isinstance(request.data, dict) else request.data
+    
+    if not isinstance(datos, list) or not datos:
+        return Response(
+            {"error": "Se requiere una lista de pacientes"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    maximo = getattr(settings, 'LOTE_PACIENTES_MAX', 200)
+    if len(datos) > maximo:
+        return Response(
+            {"error": f"No se pueden registrar más de {maximo} pacientes por solicitud"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    resultados = [None] * len(datos)
+    validos = []
+    codigos_qr = set()
+    
+    # Un solo serializador para todo el lote, como hace ListSerializer,
+    # evita reconstruir los campos en cada elemento
+    validador = PacienteSerializer()
+    
+    # La unicidad del código QR se verifica con una sola consulta para todo
+    # el lote en lugar de una consulta por paciente
+    campo_qr = validador.fields['codigo_qr']
+    campo_qr.validators = [v for v in campo_qr.validators if not isinstance(v, UniqueValidator)]
+    codigos_existentes = set(Paciente.objects.filter(
+        codigo_qr__in=[elemento.get('codigo_qr') for elemento in datos
+                       if isinstance(elemento, dict) and elemento.get('codigo_qr')]
+    ).values_list('codigo_qr', flat=True))
+    
+    for indice, elemento in enumerate(datos):
+        try:
+            datos_validados = validador.run_validation(elemento)
+        except ValidationError as e:
+            resultados[indice] = {"indice": indice, "exito": False, "errores": e.detail}
+            continue
         
-        # Actualizar el paciente con los nuevos datos
-        serializer = self.get_serializer(instance, data=request.data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        
-        # Calcular los cambios realizados comparando los valores antiguos con los nuevos
-        cambios = {}
-        campos_display = {
-            'nombre_madre': 'Nombre de la madre',
-            'documento_madre': 'Documento de la madre',
-            'sexo_bebe': 'Sexo del bebé',
-            'talla': 'Talla (cm)',
-            'peso': 'Peso (kg)',
-            'fecha_nacimiento': 'Fecha de nacimiento',
-            'hora_nacimiento': 'Hora de nacimiento',
-            'dado_alta': 'Estado de alta'
-        }
+        codigo_qr = datos_validados.get('codigo_qr')
+        if codigo_qr and codigo_qr in codigos_existentes:
+            resultados[indice] = {
+                "indice": indice,
+                "exito": False,
+                "errores": {"codigo_qr": ["Ya existe un paciente con este código QR"]}
+            }
+            continue
+        if codigo_qr and codigo_qr in codigos_qr:
+            resultados[indice] = {
+                "indice": indice,
+                "exito": False,
+                "errores": {"codigo_qr": ["El código QR está repetido dentro del lote"]}
+            }
+            continue
+        if codigo_qr:
+            codigos_qr.add(codigo_qr)
+        validos.append((indice, datos_validados))
+    
+    if validos:
+        pacientes = [Paciente(**datos_validados) for _, datos_validados in validos]
         
-        for campo, valor_antiguo in valores_antiguos.items():
-            valor_nuevo = str(getattr(instance, campo))
-            if valor_antiguo != valor_nuevo:
-                # Formatear valores especiales para mejor legibilidad
-                if campo == 'sexo_bebe':
-                    valor_antiguo_display = 'Masculino' if valor_antiguo == 'M' else 'Femenino'
-                    valor_nuevo_display = 'Masculino' if valor_nuevo == 'M' else 'Femenino'
-                elif campo == 'dado_alta':
-                    valor_antiguo_display = 'Sí' if valor_antiguo == 'True' else 'No'
-                    valor_nuevo_display = 'Sí' if valor_nuevo == 'True' else 'No'
-                else:
-                    valor_antiguo_display = valor_antiguo
-                    valor_nuevo_display = valor_nuevo
+        try:
+            with transaction.atomic():
+                # Un solo incremento de la secuencia para todo el lote
+                numeros = asignador_id_paciente.reservar(len(pacientes))
+                for paciente, numero in zip(pacientes, numeros):
+                    paciente.id_paciente = formatear_id_paciente(numero)
+                    paciente.normalizar_campos()
                 
-                cambios[campo] = {
-                    'campo_display': campos_display.get(campo, campo),
-                    'valor_antiguo': valor_antiguo,
-                    'valor_nuevo': valor_nuevo,
-                    'valor_antiguo_display': valor_antiguo_display,
-                    'valor_nuevo_display': valor_nuevo_display
-                }
-        
-        # Registrar actividad de edición con los cambios detallados
-        ActividadUsuario.objects.create(
-            usuario=request.user,
-            tipo_actividad='edicion',
-            paciente=instance,
-            detalles_cambio=cambios
-        )
+                crear_pacientes_en_bloque(pacientes)
+                
+                # Registrar actividad de creación para todo el lote
+                ActividadUsuario.objects.bulk_create([
+                    ActividadUsuario(
+                        usuario=request.user,
+                        tipo_actividad='creacion',
+                        paciente=paciente
+                    )
+                    for paciente in pacientes
+                ])
+        except IntegrityError as e:
+            # Otro registro tomó alguno de los códigos QR mientras se validaba el lote
+            return Response(
+                {"error": f"No se pudo registrar el lote: {e}"}, 
+                status=status.HTTP_409_CONFLICT
+            )
         
-        if getattr(instance, '_prefetched_objects_cache', None):
-            instance._prefetched_objects_cache = {}
-            
-        return Response(serializer.data)
+        serializados = PacienteSerializer(pacientes, many=True).data
+        for (indice, _), paciente in zip(validos, serializados):
+            resultados[indice] = {"indice": indice, "exito": True, "paciente": paciente}
+    
+    if len(validos) == len(datos):
+        codigo = status.HTTP_201_CREATED
+    elif validos:
+        codigo = status.HTTP_207_MULTI_STATUS
+    else:
+        codigo = status.HTTP_400_BAD_REQUEST
+    
+    return Response({
+        "creados": len(validos),
+        "fallidos": len(datos) - len(validos),
+        "resultados": resultados
+    }, status=codigo)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -142,7 +317,7 @@ def buscar_por_qr(request):
     """
     Vista para buscar un paciente por su código QR.
     """
-    codigo_qr = request.data.get('codigo_qr')
+    codigo_qr = request.data.get('codigo_qr') if isinstance(request.data, dict) else None
     
     if not codigo_qr:
         return Response(
@@ -150,22 +325,37 @@ def buscar_por_qr(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Un número JSON se busca como texto, igual que en buscar_por_qr_lote
+    codigo_qr = str(codigo_qr)
+    
     try:
-        paciente = Paciente.objects.filter(codigo_qr=codigo_qr).first()
+        paciente_pk = indice_qr.buscar(codigo_qr)
+        paciente = None
+        
+        if paciente_pk:
+            # La caché solo indica qué paciente es; sus datos se leen siempre
+            paciente = Paciente.objects.filter(pk=paciente_pk, codigo_qr=codigo_qr).first()
+        if paciente is None and paciente_pk != AUSENTE:
+            # No está en caché (o el paciente cambió de código): consultar y
+            # guardar el resultado, exista o no
+            paciente = Paciente.objects.filter(codigo_qr=codigo_qr).first()
+            if paciente:
+                indice_qr.guardar(codigo_qr, paciente.pk)
+            else:
+                indice_qr.guardar_ausente(codigo_qr)
         
         if paciente:
-            # Registrar actividad de búsqueda
-            ActividadUsuario.objects.create(
+            # Registrar actividad de búsqueda (escritura diferida)
+            registro_actividades.registrar(
                 usuario=request.user,
                 tipo_actividad='busqueda',
                 paciente=paciente,
                 metodo_busqueda='qr'
             )
             
-            serializer = PacienteSerializer(paciente)
             return Response({
                 "existe": True,
-                "paciente": serializer.data
+                "paciente": PacienteSerializer(paciente).data
             })
         else:
             return Response({
@@ -179,6 +369,181 @@ def buscar_por_qr(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def buscar_por_qr_lote(request):
+    """
+    Vista para buscar varios pacientes por código QR en una sola solicitud.
+    Los resultados se devuelven en el mismo orden de los códigos recibidos.
+    """
+    codigos_qr = request.data.get('codigos_qr') if isinstance(request.data, dict) else None
+    
+    if not isinstance(codigos_qr, list) or not codigos_qr:
+        return Response(
+            {"error": "Se requiere una lista de códigos QR"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    maximo = getattr(settings, 'QR_LOTE_MAX', 100)
+    if len(codigos_qr) > maximo:
+        return Response(
+            {"error": f"No se pueden buscar más de {maximo} códigos por solicitud"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    codigos_qr = [str(codigo) for codigo in codigos_qr]
+    
+    # Una sola lectura de la caché para todos los códigos
+    en_cache = indice_qr.buscar_varios(codigos_qr)
+    pendientes = {codigo_qr for codigo_qr in codigos_qr if codigo_qr not in en_cache}
+    conocidos = {codigo_qr: pk for codigo_qr, pk in en_cache.items() if pk != AUSENTE}
+    
+    encontrados = {}
+    if conocidos or pendientes:
+        # Una sola consulta para los pacientes que la caché ya ubicó y los
+        # códigos que no estaban en ella; los datos se leen siempre
+        pacientes = Paciente.objects.filter(
+            models.Q(pk__in=conocidos.values()) | models.Q(codigo_qr__in=pendientes)
+        )
+        encontrados = {paciente.codigo_qr: paciente for paciente in pacientes}
+        # Un paciente que cambió de código desde que se guardó su entrada
+        obsoletos = conocidos.keys() - encontrados.keys()
+        if obsoletos:
+            encontrados.update(
+                (paciente.codigo_qr, paciente) for paciente in Paciente.objects.filter(codigo_qr__in=obsoletos)
+            )
+            pendientes |= obsoletos
+        indice_qr.guardar_varios({
+            codigo_qr: encontrados[codigo_qr].pk for codigo_qr in pendientes if codigo_qr in encontrados
+        })
+        indice_qr.guardar_ausentes(pendientes - encontrados.keys())
+    
+    pedidos = [encontrados[codigo_qr] for codigo_qr in codigos_qr if codigo_qr in encontrados]
+    serializados = iter(PacienteSerializer(pedidos, many=True).data)
+    resultados = []
+    actividades = []
+    for codigo_qr in codigos_qr:
+        if codigo_qr in encontrados:
+            resultados.append({"codigo_qr": codigo_qr, "existe": True, "paciente": next(serializados)})
+            actividades.append({
+                'usuario': request.user,
+                'tipo_actividad': 'busqueda',
+                'paciente_id': encontrados[codigo_qr].pk,
+                'metodo_busqueda': 'qr'
+            })
+        else:
+            resultados.append({"codigo_qr": codigo_qr, "existe": False})
+    
+    # Registrar todas las actividades de búsqueda con una sola inserción
+    registro_actividades.registrar_lote(actividades)
+    
+    return Response({
+        "encontrados": len(actividades),
+        "no_encontrados": len(codigos_qr) - len(actividades),
+        "resultados": resultados
+    })
+
+# Campos devueltos por la búsqueda rápida: lo necesario para elegir al paciente
+CAMPOS_BUSQUEDA_PACIENTES = (
+    'id_paciente', 'nombre_madre', 'documento_madre', 'sexo_bebe', 'fecha_nacimiento', 'dado_alta'
+)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def buscar_pacientes(request):
+    """
+    Vista de búsqueda rápida de pacientes para autocompletar.
+    Si `q` contiene dígitos se busca el documento de la madre o el ID del
+    paciente exactos; si no, los nombres de madre que empiezan por `q`,
+    sin distinguir mayúsculas ni tildes. Ambas búsquedas usan índices.
+    """
+    consulta = (request.query_params.get('q') or '').strip()
+    if not consulta:
+        return Response(
+            {"error": "Se requiere el parámetro q"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    limite_max = getattr(settings, 'PACIENTES_BUSQUEDA_MAX', 50)
+    try:
+        limite = int(request.query_params.get('limite', getattr(settings, 'PACIENTES_BUSQUEDA_LIMITE', 10)))
+    except ValueError:
+        return Response(
+            {"error": "El parámetro limite debe ser un número entero"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    limite = min(max(limite, 1), limite_max)
+    
+    if any(caracter.isdigit() for caracter in consulta):
+        pacientes = Paciente.objects.filter(
+            models.Q(documento_madre=consulta) | models.Q(id_paciente=consulta.upper())
+        ).order_by('id_paciente')
+    else:
+        # "Empieza por" como rango, para que SQLite recorra el índice
+        prefijo = normalizar(consulta)
+        pacientes = Paciente.objects.filter(
+            nombre_madre_normalizado__gte=prefijo,
+            nombre_madre_normalizado__lt=prefijo + FIN_PREFIJO
+        ).order_by('nombre_madre_normalizado', 'id')
+    
+    # Se pide uno más para saber si hay más resultados sin contarlos
+    resultados = list(pacientes.values(*CAMPOS_BUSQUEDA_PACIENTES)[:limite + 1])
+    return Response({
+        "resultados": resultados[:limite],
+        "hay_mas": len(resultados) > limite
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def estadisticas_cache_qr(request):
+    """
+    Vista para consultar los contadores de aciertos y fallos de la caché de QR.
+    """
+    return Response(indice_qr.estadisticas())
+
+@api_view(['GET'])
+@renderer_classes([PrometheusRenderer])
+@permission_classes([PuedeVerMetricas])
+@throttle_classes([])
+def metricas(request):
+    """
+    Vista con las métricas de rendimiento de la API (duración, consultas,
+    serialización y tamaño por ruta) en el formato de texto de Prometheus.
+    """
+    return Response(registro_metricas.exportar())
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def estadisticas_nacimientos(request):
+    """
+    Vista con las estadísticas de los nacidos entre fecha_desde y
+    fecha_hasta (por defecto, los últimos 30 días). Se responde desde los
+    acumulados diarios, sin recorrer la tabla de pacientes.
+    """
+    fechas = {}
+    for parametro in ('fecha_desde', 'fecha_hasta'):
+        valor = request.query_params.get(parametro)
+        if valor:
+            try:
+                fechas[parametro] = parse_date(valor)
+            except ValueError:
+                fechas[parametro] = None
+            if fechas[parametro] is None:
+                return Response(
+                    {"error": f"{parametro}: formato de fecha inválido, use YYYY-MM-DD"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+    
+    hasta = fechas.get('fecha_hasta') or timezone.localdate()
+    desde = fechas.get('fecha_desde') or hasta - timedelta(days=29)
+    if desde > hasta:
+        return Response(
+            {"error": "fecha_desde no puede ser posterior a fecha_hasta"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return Response(resumen_estadisticas(desde, hasta))
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def actualizar_estado_alta(request, id_paciente):
@@ -186,21 +551,45 @@ def actualizar_estado_alta(request, id_paciente):
     Vista para actualizar el estado de alta de un paciente.
     """
     try:
-        paciente = get_object_or_404(Paciente, id_paciente=id_paciente)
-        nuevo_estado = request.data.get('dado_alta')
-        
-        if nuevo_estado is None:
-            return Response(
-                {"error": "Se requiere especificar el estado de alta"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Actualizar el estado
-        paciente.dado_alta = nuevo_estado
-        paciente.save()
+        for _ in range(INTENTOS_ESCRITURA):
+            paciente = get_object_or_404(Paciente, id_paciente=id_paciente)
+            etag = etag_paciente(request, paciente)
+            if precondicion_fallida(request, etag):
+                return respuesta_precondicion_fallida(etag)
+            
+            nuevo_estado = request.data.get('dado_alta')
+            
+            if nuevo_estado is None:
+                return Response(
+                    {"error": "Se requiere especificar el estado de alta"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Actualizar el estado (junto con las estadísticas de alta) y
+            # registrar la actividad, solo si realmente cambia
+            paciente.dado_alta = nuevo_estado
+            cambios = paciente.detalle_cambios()
+            if not cambios:
+                break
+            try:
+                with transaction.atomic():
+                    paciente.save(update_fields=list(cambios))
+                    ActividadUsuario.objects.create(
+                        usuario=request.user,
+                        tipo_actividad='edicion',
+                        paciente=paciente,
+                        detalles_cambio=cambios
+                    )
+                break
+            except VersionObsoleta:
+                # Otra solicitud guardó antes: se vuelve a leer, como en PacienteDetailView.update
+                continue
+        else:
+            paciente = get_object_or_404(Paciente, id_paciente=id_paciente)
+            return respuesta_precondicion_fallida(etag_paciente(request, paciente))
         
         serializer = PacienteSerializer(paciente)
-        return Response(serializer.data)
+        return con_etag(Response(serializer.data), etag_paciente(request, paciente))
     
     except Exception as e:
         return Response(
@@ -208,12 +597,201 @@ def actualizar_estado_alta(request, id_paciente):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def actualizar_alta_lote(request):
+    """
+    Vista para dar de alta (o revertir el alta) de varios pacientes a la vez.
+    Los pacientes que cambian se actualizan con un solo UPDATE, condicionado
+    a la versión leída de cada uno, y sus actividades de edición se insertan
+    juntas; cada ID recibe un resultado breve en lugar de los datos
+    completos del paciente.
+    """
+    datos = request.data if isinstance(request.data, dict) else {'pacientes': request.data}
+    ids = datos.get('pacientes')
+    nuevo_estado = str(datos.get('dado_alta', 'True'))
+    
+    if not isinstance(ids, list) or not ids:
+        return Response(
+            {"error": "Se requiere una lista de IDs de pacientes"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    maximo = getattr(settings, 'ALTA_LOTE_MAX', 200)
+    if len(ids) > maximo:
+        return Response(
+            {"error": f"No se pueden actualizar más de {maximo} pacientes por solicitud"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    campo_alta = Paciente._meta.get_field('dado_alta')
+    if nuevo_estado not in dict(campo_alta.choices):
+        return Response(
+            {"error": f"Estado de alta no válido, use {' o '.join(dict(campo_alta.choices))}"}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    ids = list(dict.fromkeys(str(id_paciente) for id_paciente in ids))
+    
+    for _ in range(INTENTOS_ESCRITURA):
+        try:
+            with transaction.atomic():
+                # select_for_update bloquea las filas en bases de datos que lo
+                # admiten; en SQLite la transacción de escritura ya es exclusiva
+                encontrados = {
+                    fila['id_paciente']: fila
+                    for fila in Paciente.objects.select_for_update().filter(id_paciente__in=ids)
+                    .values('pk', 'id_paciente', 'codigo_qr', 'version', *CAMPOS_ESTADISTICA)
+                }
+                pendientes = [fila for fila in encontrados.values() if fila['dado_alta'] != nuevo_estado]
+                
+                if pendientes:
+                    # Cada fila solo se actualiza si sigue en la versión leída
+                    leidas = functools.reduce(operator.or_, (
+                        models.Q(pk=fila['pk'], version=fila['version']) for fila in pendientes
+                    ))
+                    actualizados = Paciente.objects.filter(leidas).update(
+                        dado_alta=nuevo_estado, version=models.F('version') + 1
+                    )
+                    if actualizados != len(pendientes):
+                        # Otra solicitud cambió alguno entre la lectura y el
+                        # UPDATE: se deshace y se vuelve a leer, para no
+                        # registrar ediciones que hizo otro
+                        raise VersionObsoleta
+                    
+                    # QuerySet.update no envía post_save: estadísticas, versión de la
+                    # colección y actividades se actualizan aquí
+                    registrar_modificaciones(
+                        ({campo: fila[campo] for campo in CAMPOS_ESTADISTICA},
+                         {campo: fila[campo] for campo in CAMPOS_ESTADISTICA} | {'dado_alta': nuevo_estado})
+                        for fila in pendientes
+                    )
+                    avanzar_coleccion()
+                    
+                    ActividadUsuario.objects.bulk_create([
+                        ActividadUsuario(
+                            usuario=request.user,
+                            tipo_actividad='edicion',
+                            paciente_id=fila['pk'],
+                            detalles_cambio={'dado_alta': detalle_cambio(campo_alta, fila['dado_alta'], nuevo_estado)}
+                        )
+                        for fila in pendientes
+                    ])
+            break
+        except VersionObsoleta:
+            continue
+    else:
+        return Response(
+            {"error": "Los pacientes se modificaron al mismo tiempo, intente de nuevo"}, 
+            status=status.HTTP_409_CONFLICT
+        )
+    
+    if pendientes:
+        # Los datos guardados en la caché de QR incluyen el estado de alta
+        indice_qr.invalidar(
+            codigos_qr=[fila['codigo_qr'] for fila in pendientes],
+            pks=[fila['pk'] for fila in pendientes]
+        )
+    
+    cambiados = {fila['id_paciente'] for fila in pendientes}
+    resultados = [
+        {
+            "id_paciente": id_paciente,
+            "estado": "actualizado" if id_paciente in cambiados
+                      else "sin_cambios" if id_paciente in encontrados
+                      else "no_encontrado"
+        }
+        for id_paciente in ids
+    ]
+    
+    if len(encontrados) == len(ids):
+        codigo = status.HTTP_200_OK
+    elif encontrados:
+        codigo = status.HTTP_207_MULTI_STATUS
+    else:
+        codigo = status.HTTP_404_NOT_FOUND
+    
+    return Response({
+        "actualizados": len(cambiados),
+        "sin_cambios": len(encontrados) - len(cambiados),
+        "no_encontrados": len(ids) - len(encontrados),
+        "resultados": resultados
+    }, status=codigo)
+
 # Nueva vista para obtener las actividades recientes del usuario actual
 class ActividadUsuarioPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class ActividadUsuarioCursorPagination(BasePagination):
+    """
+    Paginación por cursor (keyset) sobre (fecha_hora, id), de la actividad más
+    reciente a la más antigua. Cada página filtra a partir de la última fila de
+    la anterior en lugar de usar OFFSET, y el total (COUNT) solo se calcula si
+    se pide con ?contar=true, así el costo no crece con la profundidad.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        
+        if request.query_params.get('contar') in ('1', 'true'):
+            self.count = queryset.count()
+        
+        queryset = queryset.order_by('-fecha_hora', '-id')
+        cursor = self.decode_cursor(request)
+        if cursor:
+            fecha_hora, pk = cursor
+            queryset = queryset.filter(
+                models.Q(fecha_hora__lt=fecha_hora) |
+                models.Q(fecha_hora=fecha_hora, id__lt=pk)
+            )
+        
+        # Se lee una fila de más para saber si existe una página siguiente
+        resultados = list(queryset[:self.page_size + 1])
+        self.ultima = resultados[self.page_size - 1] if len(resultados) > self.page_size else None
+        return resultados[:self.page_size]
+    
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+    
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            fecha_hora, pk = b64decode(cursor.encode('ascii'), altchars=b'-_').decode('ascii').split('|')
+            fecha_hora = parse_datetime(fecha_hora)
+            if fecha_hora is None:
+                raise ValueError
+            return fecha_hora, int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound("Cursor inválido")
+    
+    def encode_cursor(self, actividad):
+        cursor = f'{actividad.fecha_hora.isoformat()}|{actividad.pk}'
+        cursor = b64encode(cursor.encode('ascii'), altchars=b'-_').decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+    
+    def get_paginated_response(self, data):
+        respuesta = {
+            'next': self.encode_cursor(self.ultima) if self.ultima else None,
+            'results': data,
+        }
+        if self.count is not None:
+            respuesta = {'count': self.count, **respuesta}
+        return Response(respuesta)
+
 class ActividadesUsuarioView(generics.ListAPIView):
     """
     Lista las actividades recientes del usuario autenticado.
@@ -235,11 +813,13 @@ class ActividadesUsuarioView(generics.ListAPIView):
             # Si es usuario normal, solo mostrar las propias
             queryset = ActividadUsuario.objects.filter(usuario=user).order_by('-fecha_hora')
         
+        # El serializador lee datos del usuario, su perfil y el paciente en cada fila
+        queryset = queryset.select_related('usuario__perfil', 'paciente')
+        
         # Aplicar filtros según los parámetros de la solicitud
         tipo_actividad = self.request.query_params.get('tipo_actividad')
         metodo_busqueda = self.request.query_params.get('metodo_busqueda')
-        fecha_desde = self.request.query_params.get('fecha_desde')
-        fecha_hasta = self.request.query_params.get('fecha_hasta')
+        desde, hasta = self._rango_fechas()
         search = self.request.query_params.get('search')
         
         if tipo_actividad:
@@ -248,23 +828,123 @@ class ActividadesUsuarioView(generics.ListAPIView):
         if metodo_busqueda:
             queryset = queryset.filter(metodo_busqueda=metodo_busqueda)
         
-        if fecha_desde:
-            queryset = queryset.filter(fecha_hora__date__gte=fecha_desde)
+        # Se compara contra rangos de fecha y hora (no fecha_hora__date)
+        # para que la consulta pueda usar los índices sobre fecha_hora
+        if desde:
+            queryset = queryset.filter(fecha_hora__gte=desde)
         
-        if fecha_hasta:
-            queryset = queryset.filter(fecha_hora__date__lte=fecha_hasta)
+        if hasta:
+            queryset = queryset.filter(fecha_hora__lt=hasta)
         
         if search:
-            # Búsqueda en campos relevantes del paciente o usuario
+            # Búsqueda en el índice de términos del paciente o del usuario: cada
+            # palabra debe ser el comienzo de algún término, sin importar tildes
+            pacientes = ids_coincidentes(TerminoBusqueda.TIPO_PACIENTE, search)
+            if pacientes is None:
+                # Sin palabras (solo signos, como "-" o "/") no hay términos
+                # que buscar: se compara el texto tal cual, como antes del índice
+                return queryset.filter(
+                    models.Q(paciente__id_paciente__icontains=search) |
+                    models.Q(paciente__nombre_madre__icontains=search) |
+                    models.Q(paciente__documento_madre__icontains=search) |
+                    models.Q(usuario__username__icontains=search)
+                )
             queryset = queryset.filter(
-                models.Q(paciente__id_paciente__icontains=search) |
-                models.Q(paciente__nombre_madre__icontains=search) |
-                models.Q(paciente__documento_madre__icontains=search) |
-                models.Q(usuario__username__icontains=search)
+                models.Q(paciente_id__in=pacientes) |
+                models.Q(usuario_id__in=ids_coincidentes(TerminoBusqueda.TIPO_USUARIO, search))
             )
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """
+        Si el rango de fechas alcanza actividades archivadas, se devuelven
+        después de las de la tabla activa, que siempre son más recientes.
+        """
+        archivadas = self.get_actividades_archivadas()
+        if archivadas is None:
+            return super().list(request, *args, **kwargs)
+        
+        historial = HistorialCombinado(
+            self.filter_queryset(self.get_queryset()),
+            archivadas,
+            lambda actividades: self.get_serializer(actividades, many=True).data
+        )
+        return self.get_paginated_response(self.paginate_queryset(historial))
+    
+    def get_actividades_archivadas(self):
+        """
+        Devuelve las actividades archivadas que cumplen los filtros, o None si
+        no se pidió un rango de fechas que llegue al archivo.
+        """
+        desde, hasta = self._rango_fechas()
+        if not desde or self.request.query_params.get('paginacion') == 'cursor':
+            return None
+        
+        user = self.request.user
+        tipo_actividad = self.request.query_params.get('tipo_actividad')
+        metodo_busqueda = self.request.query_params.get('metodo_busqueda')
+        search = self.request.query_params.get('search') or ''
+        palabras = terminos(search)
+        
+        def cumple(fila):
+            if not (user.is_superuser or user.is_staff) and fila['usuario'] != user.pk:
+                return False
+            if tipo_actividad and fila['tipo_actividad'] != tipo_actividad:
+                return False
+            if metodo_busqueda and fila['metodo_busqueda'] != metodo_busqueda:
+                return False
+            if palabras:
+                # Mismo criterio que el índice: todas las palabras en el paciente o todas en el usuario
+                paciente = terminos_indice(fila['paciente_id'], fila['nombre_madre'], fila['documento_madre'])
+                usuario = terminos_indice(fila['username'])
+                return any(
+                    all(any(termino.startswith(palabra) for termino in objeto) for palabra in palabras)
+                    for objeto in (paciente, usuario)
+                )
+            if search:
+                campos = (fila['paciente_id'], fila['nombre_madre'], fila['documento_madre'], fila['username'])
+                return any(search.lower() in (campo or '').lower() for campo in campos)
+            return True
+        
+        # Sin filtros el catálogo alcanza para contar los meses completos
+        filtrar = not (user.is_superuser or user.is_staff) or tipo_actividad or metodo_busqueda or search
+        archivadas = ArchivoPaginable(desde, hasta, cumple if filtrar else None)
+        return archivadas if archivadas.segmentos else None
+    
+    @property
+    def paginator(self):
+        """
+        Usa paginación por cursor cuando se pide con ?paginacion=cursor.
+        """
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('paginacion') == 'cursor':
+                self._paginator = ActividadUsuarioCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+    
+    def _rango_fechas(self):
+        """
+        Convierte fecha_desde y fecha_hasta en un rango [desde, hasta) de
+        fecha y hora. Se filtra por rango (no por fecha_hora__date) para
+        que la consulta pueda usar los índices sobre fecha_hora.
+        """
+        fecha_desde = self.request.query_params.get('fecha_desde')
+        fecha_hasta = self.request.query_params.get('fecha_hasta')
+        desde = self._inicio_del_dia(fecha_desde, 'fecha_desde') if fecha_desde else None
+        hasta = self._inicio_del_dia(fecha_hasta, 'fecha_hasta') + timedelta(days=1) if fecha_hasta else None
+        return desde, hasta
+    
+    def _inicio_del_dia(self, valor, parametro):
+        try:
+            fecha = parse_date(valor)
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            raise ValidationError({parametro: "Formato de fecha inválido, use YYYY-MM-DD"})
+        return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+    
     def get_serializer_context(self):
         """
         Agregar información adicional al contexto del serializador
@@ -272,4 +952,47 @@ class ActividadesUsuarioView(generics.ListAPIView):
         """
         context = super().get_serializer_context()
         context['is_admin'] = self.request.user.is_superuser or self.request.user.is_staff
-        return context
\ No newline at end of file
+        return context
+
+# Exportación de datos
+
+class ExportarPacientesView(generics.GenericAPIView):
+    """
+    Descarga todos los pacientes en CSV (por defecto) o NDJSON
+    (?formato=ndjson), fila por fila. Acepta ?dado_alta=True|False.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = PacienteSerializer
+    
+    def get(self, request, *args, **kwargs):
+        formato = formato_solicitado(request)
+        queryset = Paciente.objects.order_by('id')
+        dado_alta = request.query_params.get('dado_alta')
+        if dado_alta:
+            queryset = queryset.filter(dado_alta=dado_alta)
+        
+        serializer = self.get_serializer()
+        return respuesta_exportacion(
+            'pacientes', formato, list(serializer.fields), serializar_iterando(queryset, serializer)
+        )
+
+class ExportarActividadesView(ActividadesUsuarioView):
+    """
+    Descarga el historial de actividades en CSV (por defecto) o NDJSON
+    (?formato=ndjson), con los mismos filtros y permisos que
+    ActividadesUsuarioView pero sin paginar.
+    """
+    pagination_class = None
+    
+    def list(self, request, *args, **kwargs):
+        formato = formato_solicitado(request)
+        serializer = self.get_serializer()
+        filas = serializar_iterando(self.filter_queryset(self.get_queryset()), serializer)
+        
+        def archivadas():
+            # Se leen al terminar las activas, para no retrasar el primer byte
+            yield from self.get_actividades_archivadas() or ()
+        
+        return respuesta_exportacion(
+            'actividades', formato, list(serializer.fields), itertools.chain(filas, archivadas())
+        )
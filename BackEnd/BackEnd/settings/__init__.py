@@ -0,0 +1,10 @@
+"""
+Configuración por perfiles, elegida con DJANGO_SETTINGS_MODULE:
+
+- BackEnd.settings.dev: desarrollo (manage.py por defecto).
+- BackEnd.settings.prod: workers de producción (wsgi.py y asgi.py por defecto).
+
+Ambos parten de base.py. BackEnd.settings equivale a dev, como antes de
+dividir la configuración.
+"""
+from .dev import *  # noqa: F401,F403
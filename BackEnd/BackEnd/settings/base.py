@@ -0,0 +1,355 @@
+"""
+Django settings for BackEnd project: configuración común a todos los
+perfiles (ver dev.py y prod.py).
+
+Generated by 'django-admin startproject' using Django 5.1.4.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.1/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.1/ref/settings/
+"""
+
+import os
+from pathlib import Path
+
+from corsheaders.defaults import default_headers
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'django-insecure-29r-acl*w=)ki=^i^)=5gdihp!@t#nk_g3yv+!v(yl9=@+#&_u'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+# dev.py lo activa
+DEBUG = False
+
+ALLOWED_HOSTS = ['192.168.1.22']
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'Api',
+    'rest_framework',
+    'rest_framework.authtoken',
+    'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
+    'djoser',
+    'django_filters',
+    'corsheaders',
+]
+
+MIDDLEWARE = [
+    # Primero, para medir las solicitudes completas (ver Api/metricas.py)
+    'Api.metricas.MetricasMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'Api.enrutamiento.LecturasReplicaMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Después de AuthenticationMiddleware: necesita el usuario de la sesión
+    'Api.perfilado.PerfiladoMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'BackEnd.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'BackEnd.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        # Conexiones persistentes: cada hilo reutiliza la suya durante 10 minutos
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Segundos que una escritura espera a que se libere el bloqueo
+            'timeout': 20,
+            # En WAL las lecturas no bloquean a las escrituras ni al revés
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+            # Las transacciones toman el bloqueo de escritura al empezar, así
+            # esperan su turno en lugar de fallar con "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# Réplica de solo lectura opcional para las solicitudes GET (ver
+# Api/enrutamiento.py). Se activa definiendo BD_REPLICA_NAME: la ruta de
+# otro archivo SQLite (copiado con python manage.py sincronizar_replica) o,
+# con BD_REPLICA_ENGINE=django.db.backends.postgresql, el nombre de la base
+# de datos en el servidor réplica.
+BD_REPLICA_ALIAS = 'replica'
+if os.environ.get('BD_REPLICA_NAME'):
+    DATABASES[BD_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'ENGINE': os.environ.get('BD_REPLICA_ENGINE', DATABASES['default']['ENGINE']),
+        'NAME': os.environ['BD_REPLICA_NAME'],
+        'HOST': os.environ.get('BD_REPLICA_HOST', ''),
+        'PORT': os.environ.get('BD_REPLICA_PORT', ''),
+        'USER': os.environ.get('BD_REPLICA_USER', ''),
+        'PASSWORD': os.environ.get('BD_REPLICA_PASSWORD', ''),
+        # En las pruebas y benchmarks la réplica es la misma base temporal
+        'TEST': {'MIRROR': 'default'},
+    }
+    if DATABASES[BD_REPLICA_ALIAS]['ENGINE'] != 'django.db.backends.sqlite3':
+        DATABASES[BD_REPLICA_ALIAS]['OPTIONS'] = {}
+
+DATABASE_ROUTERS = ['Api.enrutamiento.EnrutadorLecturas']
+
+# Segundos que un cliente lee de la base principal después de escribir, para
+# que vea sus propios cambios aunque la réplica vaya retrasada
+BD_PRIMARIA_TRAS_ESCRITURA = 5
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.1/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.1/howto/static-files/
+
+STATIC_URL = 'static/'
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Asignación de IDs de paciente
+# Cantidad de números que cada proceso reserva de una sola vez en la secuencia.
+# Con 1 los IDs son consecutivos; valores mayores evitan una escritura por
+# registro a cambio de dejar huecos cuando un proceso termina sin usar su bloque.
+ID_PACIENTE_BLOQUE = 1
+
+# Máximo de pacientes aceptados por el registro en lote (pacientes/lote/)
+LOTE_PACIENTES_MAX = 200
+
+# Máximo de pacientes aceptados por el alta en lote (pacientes/alta/lote/)
+ALTA_LOTE_MAX = 200
+
+# Registro de actividades de búsqueda
+# 'diferido' las acumula en memoria al confirmarse cada solicitud y las
+# inserta en bloque desde un hilo en segundo plano; lo pendiente se escribe
+# al apagar el worker. Solo si el proceso muere de golpe (SIGKILL, falta de
+# memoria) se pierden hasta ACTIVIDADES_BUFFER_TAMANO actividades o
+# ACTIVIDADES_BUFFER_INTERVALO segundos del historial de auditoría.
+# 'sincrono' las inserta dentro de cada solicitud.
+ACTIVIDADES_MODO = 'diferido'
+# Cantidad de actividades pendientes que dispara una escritura inmediata
+ACTIVIDADES_BUFFER_TAMANO = 50
+# Segundos máximos que una actividad puede esperar en memoria
+ACTIVIDADES_BUFFER_INTERVALO = 2.0
+
+# Cachés compartidas por todos los workers del servidor, en un archivo
+# SQLite en modo WAL (ver Api/cache_sqlite.py); no requieren Redis ni
+# Memcached. Cada alias usa su propia tabla del mismo archivo
+CACHE_COMPARTIDA_ARCHIVO = BASE_DIR / 'cache_compartida.sqlite3'
+CACHES = {
+    # Límites de solicitudes y uso general
+    'default': {
+        'BACKEND': 'Api.cache_sqlite.CacheSQLite',
+        'LOCATION': CACHE_COMPARTIDA_ARCHIVO,
+        'OPTIONS': {'TABLA': 'general', 'MAX_ENTRIES': 100000},
+    },
+    'qr': {
+        'BACKEND': 'Api.cache_sqlite.CacheSQLite',
+        'LOCATION': CACHE_COMPARTIDA_ARCHIVO,
+        'OPTIONS': {'TABLA': 'qr', 'MAX_ENTRIES': 40000},
+    },
+    'usuarios': {
+        'BACKEND': 'Api.cache_sqlite.CacheSQLite',
+        'LOCATION': CACHE_COMPARTIDA_ARCHIVO,
+        'OPTIONS': {'TABLA': 'usuarios', 'MAX_ENTRIES': 20000},
+    },
+    'metricas': {
+        'BACKEND': 'Api.cache_sqlite.CacheSQLite',
+        'LOCATION': CACHE_COMPARTIDA_ARCHIVO,
+        # Una ranura por worker vivo más el registro y el acumulado: el límite
+        # solo evita que la limpieza descarte entradas sin vencimiento
+        'OPTIONS': {'TABLA': 'metricas', 'MAX_ENTRIES': 100000},
+    },
+}
+
+# Caché de búsqueda por código QR
+QR_CACHE_ALIAS = 'qr'
+# Segundos que se reutiliza una entrada; acota cuánto tarda en verse un
+# cambio hecho sin pasar por los modelos
+QR_CACHE_TTL = 30
+QR_CACHE_TTL_NEGATIVO = 15
+
+# Caché del usuario autenticado (con su perfil) por token o ID de usuario.
+# Se invalida al guardar el usuario o el perfil y al cerrar sesión
+AUTENTICACION_CACHE_ALIAS = 'usuarios'
+AUTENTICACION_CACHE_TTL = 30
+
+# Métricas de la API (Api/metricas.py): cabecera Server-Timing en cada
+# respuesta de /api/ y totales por ruta en /api/metrics/ para Prometheus
+METRICAS_SERVER_TIMING = True
+METRICAS_CACHE_ALIAS = 'metricas'
+# Segundos entre copias de los totales de cada worker a la caché compartida
+METRICAS_VOLCADO = 5
+# Segundos sin volcar tras los que se da por terminado a un worker: su ranura
+# se elimina y sus totales pasan al acumulado de los workers retirados
+METRICAS_LATIDO = 300
+# Prometheus se identifica con la cabecera "Authorization: Metricas <token>";
+# sin token solo los administradores ven las métricas
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+# Perfilado bajo demanda (Api/perfilado.py): la solicitud de un usuario
+# is_staff con la cabecera X-Perfilar o ?perfilar=1 se ejecuta con cProfile
+# y su informe se descarga desde el admin. Se conservan los más recientes
+PERFILADO_MAXIMO_INFORMES = 200
+# Funciones listadas en el informe, por tiempo acumulado y por tiempo propio
+PERFILADO_FUNCIONES = 40
+
+# Máximo de códigos aceptados por la búsqueda en lote (pacientes/qr/buscar-lote/)
+QR_LOTE_MAX = 100
+
+# Listado de pacientes (GET pacientes/) leído como tuplas en lugar de pasar
+# cada fila por PacienteListSerializer; la respuesta es la misma
+PACIENTES_LISTADO_RAPIDO = True
+
+# Resultados de la búsqueda de pacientes (pacientes/buscar/): por defecto y máximo
+PACIENTES_BUSQUEDA_LIMITE = 10
+PACIENTES_BUSQUEDA_MAX = 50
+
+# Retención del historial de actividades
+# Las actividades más antiguas que este número de días se mueven al archivo
+# comprimido con: python manage.py archivar_actividades
+ACTIVIDADES_RETENCION_DIAS = 365
+ACTIVIDADES_ARCHIVO_DIR = BASE_DIR / 'archivo_actividades'
+# Segmentos mensuales que cada proceso conserva descomprimidos para paginar
+# el historial archivado sin volver a leerlos
+ACTIVIDADES_ARCHIVO_CACHE_SEGMENTOS = 12
+
+# CORS configuration
+CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOWED_ORIGINS = [
+    "https://192.168.1.22:3000"
+]
+CORS_ALLOW_CREDENTIALS = True
+# Solicitudes condicionales de pacientes: el frontend lee el ETag y lo
+# reenvía en If-None-Match / If-Match
+CORS_EXPOSE_HEADERS = ['ETag', 'X-Perfil-Id']
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match', 'if-match', 'x-perfilar')
+
+REST_FRAMEWORK = {
+    # XML, CSV y YAML se importan la primera vez que una respuesta los usa
+    # (ver Api/renderizadores.py); dev.py añade la API navegable
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'Api.renderizadores.XMLDiferido',
+        'Api.renderizadores.CSVDiferido',
+        'Api.renderizadores.YAMLDiferido',
+    ],
+
+    'DEFAULT_FILTER_BACKENDS': [
+        'django_filters.rest_framework.DjangoFilterBackend',
+        'rest_framework.filters.OrderingFilter',
+        'rest_framework.filters.SearchFilter',
+    ],
+
+    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination', 'PAGE_SIZE': 3,
+
+    # Para autenticación y autorización de usuarios. Las clases de Api
+    # guardan en caché el usuario autenticado (ver AUTENTICACION_CACHE_TTL)
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'Api.autenticacion.JWTAuthenticationCache',
+        'Api.autenticacion.TokenAuthenticationCache',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+
+    # To implement throttling. Cuentan con incrementos atómicos en la caché
+    # compartida, así que el límite es el mismo para todos los workers
+    'DEFAULT_THROTTLE_CLASSES': [
+        'Api.limites.AnonimoRateThrottle',
+        'Api.limites.UsuarioRateThrottle',
+    ],
+
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': '10000/day',
+        'user': '10000/day',
+        'ten': '10/minute',
+    }
+}
+
+DJOSER = {
+    'USER_ID_FIELD': 'username',
+    'SERIALIZERS': {
+        'user_create': 'Api.serializers.RegistroUsuarioSerializer',
+        'user': 'Api.serializers.UserSerializer',
+        'current_user': 'Api.serializers.UserSerializer',
+    },
+    'LOGIN_FIELD': 'username',
+}
+
+from datetime import timedelta
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes = 5),    
+}
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+Perfil de desarrollo: DEBUG, debug_toolbar, django_extensions
+(runserver_plus con HTTPS) y la API navegable de DRF.
+"""
+from .base import *  # noqa: F401,F403
+
+DEBUG = True
+
+# Listas nuevas en lugar de modificar las de base, que prod también usa
+INSTALLED_APPS = [
+    *INSTALLED_APPS,
+    'debug_toolbar',
+    'django_extensions',
+]
+
+MIDDLEWARE = [
+    *MIDDLEWARE,
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'][1:],
+    ],
+}
@@ -0,0 +1,22 @@
+"""
+Perfil de producción para los workers WSGI/ASGI: sin DEBUG ni las apps de
+desarrollo, para que cada worker arranque y responda su primera solicitud
+antes (ver python manage.py benchmark_arranque).
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+
+DEBUG = False
+
+# La clave de base.py está publicada en el repositorio: en producción es
+# obligatorio definir la propia
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Defina DJANGO_SECRET_KEY para usar BackEnd.settings.prod')
+
+# La variable de entorno tiene prioridad sobre el valor de base
+if os.environ.get('DJANGO_ALLOWED_HOSTS'):
+    ALLOWED_HOSTS = os.environ['DJANGO_ALLOWED_HOSTS'].split(',')
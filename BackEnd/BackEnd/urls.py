@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('__debug__', include('debug_toolbar.urls')),
     path('api/', include('Api.urls')),
 ]
+
+# Solo en el perfil de desarrollo (BackEnd/settings/dev.py)
+if 'debug_toolbar' in settings.INSTALLED_APPS:
+    urlpatterns.append(path('__debug__', include('debug_toolbar.urls')))